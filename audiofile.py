@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reading and writing of recordings for the wireless communication system
+project in Signals and Transforms.
+
+* Recordings are read through `numpy.memmap`, so that captures of any length
+  can be decoded block by block without loading them into memory: only the
+  pages of the blocks being processed are read from disk.
+* Signals are written with `numpy.ndarray.tofile()`, directly from the
+  array's memory if it already has the file's sample format (e.g., float32
+  WAV files or raw float64 files), and in bounded chunks otherwise.
+
+Supported are headerless (raw) single-channel files of any numpy dtype, and
+WAV files with 8, 16, or 32 bit integer or 32 or 64 bit floating-point
+samples.
+"""
+
+import struct
+import numpy as np
+
+# WAV format codes
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample types by format code and sample width in bytes
+_WAV_DTYPES = {
+    (_WAVE_FORMAT_PCM, 1): np.dtype('u1'),
+    (_WAVE_FORMAT_PCM, 2): np.dtype('<i2'),
+    (_WAVE_FORMAT_PCM, 4): np.dtype('<i4'),
+    (_WAVE_FORMAT_IEEE_FLOAT, 4): np.dtype('<f4'),
+    (_WAVE_FORMAT_IEEE_FLOAT, 8): np.dtype('<f8'),
+}
+
+# Number of samples converted at a time when writing
+_CHUNK = 2**20
+
+
+def open_raw(path, dtype='float64'):
+    """
+    Maps a headerless (raw) single-channel recording into memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw file.
+    dtype : numpy.dtype, default 'float64'
+        Sample format of the file.
+
+    Returns
+    -------
+    x : numpy.memmap
+        The (read-only) samples.
+    """
+
+    dtype = np.dtype(dtype)
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        N = f.tell()//dtype.itemsize
+
+    # Empty files cannot be mapped
+    if N == 0:
+        return np.zeros((0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(N,))
+
+
+def open_wav(path):
+    """
+    Maps the samples of a WAV file into memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the WAV file.
+
+    Returns
+    -------
+    x : numpy.memmap
+        The (read-only) samples in the file's format, one channel per
+        column.
+    fs : int
+        Sampling frequency in Hz.
+    """
+
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f'{path} is not a WAV file.')
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(12)
+
+        # Find the format and the data chunks
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f'No data found in {path}.')
+            name, length = struct.unpack('<4sI', header)
+            if name == b'fmt ':
+                chunk = f.read(length)
+                code, Nch, fs, _, _, bits = struct.unpack('<HHIIHH', chunk[:16])
+                if code == _WAVE_FORMAT_EXTENSIBLE and length >= 26:
+                    code = struct.unpack('<H', chunk[24:26])[0]
+                fmt = (code, Nch, fs, bits//8)
+            elif name == b'data':
+                if fmt is None:
+                    raise ValueError(f'The data of {path} precedes its format.')
+                offset = f.tell()
+
+                # Recorders that were interrupted may leave the size unset
+                if length in (0, 0xFFFFFFFF) or offset + length > size:
+                    length = size - offset
+                break
+            else:
+                f.seek(length + length % 2, 1)
+
+    code, Nch, fs, width = fmt
+    if (code, width) not in _WAV_DTYPES:
+        raise ValueError(f'Unsupported sample format {code} with a width of {width} bytes in {path}.')
+    dtype = _WAV_DTYPES[(code, width)]
+    frames = length//(width*Nch)
+    if frames == 0:
+        return np.zeros((0, Nch), dtype=dtype), fs
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, Nch)), fs
+
+
+def to_float(x):
+    """
+    Converts samples read from a WAV file to floating point in [-1, 1) (see
+    `open_wav()`). Floating-point samples are returned as they are, without
+    copying.
+    """
+
+    if x.dtype.kind == 'f':
+        return x
+    if x.dtype == np.uint8:
+        return (x.astype(float) - 128)/128
+    return x.astype(float)/2**(8*x.dtype.itemsize-1)
+
+
+class RawWriter:
+    """
+    Writes a headerless (raw) single-channel recording block by block.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw file (overwritten).
+    dtype : numpy.dtype, default 'float64'
+        Sample format of the file.
+    """
+
+    def __init__(self, path, dtype='float64'):
+        self.dtype = np.dtype(dtype)
+        self._f = open(path, 'wb')
+
+    def write(self, x):
+        """
+        Appends the samples `x` to the file.
+        """
+        for k in range(0, np.size(x), _CHUNK):
+            np.ascontiguousarray(x[k:k+_CHUNK], dtype=self.dtype).tofile(self._f)
+
+    def close(self):
+        """Closes the file."""
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class WavWriter:
+    """
+    Writes a WAV file block by block. The sizes in the header are updated
+    after every block, so that the file is valid even if the recording is
+    interrupted.
+
+    Parameters
+    ----------
+    path : str
+        Path to the WAV file (overwritten).
+    fs : int
+        Sampling frequency in Hz.
+    dtype : numpy.dtype, default 'float32'
+        Sample format, 'float32' or 'float64' (the signal is stored as it
+        is), or 'uint8', 'int16', or 'int32' (the signal is clipped to 
+        [-1, 1) and scaled to the integer range).
+    channels : int, default 1
+        Number of channels; blocks then have one column per channel.
+    """
+
+    def __init__(self, path, fs: int, dtype='float32', channels: int=1):
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.channels = channels
+        formats = {v: k for k, v in _WAV_DTYPES.items()}
+        if self.dtype not in formats:
+            raise ValueError(f'Unsupported sample format {dtype}.')
+        code, width = formats[self.dtype]
+
+        self._f = open(path, 'wb')
+        self._f.write(struct.pack('<4sI4s', b'RIFF', 36, b'WAVE'))
+        self._f.write(struct.pack('<4sIHHIIHH', b'fmt ', 16, code, channels, int(fs), int(fs)*width*channels, width*channels, 8*width))
+        self._f.write(struct.pack('<4sI', b'data', 0))
+        self._length = 0
+
+    def write(self, x):
+        """
+        Appends the samples `x` (one column per channel if there are several
+        channels) to the file.
+        """
+
+        x = np.asarray(x)
+        for k in range(0, x.shape[0], _CHUNK):
+            xk = x[k:k+_CHUNK]
+            if self.dtype.kind in 'iu':
+                scale = 2**(8*self.dtype.itemsize-1)
+                xk = np.clip(np.round(xk*scale), -scale, scale-1) + (scale if self.dtype.kind == 'u' else 0)
+            xk = np.ascontiguousarray(xk, dtype=self.dtype)
+            xk.tofile(self._f)
+            self._length += xk.nbytes
+
+        # Update the sizes in the header
+        position = self._f.tell()
+        self._f.seek(4)
+        self._f.write(struct.pack('<I', 36 + self._length))
+        self._f.seek(40)
+        self._f.write(struct.pack('<I', self._length))
+        self._f.seek(position)
+
+    def close(self):
+        """Closes the file."""
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def write_raw(path, x, dtype='float64'):
+    """
+    Writes the signal `x` to a headerless (raw) file, directly from its
+    memory if it has the sample format `dtype`.
+    """
+
+    with RawWriter(path, dtype) as writer:
+        writer.write(x)
+
+
+def write_wav(path, x, fs: int, dtype='float32'):
+    """
+    Writes the signal `x` (one column per channel for several channels) to
+    a WAV file, directly from its memory if it has the sample format
+    `dtype` (see `WavWriter`).
+    """
+
+    x = np.asarray(x)
+    with WavWriter(path, fs, dtype, 1 if x.ndim == 1 else x.shape[1]) as writer:
+        writer.write(x)
+
+
+def open_writer(path, fs: int):
+    """
+    Returns a `WavWriter` (float32) if `path` ends with .wav, and a
+    `RawWriter` (float64) otherwise.
+    """
+
+    if str(path).endswith('.wav'):
+        return WavWriter(path, fs)
+    return RawWriter(path)
+
+
+def write_signal(path, x, fs: int):
+    """
+    Writes the signal `x` to a float32 WAV file if `path` ends with .wav,
+    and to a raw float64 file otherwise (the formats read by reciever.py).
+    """
+
+    with open_writer(path, fs) as writer:
+        writer.write(x)
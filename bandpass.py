@@ -1,16 +1,21 @@
-from scipy.signal import cheby1
+from filtercache import filters
 
-# Function to create a Chebyshev Type I bandpass filter of order 6.
+# Function to create a Chebyshev Type I (or elliptic) bandpass filter.
 # Great roll-off and infinite attenuation helps to not disturb other channels.
+# If the stopband edges are given, the filter has the lowest order that keeps
+# the ripple in the passband below R_p and attenuates the stopband by at least
+# R_s (see `channels.ChannelPlan`); otherwise it has order 6.
+# The designed filters are cached, so repeated calls with the same
+# specifications are cheap (and return the same array, which must not be modified).
 
-def create_bandpass_filter(fs, f_low, f_high, R_p, R_s):
+def create_bandpass_filter(fs, f_low, f_high, R_p, R_s, f_stop_low=None, f_stop_high=None, ftype='cheby1'):
 
-    # Normalize frequencies by Nyquist frequency
-    nyquist = fs / 2
-    W_p = [f_low / nyquist, f_high / nyquist]
+    # Find the minimum order that meets the specifications
+    order = 6
+    if f_stop_low is not None and f_stop_high is not None:
+        order = filters.order(ftype, fs, (f_low, f_high), (f_stop_low, f_stop_high), R_p, R_s)
 
     # Design the filter using second-order sections for performance and stability improvements
-    sos = cheby1(N=6, rp=R_p, Wn=W_p, btype='bandpass', output='sos')
+    # (frequencies are normalized by the Nyquist frequency in the cache)
+    sos = filters.get('bandpass', fs, (f_low, f_high), order, R_p, R_s, ftype)
     return sos
-
-
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch simulation of the wireless communication system project in Signals and
+Transforms, for estimating bit and frame error rates.
+
+Instead of running one message at a time through the chain of simulation.py,
+`Ntrials` independent random messages are pushed through encoding,
+modulation, bandpass filtering, the channel, IQ demodulation, lowpass
+filtering, and decoding at once, as 2-D (trials x samples) arrays.
+
+To print the bit/frame error rates for a grid of parameters, run e.g.:
+$ python3 batchsim.py --trials 200 --snr 10 20 --dmax 5 --tb 0.02 0.04
+
+Add --workers 0 to spread the trials over all CPUs, and --seed to reproduce
+a run (the results for a seed do not depend on the number of workers). Add
+--profile to print the time spent in every stage of the chain (simulated in
+the calling process, i.e., with one worker). A harsher channel is simulated
+with e.g. --taps 3 --spread 0.005 --interferers 3 --noise-color 1 --cfo 1,
+and the receiver's timing and carrier tracking is enabled with --track.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import itertools
+import sys
+import numpy as np
+from scipy import signal
+from scipy.signal import sosfilt, upfirdn
+import wcslib as wcs
+from channels import channel_plan
+from filtercache import local_oscillator
+import instrument
+
+
+@instrument.traced('decode_baseband_batch')
+def decode_baseband_batch(yb, Tb: float, fs: float, Nbits: int, dof=None, sync=(1, 0), constellation=wcs.BPSK, pulse=wcs.RECT, track: bool=False, confidence: float=wcs.DETECTION_CONFIDENCE, noise_floor: bool=False):
+    """
+    Batch version of `wcslib.decode_baseband_iq()` for messages of known
+    length. Each row of `yb` is decoded independently, following the same 
+    steps (detection, synchronization, and bit recovery).
+
+    Since the rows would otherwise decode to different numbers of bits,
+    exactly `Nbits` symbol instants are evaluated after the synchronization
+    sequence. Bits at instants where no signal is detected (or beyond the end
+    of the signal) are marked as invalid instead of being removed.
+
+    Parameters
+    ----------
+    yb : numpy.array
+        The IQ-demodulated baseband signals I + jQ, one per row.
+    Tb : float
+        Pulse width in seconds.
+    fs : float
+        Sampling frequency in Hz.
+    Nbits : int
+        Number of bits per message.
+    dof : int, optional
+        Degrees of freedom of the chi-squared detection test, `2*Kb` if not
+        given. When decoding a decimated signal, pass `2*Kb` at the original 
+        sampling frequency: the average power over a symbol is then compared
+        to the same threshold as without decimation. Not used with 
+        `noise_floor`, where they are estimated.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits, as given to `wcslib.encode_baseband_signal()`.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        The modulation, as given to `wcslib.encode_baseband_signal()`.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        The pulse shape, as given to `wcslib.encode_baseband_signal()`.
+    track : bool, default False
+        Track the symbol timing and the carrier phase (see 
+        `wcslib.decode_baseband_iq()`), for all rows at once.
+    confidence : float, default wcslib.DETECTION_CONFIDENCE
+        Confidence of the detection test.
+    noise_floor : bool, default False
+        Detect the transmissions relative to the noise floor of every row 
+        (see `wcslib.decode_baseband_iq()`).
+
+    Returns
+    -------
+    b : numpy.array
+        The decoded bits, one message per row.
+    valid : numpy.array
+        True for the bits that were decoded while a signal was detected.
+    """
+
+    Ntrials, N = yb.shape
+    rows = np.arange(Ntrials)[:, np.newaxis]
+
+    # 1. Signal detection (chi2.cdf(x, dof) > confidence is the same as 
+    # comparing x to the quantile, which is computed once), with the sum over
+    # one symbol scaled to dof/2 samples. Or relative to the noise floor of 
+    # every row.
+    Kb = int(np.floor(Tb*fs))
+    xm = np.abs(yb)
+    xm2 = wcs._moving_sum(xm**2, Kb)
+    s = wcs._sync_symbols(sync)
+    Nsync = s.shape[0]
+    if noise_floor:
+        d, m = wcs._detect_noise_floor(xm2, Kb, Nsync, pulse)
+    else:
+        if dof is None:
+            dof = 2*Kb
+        xm_var = np.var(xm, axis=-1, keepdims=True)
+        d = xm2*dof/(2*Kb)/xm_var > wcs._chi2_quantiles(dof, confidence)[-1]
+        m = np.argmax(d, axis=-1)
+
+    # 2. Synchronization, searching for the peak of the matched filter before
+    # m+Nsync*Kb in every row (only filtering up to the latest of these)
+    M = min(N, np.max(m) + Nsync*Kb)
+    xx = pulse.average(wcs._iq_components(yb, xm, constellation, pulse), Kb)
+    if pulse.rect:
+        xd = wcs._phase_sign(yb[:, :M])*d[:, :M]
+        xs = abs(signal.oaconvolve(xd, wcs._sync_response(sync, Kb)[np.newaxis, :], axes=-1)[:, :M])
+    else:
+        xs = wcs._sync_correlation(xx[:, :, :M], s, Kb)
+    xs[np.arange(M) >= (m + Nsync*Kb)[:, np.newaxis]] = -1
+    k0 = np.argmax(xs, axis=-1)
+    ks = k0[:, np.newaxis] - Kb*np.arange(Nsync-1, -1, -1)
+    b1 = xx[:, rows, ks]@s/Nsync
+
+    # 3. Recover the bits at the symbol instants following k0 (Nbits bits,
+    # bits_per_symbol per symbol)
+    bps = constellation.bits_per_symbol
+    k = k0[:, np.newaxis] + Kb*np.arange(1, -(-Nbits//bps)+1)
+    valid = k < N
+    k = np.minimum(k, N-1)
+    if not constellation.constant_modulus:
+        d = wcs._symbols_detected(constellation, b1, xx)
+    else:
+        if not pulse.rect:
+            d = wcs._dilate(d, pulse.delay(Kb))
+        d = d & (xm2 > np.mean(xm2[rows, ks], axis=-1, keepdims=True)/4)
+    if track:
+        return _decode_tracked_batch(xx, d, k0, b1, Kb, Nbits, constellation)
+    valid &= d[rows, k]
+    if constellation is wcs.BPSK:
+        b = np.einsum('it,itk->tk', b1, xx[:, rows, k]) > 0
+    else:
+        b = wcs._decide(constellation, b1, xx[:, rows, k])[:, :Nbits]
+        valid = np.repeat(valid, bps, axis=-1)[:, :Nbits]
+
+    return b, valid
+
+
+def _decode_tracked_batch(xx, d, k0, b1, Kb: int, Nbits: int, constellation):
+    """
+    Decides the `Nbits` bits following the synchronization sequence of every
+    row with symbol-timing and carrier-phase tracking (see 
+    `wcslib._Tracker`), `wcslib._TRACK_BLOCK` symbols at a time, each block
+    vectorized over the rows.
+    """
+
+    Ntrials, N = d.shape
+    rows = np.arange(Ntrials)[:, np.newaxis]
+    z = xx[0] + 1j*xx[1]
+    tracker = wcs._Tracker(constellation, b1, Kb)
+    Nsymbols = -(-Nbits//constellation.bits_per_symbol)
+    b = []
+    valid = []
+    k = k0 + Kb
+    for n in range(0, Nsymbols, wcs._TRACK_BLOCK):
+        ks = k[:, np.newaxis] + Kb*np.arange(min(wcs._TRACK_BLOCK, Nsymbols - n))
+        v = (ks < N) & (ks >= Kb)
+        ks = np.clip(ks, Kb, N-1)
+        v &= d[rows, ks]
+        bk, shift = tracker.step(z[rows, ks], z[rows, ks - Kb//2], z[rows, ks - Kb], v)
+        b.append(bk)
+        valid.append(np.repeat(v, constellation.bits_per_symbol, axis=-1))
+        k = ks[:, -1] + Kb + shift
+
+    return np.concatenate(b, axis=-1)[:, :Nbits], np.concatenate(valid, axis=-1)[:, :Nbits]
+
+
+def simulate_batch(b, Tb: float, plan, SNR: float=20.0, dmax: float=5.0, rng=None, decimation: int=1, sync=(1, 0), constellation=wcs.BPSK, pulse=wcs.RECT, impairments=None, track: bool=False, noise_floor: bool=False):
+    """
+    Simulates the transmission of a batch of messages through the whole
+    chain of simulation.py.
+
+    Parameters
+    ----------
+    b : numpy.array
+        The transmitted bits, one message per row.
+    Tb : float
+        Symbol duration in seconds.
+    plan : channels.ChannelPlan
+        The channel, with its sampling frequency, carrier, and filters.
+    SNR : float, default 20.0
+        The signal-to-noise ratio at the transmitter (in dBm).
+    dmax : float, default 5.0
+        The maximum transmission distance.
+    rng : numpy.random.Generator, optional
+        The random number generator used by the channel.
+    decimation : int, default 1
+        If larger than 1, the IQ-demodulated signal is lowpass filtered and 
+        decimated by this factor with the FIR filter of 
+        `lowpass.create_decimation_filter()` (instead of `sos_lp`), and 
+        decoded at the sampling frequency `fs/decimation`.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits prepended to every message.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        The modulation of the messages.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        The pulse shape of the messages.
+    impairments : dict, optional
+        Further impairments of the channel (multipath, interferers, noise
+        color, carrier-frequency offset), as keyword arguments of
+        `wcslib.simulate_channel_batch()`.
+    track : bool, default False
+        Track the symbol timing and the carrier phase in the receiver (see
+        `decode_baseband_batch()`).
+    noise_floor : bool, default False
+        Detect the messages relative to the noise floor in the receiver (see
+        `decode_baseband_batch()`).
+
+    Returns
+    -------
+    b_hat : numpy.array
+        The decoded bits, one message per row.
+    valid : numpy.array
+        True for the bits that were decoded while a signal was detected.
+    """
+
+    # Encode, modulate, and bandpass filter all messages at once
+    fs = plan.fs
+    sos_bp = plan.bandpass
+    lo = local_oscillator(fs, plan.fc)
+    xb = wcs.encode_baseband_signal(b, Tb, fs, sync, constellation, pulse)
+    with instrument.stage('modulate', xb) as st:
+        xm = st.output(lo.modulate(xb))
+    with instrument.stage('bandpass_tx', xm) as st:
+        filtered_signal = st.output(sosfilt(sos_bp, xm, axis=-1))
+
+    # Channel simulation
+    yr = wcs.simulate_channel_batch(filtered_signal, fs, plan.channel_id, SNR=SNR, dmax=dmax, rng=rng, **(impairments or {}))
+
+    # Bandpass filter and IQ demodulation
+    with instrument.stage('bandpass_rx', yr) as st:
+        filtered_signal = st.output(sosfilt(sos_bp, yr, axis=-1))
+    N = filtered_signal.shape[-1]
+    if decimation > 1:
+        # Polyphase lowpass filtering and decimation of I + jQ
+        h = plan.decimation_filter(decimation)
+        with instrument.stage('iq_mix', filtered_signal) as st:
+            yb = st.output(filtered_signal * (lo.cos(N) - 1j * lo.sin(N)))
+        with instrument.stage('decimate', yb) as st:
+            yb_filtered = st.output(upfirdn(h, yb, down=decimation, axis=-1))
+        dof = 2*int(np.floor(Tb*fs))
+        fs = fs / decimation
+    else:
+        # Lowpass filtering of I and Q
+        with instrument.stage('iq_mix', filtered_signal) as st:
+            iq = st.output(np.stack((
+                filtered_signal * lo.cos(N),
+                -1 * filtered_signal * lo.sin(N)
+            )))
+        with instrument.stage('lowpass', iq) as st:
+            iq = st.output(sosfilt(plan.lowpass, iq, axis=-1))
+        yb_filtered = iq[0] + 1j * iq[1]
+        dof = None
+
+    return decode_baseband_batch(yb_filtered, Tb, fs, b.shape[-1], dof, sync, constellation, pulse, track, noise_floor=noise_floor)
+
+
+def _simulate_shard(SNR: float, dmax: float, Tb: float, Ntrials: int, Nbits: int, fs: float, channel_id: int, decimation: int, sync, constellation: str, pulse: str, impairments, track: bool, noise_floor: bool, seed):
+    """
+    Simulates one shard of `Ntrials` random messages and counts the errors.
+    The modulation and the pulse shape are given by their names in 
+    `wcslib.CONSTELLATIONS` and `wcslib.PULSES`. All 
+    random numbers are drawn from a generator seeded by the 
+    `numpy.random.SeedSequence` `seed`.
+
+    Returns
+    -------
+    bit_errors : int
+        Number of bits in error.
+    frame_errors : int
+        Number of messages with at least one bit in error.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Carrier and filters of the channel (see channels.py), designed once
+    # per process
+    plan = channel_plan(channel_id, fs)
+
+    b = rng.integers(0, 2, (Ntrials, Nbits))
+    b_hat, valid = simulate_batch(b, Tb, plan, SNR=SNR, dmax=dmax, rng=rng, decimation=decimation, sync=sync, constellation=wcs.CONSTELLATIONS[constellation], pulse=wcs.PULSES[pulse], impairments=impairments, track=track, noise_floor=noise_floor)
+    errors = ~valid | (b_hat != b)
+
+    return np.count_nonzero(errors), np.count_nonzero(np.any(errors, axis=-1))
+
+
+def ber_sweep(SNRs, dmaxs, Tbs, Ntrials: int, Nbits: int, fs: float=48000, channel_id: int=15, batch: int=50, seed=None, workers: int=1, decimation: int=1, sync=(1, 0), constellation=wcs.BPSK, pulse=wcs.RECT, impairments=None, track: bool=False, noise_floor: bool=False):
+    """
+    Estimates the bit error rate (BER) and frame error rate (FER) for every
+    combination of the given parameters, using random messages.
+
+    A bit counts as an error if it is decoded wrongly or not at all (no
+    signal detected), a frame (message) if any of its bits is in error.
+
+    The messages of every combination are split into shards of (at most)
+    `batch` messages. Every shard draws from its own random number generator,
+    seeded by a child of the root `numpy.random.SeedSequence(seed)` that is 
+    identified by the indices of the combination and the shard. The shards 
+    are simulated on `workers` processes and the error counts are summed up, 
+    so the results for a given `seed` are the same for any number of workers.
+
+    Parameters
+    ----------
+    SNRs : list of float
+        Signal-to-noise ratios at the transmitter (in dBm).
+    dmaxs : list of float
+        Maximum transmission distances.
+    Tbs : list of float
+        Symbol durations in seconds.
+    Ntrials : int
+        Number of messages per combination.
+    Nbits : int
+        Number of bits per message.
+    fs : float, default 48000
+        Sampling frequency in Hz.
+    channel_id : int, default 15
+        The id of the communication channel, which also determines the
+        carrier and the filters (see `channels.ChannelPlan`).
+    batch : int, default 50
+        Number of messages per shard (limits the memory use).
+    seed : int, optional
+        Root seed of the random number generators. Random if not given.
+    workers : int, default 1
+        Number of worker processes. Simulates in the calling process if 1, 
+        uses one process per CPU if None.
+    decimation : int, default 1
+        Decimation of the baseband signal in the receiver (see 
+        `simulate_batch()`).
+    sync : sequence of int, default (1, 0)
+        Synchronization bits prepended to every message.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        The modulation of the messages.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        The pulse shape of the messages, e.g., `wcslib.RRC` for shorter 
+        symbol durations.
+    impairments : dict, optional
+        Further impairments of the channel, see `simulate_batch()`.
+    track : bool, default False
+        Track the symbol timing and the carrier phase in the receiver.
+    noise_floor : bool, default False
+        Detect the messages relative to the noise floor in the receiver.
+
+    Returns
+    -------
+    rows : list of dict
+        One row per combination with the keys 'SNR', 'dmax', 'Tb', 'trials',
+        'bit_errors', 'ber', 'frame_errors', and 'fer'.
+    """
+
+    entropy = np.random.SeedSequence(seed).entropy
+    grid = list(itertools.product(SNRs, dmaxs, Tbs))
+    shards = [
+        (p, (SNR, dmax, Tb, min(batch, Ntrials-n), Nbits, fs, channel_id, decimation, sync, constellation.name, pulse.name, impairments, track, noise_floor,
+             np.random.SeedSequence(entropy, spawn_key=(p, n//batch))))
+        for p, (SNR, dmax, Tb) in enumerate(grid)
+        for n in range(0, Ntrials, batch)
+    ]
+
+    if workers == 1:
+        results = [_simulate_shard(*args) for _, args in shards]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_simulate_shard, *args) for _, args in shards]
+            results = [f.result() for f in futures]
+
+    # Merge the error counts of the shards
+    bit_errors = np.zeros(len(grid), dtype=int)
+    frame_errors = np.zeros(len(grid), dtype=int)
+    for (p, _), (nb, nf) in zip(shards, results):
+        bit_errors[p] += nb
+        frame_errors[p] += nf
+
+    rows = []
+    for p, (SNR, dmax, Tb) in enumerate(grid):
+        rows.append({
+            'SNR': SNR, 'dmax': dmax, 'Tb': Tb, 'trials': Ntrials,
+            'bit_errors': int(bit_errors[p]), 'ber': bit_errors[p]/(Ntrials*Nbits),
+            'frame_errors': int(frame_errors[p]), 'fer': frame_errors[p]/Ntrials,
+        })
+
+    return rows
+
+
+def format_table(rows):
+    """
+    Formats the rows returned by `ber_sweep()` as a plain text table.
+    """
+
+    lines = [f'{"SNR":>6} {"dmax":>6} {"Tb":>6} {"trials":>7} {"BER":>10} {"FER":>8}']
+    for r in rows:
+        lines.append(f'{r["SNR"]:6.1f} {r["dmax"]:6.2f} {r["Tb"]:6.3f} {r["trials"]:7d} {r["ber"]:10.2e} {r["fer"]:8.3f}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bit and frame error rates over a parameter grid.')
+    parser.add_argument('--snr', type=float, nargs='+', default=[20.0], help='Transmitter SNRs in dBm')
+    parser.add_argument('--dmax', type=float, nargs='+', default=[5.0], help='Maximum distances in m')
+    parser.add_argument('--tb', type=float, nargs='+', default=[0.04], help='Symbol durations in s')
+    parser.add_argument('--trials', type=int, default=100, help='Messages per grid point')
+    parser.add_argument('--bits', type=int, default=64, help='Bits per message')
+    parser.add_argument('--channel', type=int, default=15, help='Channel id')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (0 for one per CPU)')
+    parser.add_argument('--decimation', type=int, default=1, help='Baseband decimation in the receiver')
+    parser.add_argument('--sync', default='10', help='Synchronization bits, e.g. 10 or 1111100110101 (Barker 13)')
+    parser.add_argument('--constellation', default='bpsk', choices=list(wcs.CONSTELLATIONS), help='Modulation of the messages')
+    parser.add_argument('--pulse', default='rect', choices=list(wcs.PULSES), help='Pulse shape of the messages')
+    parser.add_argument('--taps', type=int, default=1, help='Propagation paths (direct path and echoes)')
+    parser.add_argument('--spread', type=float, default=0.0, help='Maximum delay of the echoes in s')
+    parser.add_argument('--interferers', type=int, default=1, help='Out-of-channel interferers')
+    parser.add_argument('--noise-color', type=float, default=0.0, help='Noise spectrum exponent (0 white, 1 pink, 2 brown)')
+    parser.add_argument('--cfo', type=float, default=0.0, help='Maximum carrier-frequency offset in Hz')
+    parser.add_argument('--track', action='store_true', help='Track the symbol timing and carrier phase in the receiver')
+    parser.add_argument('--noise-floor', action='store_true', help='Detect the messages relative to the estimated noise floor')
+    parser.add_argument('--profile', action='store_true', help='Print the time spent per stage (uses one worker)')
+    args = parser.parse_args()
+    if args.profile:
+        args.workers = 1
+
+    # Report the seed, so that a run with a random seed can be reproduced
+    seed = np.random.SeedSequence(args.seed).entropy
+    print(f'Seed: {seed}', file=sys.stderr)
+
+    impairments = {'taps': args.taps, 'spread': args.spread, 'interferers': args.interferers, 'noise_color': args.noise_color, 'cfo': args.cfo}
+
+    instrument.from_environ()
+    with contextlib.ExitStack() as stack:
+        if args.profile:
+            recorder = stack.enter_context(instrument.recording(instrument.Recorder()))
+        rows = ber_sweep(args.snr, args.dmax, args.tb, args.trials, args.bits, channel_id=args.channel, seed=seed, workers=args.workers or None, decimation=args.decimation, sync=[int(c) for c in args.sync], constellation=wcs.CONSTELLATIONS[args.constellation], pulse=wcs.PULSES[args.pulse], impairments=impairments, track=args.track, noise_floor=args.noise_floor)
+    print(format_table(rows))
+    if args.profile:
+        print(instrument.format_summary(recorder.summary()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the wireless communication system project in Signals and
+Transforms.
+
+To compare the moving-sum and FFT kernels used by wcslib with the direct-form FIR
+filters (signal.lfilter) they replace, run:
+$ python3 benchmark.py kernels
+
+To time each stage of the transmitter/receiver chain of simulation.py over
+a grid of message lengths, symbol durations, and sampling frequencies, and
+to store the results for later comparison, run:
+$ python3 benchmark.py stages --json before.json
+$ python3 benchmark.py stages --json after.json
+$ python3 benchmark.py compare before.json after.json
+
+To check the accuracy and speed of the float32 receive path against the
+float64 one, run:
+$ python3 benchmark.py precision
+
+To measure the startup time of the subcommands of cli.py (each run in a new
+interpreter, with and without precomputed filters), run:
+$ python3 benchmark.py startup
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy
+from scipy import signal
+from scipy.signal import sosfilt
+import wcslib as wcs
+from channels import channel_plan
+from filtercache import local_oscillator
+from stream import ReceiverFrontEnd, DecimatingFrontEnd, StreamingReceiver
+
+
+def _timeit(fn, repeat: int=3):
+    """
+    Returns the best wall time in seconds of `repeat` calls of `fn()`.
+    """
+
+    best = np.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def bench_kernels(lengths=(10_000, 100_000, 1_000_000), Tb: float=0.04, fs: float=48000, repeat: int=3):
+    """
+    Times the rect filter, the synchronization (matched) filters for the
+    default and the Barker 13 preamble, and the pulse shaping of wcslib
+    against the equivalent `signal.lfilter()` calls, for signals of the given
+    lengths.
+
+    Parameters
+    ----------
+    lengths : tuple of int
+        Signal lengths in samples.
+    Tb : float, default 0.04
+        Symbol duration in seconds (the filter length is `Kb = Tb*fs`).
+    fs : float, default 48000
+        Sampling frequency in Hz.
+    repeat : int, default 3
+        Number of repetitions (the best time is reported).
+
+    Returns
+    -------
+    rows : list of dict
+        One row per kernel and length with the keys 'kernel', 'N', 'Kb',
+        't_lfilter', 't_fast', 'speedup', and 'max_error'.
+    """
+
+    Kb = int(np.floor(Tb*fs))
+    hd = np.ones((Kb,))
+    hb = 1/(2*Kb)*np.concatenate((-np.ones(Kb), np.ones(Kb)))
+    hs = wcs._sync_response(wcs.BARKER13, Kb)
+    rng = np.random.default_rng(0)
+
+    rows = []
+    for N in lengths:
+        x = rng.standard_normal(N)
+        xd = np.sign(x)
+        b = rng.integers(0, 2, N//Kb)
+        xi = np.zeros(b.shape[0]*Kb)
+        xi[::Kb] = 2*b - 1
+
+        kernels = {
+            'rect': (
+                lambda: signal.lfilter(hd, 1, x),
+                lambda: wcs._moving_sum(x, Kb),
+            ),
+            'matched': (
+                lambda: signal.lfilter(hb, 1, xd),
+                lambda: signal.oaconvolve(xd, wcs._sync_response((1, 0), Kb))[:N],
+            ),
+            'barker13': (
+                lambda: signal.lfilter(hs, 1, xd),
+                lambda: signal.oaconvolve(xd, hs)[:N],
+            ),
+            'pulse': (
+                lambda: signal.lfilter(hd, 1, xi),
+                lambda: np.repeat((2*b - 1).astype(float), Kb),
+            ),
+        }
+        for name, (slow, fast) in kernels.items():
+            t_lfilter = _timeit(slow, repeat)
+            t_fast = _timeit(fast, repeat)
+            rows.append({
+                'kernel': name, 'N': N, 'Kb': Kb,
+                't_lfilter': t_lfilter, 't_fast': t_fast,
+                'speedup': t_lfilter/t_fast,
+                'max_error': float(np.max(np.abs(slow() - fast()))),
+            })
+
+    return rows
+
+
+def format_kernels(rows):
+    """
+    Formats the rows returned by `bench_kernels()` as a plain text table.
+    """
+
+    lines = [f'{"kernel":>8} {"N":>9} {"Kb":>5} {"lfilter [s]":>12} {"fast [s]":>10} {"speedup":>8} {"max error":>10}']
+    for r in rows:
+        lines.append(f'{r["kernel"]:>8} {r["N"]:9d} {r["Kb"]:5d} {r["t_lfilter"]:12.4f} {r["t_fast"]:10.5f} {r["speedup"]:8.0f} {r["max_error"]:10.1e}')
+    return '\n'.join(lines)
+
+
+def _peak_memory(fn):
+    """
+    Returns the peak memory in bytes allocated by a call of `fn()` (as traced
+    by tracemalloc, which includes numpy's array buffers).
+    """
+
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stages(lengths=(16, 64, 256), Tbs=(0.02, 0.04), fss=(44100, 48000), channel_id: int=15, repeat: int=3):
+    """
+    Times each stage of the transmitter and receiver chain of simulation.py
+    for random messages of the given lengths, for every combination of
+    symbol duration and sampling frequency.
+
+    Parameters
+    ----------
+    lengths : tuple of int
+        Message lengths in characters.
+    Tbs : tuple of float
+        Symbol durations in seconds.
+    fss : tuple of float
+        Sampling frequencies in Hz.
+    channel_id : int, default 15
+        The id of the communication channel, which determines the carrier
+        and the filters (see `channels.ChannelPlan`).
+    repeat : int, default 3
+        Number of repetitions (the best time is reported).
+
+    Returns
+    -------
+    rows : list of dict
+        One row per stage and grid point with the keys 'stage', 'chars', 
+        'Tb', 'fs', 'bits' (message bits), 'N' (signal samples processed by
+        the stage, the number of bits for encode_string), 't' (wall time in
+        s), 'samples_per_s', 'bits_per_s', and 'peak_bytes' (peak memory
+        allocated by the stage).
+    """
+
+    rng = np.random.default_rng(0)
+
+    rows = []
+    for fs in fss:
+        plan = channel_plan(channel_id, fs)
+        lo = local_oscillator(fs, plan.fc)
+        sos = plan.bandpass
+        sos_low = plan.lowpass
+
+        for Tb in Tbs:
+            for chars in lengths:
+                data = ''.join(map(chr, rng.integers(32, 127, chars)))
+
+                # Run the chain once to get the input of every stage
+                bs = wcs.encode_string(data)
+                xb = wcs.encode_baseband_signal(bs, Tb, fs)
+                xm = xb*lo.sin(len(xb))
+                xt = sosfilt(sos, xm)
+                yr = wcs.simulate_channel(xt, fs, channel_id, rng=np.random.default_rng(0)).flatten()
+                yf = sosfilt(sos, yr)
+                I = yf*lo.cos(len(yf))
+                Q = -1*yf*lo.sin(len(yf))
+                yb = sosfilt(sos_low, I) + 1j*sosfilt(sos_low, Q)
+                br = wcs.decode_baseband_iq(yb, Tb, fs)
+
+                stages = {
+                    'encode_string': (len(bs), lambda: wcs.encode_string(data)),
+                    'encode_baseband': (len(xb), lambda: wcs.encode_baseband_signal(bs, Tb, fs)),
+                    'modulate': (len(xb), lambda: xb*lo.sin(len(xb))),
+                    'bandpass_tx': (len(xm), lambda: sosfilt(sos, xm)),
+                    'channel': (len(xt), lambda: wcs.simulate_channel(xt, fs, channel_id, rng=np.random.default_rng(0))),
+                    'bandpass_rx': (len(yr), lambda: sosfilt(sos, yr)),
+                    'iq_mix': (len(yf), lambda: (yf*lo.cos(len(yf)), -1*yf*lo.sin(len(yf)))),
+                    'lowpass': (len(I), lambda: sosfilt(sos_low, I) + 1j*sosfilt(sos_low, Q)),
+                    'decode_baseband': (len(yb), lambda: wcs.decode_baseband_iq(yb, Tb, fs)),
+                    'decode_string': (len(br), lambda: wcs.decode_string(br)),
+                }
+                for name, (N, fn) in stages.items():
+                    t = _timeit(fn, repeat)
+                    rows.append({
+                        'stage': name, 'chars': chars, 'Tb': Tb, 'fs': fs,
+                        'bits': len(bs), 'N': N, 't': t,
+                        'samples_per_s': N/t, 'bits_per_s': len(bs)/t,
+                        'peak_bytes': _peak_memory(fn),
+                    })
+
+    return rows
+
+
+def format_stages(rows):
+    """
+    Formats the rows returned by `bench_stages()` as a plain text table.
+    """
+
+    lines = [f'{"stage":>15} {"chars":>5} {"Tb":>5} {"fs":>6} {"N":>9} {"time [s]":>9} {"samples/s":>9} {"bits/s":>9} {"peak [MiB]":>10}']
+    for r in rows:
+        lines.append(f'{r["stage"]:>15} {r["chars"]:5d} {r["Tb"]:5.3f} {r["fs"]:6.0f} {r["N"]:9d} {r["t"]:9.5f} {r["samples_per_s"]:9.2e} {r["bits_per_s"]:9.2e} {r["peak_bytes"]/2**20:10.2f}')
+    return '\n'.join(lines)
+
+
+def bench_precision(blocksizes=(480, 4800), data: str='Hello precision!a', Tb: float=0.02, fs: float=48000, channel_id: int=15, seed: int=2):
+    """
+    Runs the streaming receivers (with and without decimation) in float64 
+    and float32 on the same simulated capture, and compares the baseband 
+    signals, the decoded bytes, the time, and the memory allocated per 
+    block.
+
+    Parameters
+    ----------
+    blocksizes : tuple of int
+        Block sizes in samples.
+    data : str, default 'Hello precision!a'
+        The transmitted message.
+    Tb : float, default 0.02
+        Symbol duration in seconds.
+    fs : float, default 48000
+        Sampling frequency in Hz.
+    channel_id : int, default 15
+        The id of the communication channel, which determines the carrier
+        and the filters (see `channels.ChannelPlan`).
+    seed : int, default 2
+        Seed of the channel simulation.
+
+    Returns
+    -------
+    rows : list of dict
+        One row per front end, block size, and precision with the keys 
+        'frontend', 'blocksize', 'dtype', 't' (wall time for the capture),
+        'peak_bytes' (largest peak memory allocated by a block), 
+        'max_error' (largest error of the baseband signal relative to its
+        RMS value, compared to float64), and 'bytes_equal' (whether the
+        decoded bytes are the same as in float64), and 'correct' (whether
+        they are the transmitted message).
+    """
+
+    plan = channel_plan(channel_id, fs)
+    fc = plan.fc
+    sos = plan.bandpass
+    sos_low = plan.lowpass
+    h = plan.decimation_filter(16)
+    frontends = {
+        'iir': lambda dtype: ReceiverFrontEnd(fs, fc, sos, sos_low, dtype),
+        'decimating': lambda dtype: DecimatingFrontEnd(fs, fc, sos, h, 16, dtype),
+    }
+
+    # Simulated capture, with noise before and after the transmission
+    xb = wcs.encode_baseband_signal(wcs.encode_string(data), Tb, fs)
+    x = sosfilt(sos, xb*local_oscillator(fs, fc).sin(len(xb)))
+    y = wcs.simulate_channel(np.concatenate((np.zeros(int(fs)), x, np.zeros(int(fs/2)))), fs, channel_id, rng=np.random.default_rng(seed))
+
+    rows = []
+    for name, frontend in frontends.items():
+        for blocksize in blocksizes:
+            blocks = [y[k:k+blocksize] for k in range(0, len(y), blocksize)]
+            reference = None
+            for dtype in ('float64', 'float32'):
+                # Baseband signal of the front end alone
+                fe = frontend(dtype)
+                yb = np.concatenate([fe.process(block) for block in blocks])
+                if reference is None:
+                    reference = yb
+                rms = np.sqrt(np.mean(np.abs(reference)**2))
+
+                # Receiver: time for the whole capture, memory per block
+                receiver = StreamingReceiver(frontend(dtype), Tb)
+                t = time.perf_counter()
+                received = b''.join(receiver.process(block) for block in blocks)
+                t = time.perf_counter() - t
+                if dtype == 'float64':
+                    expected = received
+                receiver = StreamingReceiver(frontend(dtype), Tb)
+                peak = max(_peak_memory(lambda: receiver.process(block)) for block in blocks)
+
+                rows.append({
+                    'frontend': name, 'blocksize': blocksize, 'dtype': dtype,
+                    't': t, 'peak_bytes': peak,
+                    'max_error': float(np.max(np.abs(yb - reference))/rms),
+                    'bytes_equal': received == expected,
+                    'correct': received == data.encode(),
+                })
+
+    return rows
+
+
+def format_precision(rows):
+    """
+    Formats the rows returned by `bench_precision()` as a plain text table.
+    """
+
+    lines = [f'{"frontend":>10} {"block":>6} {"dtype":>8} {"time [s]":>9} {"peak [KiB]":>10} {"rel. error":>10} {"bytes":>6} {"correct":>8}']
+    for r in rows:
+        lines.append(f'{r["frontend"]:>10} {r["blocksize"]:6d} {r["dtype"]:>8} {r["t"]:9.4f} {r["peak_bytes"]/2**10:10.1f} {r["max_error"]:10.1e} {"same" if r["bytes_equal"] else "DIFF":>6} {"yes" if r["correct"] else "no":>8}')
+    return '\n'.join(lines)
+
+
+def bench_startup(data: str='Hello World!', repeat: int=5):
+    """
+    Measures the wall time of running the subcommands of cli.py in a new
+    interpreter, as in scripted use, compared to starting the interpreter
+    alone and importing numpy and scipy.signal. The subcommands run with a
+    new (empty) filter file, and with the filters precomputed by that run.
+
+    Parameters
+    ----------
+    data : str, default 'Hello World!'
+        The transmitted (and simulated) message.
+    repeat : int, default 5
+        Number of repetitions (the best time is reported).
+
+    Returns
+    -------
+    rows : list of dict
+        One row per command with the keys 'command', 'filters' ('-' for the
+        baselines, 'designed' or 'precomputed'), 't' (wall time in s), and
+        'overhead' (time in s beyond starting the interpreter).
+    """
+
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    with tempfile.TemporaryDirectory() as tmp:
+        signal_path = os.path.join(tmp, 'tx.raw')
+        filters_path = os.path.join(tmp, 'filters.npz')
+        baselines = {
+            'python': ['-c', 'pass'],
+            'import numpy': ['-c', 'import numpy'],
+            'import scipy.signal': ['-c', 'import scipy.signal'],
+        }
+        commands = {
+            'tx': [cli, 'tx', '-o', signal_path, data],
+            'rx': [cli, 'rx', signal_path],
+            'simulate': [cli, 'simulate', data],
+        }
+
+        def run(argv, designed=False):
+            env = dict(os.environ, WCS_FILTERS=filters_path)
+            best = np.inf
+            for _ in range(repeat):
+                if designed and os.path.exists(filters_path):
+                    os.remove(filters_path)
+                t = time.perf_counter()
+                subprocess.run([sys.executable] + argv, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                best = min(best, time.perf_counter() - t)
+            return best
+
+        rows = [{'command': name, 'filters': '-', 't': run(argv)} for name, argv in baselines.items()]
+        for name, argv in commands.items():
+            rows.append({'command': name, 'filters': 'designed', 't': run(argv, designed=True)})
+            rows.append({'command': name, 'filters': 'precomputed', 't': run(argv)})
+
+    for r in rows:
+        r['overhead'] = r['t'] - rows[0]['t']
+    return rows
+
+
+def format_startup(rows):
+    """
+    Formats the rows returned by `bench_startup()` as a plain text table.
+    """
+
+    lines = [f'{"command":>20} {"filters":>11} {"time [s]":>9} {"overhead [s]":>12}']
+    for r in rows:
+        lines.append(f'{r["command"]:>20} {r["filters"]:>11} {r["t"]:9.3f} {r["overhead"]:12.3f}')
+    return '\n'.join(lines)
+
+
+# Fields identifying a row, and the time compared between runs, per suite
+_KEYS = {
+    'kernels': ('kernel', 'N', 'Kb'),
+    'stages': ('stage', 'chars', 'Tb', 'fs'),
+    'precision': ('frontend', 'blocksize', 'dtype'),
+    'startup': ('command', 'filters'),
+}
+_TIMES = {
+    'kernels': 't_fast',
+    'stages': 't',
+    'precision': 't',
+    'startup': 't',
+}
+
+
+def save_results(path, suite: str, rows):
+    """
+    Saves the rows of the benchmark `suite` ('kernels' or 'stages') to the
+    JSON file `path`, together with the versions and the platform they were
+    obtained with.
+    """
+
+    results = {
+        'suite': suite,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'rows': rows,
+    }
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def load_results(path):
+    """
+    Loads results saved by `save_results()`.
+    """
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(old, new, tolerance: float=0.2):
+    """
+    Compares two benchmark results of the same suite.
+
+    Parameters
+    ----------
+    old, new : dict
+        The results, as returned by `load_results()`.
+    tolerance : float, default 0.2
+        Relative slowdown above which a row is flagged as a regression.
+
+    Returns
+    -------
+    rows : list of dict
+        One row per measurement present in both results with the keys 
+        'key' (the identifying fields), 't_old', 't_new', 'ratio' (new over
+        old time), and 'regression'.
+    """
+
+    if old['suite'] != new['suite']:
+        raise ValueError(f'Cannot compare the suites {old["suite"]} and {new["suite"]}.')
+    keys, field = _KEYS[old['suite']], _TIMES[old['suite']]
+
+    before = {tuple(r[k] for k in keys): r[field] for r in old['rows']}
+    rows = []
+    for r in new['rows']:
+        key = tuple(r[k] for k in keys)
+        if key in before:
+            ratio = r[field]/before[key]
+            rows.append({
+                'key': dict(zip(keys, key)),
+                't_old': before[key], 't_new': r[field],
+                'ratio': ratio, 'regression': ratio > 1 + tolerance,
+            })
+
+    return rows
+
+
+def format_comparison(rows):
+    """
+    Formats the rows returned by `compare_results()` as a plain text table.
+    """
+
+    lines = [f'{"measurement":>40} {"old [s]":>9} {"new [s]":>9} {"ratio":>6}']
+    for r in rows:
+        key = ' '.join(f'{v}' for v in r['key'].values())
+        flag = '  REGRESSION' if r['regression'] else ''
+        lines.append(f'{key:>40} {r["t_old"]:9.5f} {r["t_new"]:9.5f} {r["ratio"]:6.2f}{flag}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the transmitter and receiver chain.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('kernels', help='Moving-sum and FFT kernels versus signal.lfilter')
+    p.add_argument('--json', help='Save the results to this JSON file')
+
+    p = subparsers.add_parser('stages', help='Every stage of the transmitter and receiver chain')
+    p.add_argument('--chars', type=int, nargs='+', default=[16, 64, 256], help='Message lengths in characters')
+    p.add_argument('--tb', type=float, nargs='+', default=[0.02, 0.04], help='Symbol durations in s')
+    p.add_argument('--fs', type=float, nargs='+', default=[44100, 48000], help='Sampling frequencies in Hz')
+    p.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement')
+    p.add_argument('--json', help='Save the results to this JSON file')
+
+    p = subparsers.add_parser('precision', help='Accuracy and speed of the float32 receive path')
+    p.add_argument('--json', help='Save the results to this JSON file')
+
+    p = subparsers.add_parser('startup', help='Startup time of the subcommands of cli.py')
+    p.add_argument('--repeat', type=int, default=5, help='Repetitions per measurement')
+    p.add_argument('--json', help='Save the results to this JSON file')
+
+    p = subparsers.add_parser('compare', help='Compare two saved results')
+    p.add_argument('old', help='JSON file of the reference run')
+    p.add_argument('new', help='JSON file of the new run')
+    p.add_argument('--tolerance', type=float, default=0.2, help='Relative slowdown flagged as a regression')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'kernels':
+        rows = bench_kernels()
+        print(format_kernels(rows))
+    elif args.command == 'stages':
+        rows = bench_stages(args.chars, args.tb, args.fs, repeat=args.repeat)
+        print(format_stages(rows))
+    elif args.command == 'precision':
+        rows = bench_precision()
+        print(format_precision(rows))
+    elif args.command == 'startup':
+        rows = bench_startup(repeat=args.repeat)
+        print(format_startup(rows))
+    else:
+        rows = compare_results(load_results(args.old), load_results(args.new), args.tolerance)
+        print(format_comparison(rows))
+        if any(r['regression'] for r in rows):
+            sys.exit(1)
+        return
+
+    if args.json:
+        save_results(args.json, args.command, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-channel (FDM) receiver for the wireless communication system project
+in Signals and Transforms.
+
+Instead of demodulating one channel per run, the received audio is split
+into all channel bands of `wcslib._channels` at once by an FFT channelizer:
+every block of the audio is transformed once, and each channel is obtained
+by weighting the spectrum with the channel's (frequency-shifted) lowpass
+filter and a short inverse FFT at the decimated sampling frequency. The
+cost of monitoring all channels is thus one FFT over the audio plus a few
+multiplications per channel and input sample, instead of a full receiver
+chain per channel.
+
+To decode all channels of a recording (WAV or raw float64), run:
+$ python3 channelizer.py capture.wav
+"""
+
+import math
+import sys
+import numpy as np
+from scipy import fft
+from scipy.signal import firwin, kaiserord
+import wcslib as wcs
+from filtercache import local_oscillator
+from stream import StreamingReceiver, wav_blocks, raw_blocks
+import instrument
+
+
+def channel_bands(channel_ids=None):
+    """
+    Returns the bands of the channels in `wcslib._channels`.
+
+    Parameters
+    ----------
+    channel_ids : list of int, optional
+        The ids of the channels; all channels if not given.
+
+    Returns
+    -------
+    bands : list of tuple
+        One tuple (channel_id, f_low, f_high) per channel, with the band
+        edges in Hz.
+    """
+
+    channels = wcs._channels
+    if channel_ids is None:
+        channel_ids = range(1, channels.shape[1]-1)
+
+    bands = []
+    for i in channel_ids:
+        if not (i >= 1 and i < channels.shape[1]-1):
+            raise ValueError(f'channel_id must be between 1 and {channels.shape[1]-2}, but {i} given.')
+        bands.append((i, float(channels[0, i]), float(channels[1, i])))
+    return bands
+
+
+class FFTChannelizer:
+    """
+    Splits the received signal into the complex baseband signals of several
+    channels at once, block by block.
+
+    Channel `i` is IQ-demodulated at the center `fc[i]` of its band, lowpass
+    filtered with a linear-phase FIR filter (Kaiser window) passing half the
+    channel's bandwidth, and decimated by `decimation`, which gives the same
+    output as `scipy.signal.upfirdn(h[i], x*exp(-2j*pi*fc[i]*n/fs),
+    down=decimation)` for the concatenated blocks. The filtering is done by
+    overlap-save fast convolution with an FFT of length `nfft`, chosen such
+    that all centers fall on FFT bins; the decimation by folding the
+    spectrum before the inverse FFT of length `nfft/decimation`.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    bands : list of tuple
+        The channels as (channel_id, f_low, f_high), see `channel_bands()`.
+    decimation : int, default 16
+        Downsampling factor.
+    transition : float, default 50.0
+        Width of the filters' transition band in Hz.
+    R_s : float, default 60.0
+        Stopband attenuation of the filters in dB.
+    """
+
+    def __init__(self, fs: float, bands, decimation: int=16, transition: float=50.0, R_s: float=60.0):
+        self.fs = fs
+        self.fs_out = fs/decimation
+        self.decimation = decimation
+        self.channel_ids = [b[0] for b in bands]
+        self.fc = np.array([(b[1] + b[2])/2 for b in bands])
+
+        # Filters of a common length L with L-1 a multiple of the decimation
+        numtaps, beta = kaiserord(R_s, transition/(fs/2))
+        L = decimation*int(np.ceil((numtaps - 1)/decimation)) + 1
+        self.h = np.array([
+            firwin(L, (f_high - f_low)/2 + transition/2, window=('kaiser', beta), fs=fs)
+            for _, f_low, f_high in bands
+        ])
+        self.delay = (L - 1)//2//decimation  # Group delay of the filters, in output samples
+
+        # FFT length: a multiple of the decimation and of the carrier periods
+        # (so that the carriers are FFT bins), at least four filter lengths
+        self._lo = [local_oscillator(fs, fc) for fc in self.fc]
+        base = math.lcm(decimation, *(lo.period for lo in self._lo))
+        self.nfft = base*int(np.ceil(4*(L - 1)/base))
+        self.step = self.nfft - (L - 1)
+
+        # Frequency responses, indexed by the (baseband) bin k = 0, ...,
+        # nfft-1, and the spectrum bins k+kc of the carriers
+        k = np.arange(self.nfft)
+        kc = np.round(self.fc*self.nfft/fs).astype(int)
+        self._H = fft.fft(self.h, self.nfft, axis=-1)
+        self._bins = (k + kc[:, np.newaxis]) % self.nfft
+
+        # The last L-1 input samples, and the index of the next input sample
+        self._buf = np.zeros((L - 1,))
+        self._n = 0
+
+    def process(self, x):
+        """
+        Channelizes the next block of the received signal.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the received signal.
+
+        Returns
+        -------
+        yb : numpy.array
+            The corresponding blocks of the complex baseband signals, one
+            channel per row, at the sampling frequency `fs_out`.
+        """
+
+        x = np.asarray(x, dtype=float).ravel()
+        y = [
+            self._process_chunk(x[k:k+self.step])
+            for k in range(0, x.shape[0], self.step)
+        ]
+        return np.concatenate(y, axis=-1) if y else np.zeros((len(self.fc), 0), dtype=complex)
+
+    def _process_chunk(self, x):
+        """
+        Channelizes a chunk of at most `step` samples, see `process()`.
+        """
+
+        D = self.decimation
+        Lm1 = self._buf.shape[0]
+        N = x.shape[0]
+        M = self.nfft//D
+
+        with instrument.stage('channelize', x) as st:
+            # Overlap-save: the chunk preceded by the last L-1 samples (and
+            # zero-padded), starting at input sample n0
+            xh = np.zeros((self.nfft,))
+            xh[:Lm1] = self._buf
+            xh[Lm1:Lm1+N] = x
+            n0 = self._n - Lm1
+            X = fft.fft(xh)
+
+            # Filter each channel at baseband (mixing down by kc bins),
+            # advancing by r samples so that every D-th output falls on an
+            # input sample that is a multiple of the decimation
+            r = (-n0) % D
+            Y = X[self._bins]*self._H
+            if r:
+                Y *= np.exp(2j*np.pi*r*np.arange(self.nfft)/self.nfft)
+
+            # Decimation: folding the spectrum gives every D-th sample
+            y = fft.ifft(Y.reshape(-1, D, M).sum(axis=1), axis=-1)/D
+
+            # Carrier phase at the first input sample n0 (the FFT mixes
+            # relative to the start of the chunk)
+            phase = np.array([(n0 % lo.period)*lo.fc/lo.fs for lo in self._lo])
+            y *= np.exp(-2j*np.pi*phase)[:, np.newaxis]
+
+            # Keep the outputs that only depend on the input so far
+            m0 = -(-(Lm1 - r)//D)
+            m1 = (Lm1 + N - 1 - r)//D + 1
+            y = st.output(y[:, m0:m1])
+
+        xb = np.concatenate((self._buf, x))
+        self._buf = xb[xb.shape[0]-Lm1:]
+        self._n += N
+
+        return y
+
+
+class MultiChannelReceiver:
+    """
+    Block-based receiver decoding several channels of the same received
+    audio at once, see `FFTChannelizer`.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    Tb : float
+        Symbol duration in seconds.
+    channel_ids : list of int, optional
+        The channels to decode; all channels of `wcslib._channels` if not
+        given.
+    decimation : int, default 16
+        Downsampling factor of the channelizer.
+    threshold : float, default 4.0
+        Detection threshold of the decoders (see `wcslib.BasebandDecoder`).
+    sync : sequence of int, default (1, 0)
+        Synchronization bits used by the transmitters.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        Modulation used by the transmitters.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        Pulse shape used by the transmitters.
+    track : bool, default False
+        Track the symbol timing and the carrier phase of every channel.
+    """
+
+    def __init__(self, fs: float, Tb: float, channel_ids=None, decimation: int=16, threshold: float=4.0, sync=(1, 0), constellation=wcs.BPSK, pulse=wcs.RECT, track: bool=False):
+        self.channelizer = FFTChannelizer(fs, channel_bands(channel_ids), decimation)
+        self.channel_ids = self.channelizer.channel_ids
+        self.receivers = [
+            StreamingReceiver(self.channelizer, Tb, threshold, sync, constellation, pulse, track)
+            for _ in self.channel_ids
+        ]
+
+    @property
+    def active(self):
+        """The ids of the channels on which a transmission is being received."""
+        return [i for i, r in zip(self.channel_ids, self.receivers) if r.active]
+
+    def process(self, x):
+        """
+        Processes the next block of received audio.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the received signal.
+
+        Returns
+        -------
+        data : dict
+            The bytes completed within the block (possibly none), by channel
+            id.
+        """
+
+        yb = self.channelizer.process(x)
+        return {
+            i: r.push_baseband(y)
+            for i, r, y in zip(self.channel_ids, self.receivers, yb)
+        }
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f'Usage: {sys.argv[0]} capture.wav|capture.raw', file=sys.stderr)
+        sys.exit(1)
+
+    fs = 48000
+    Tb = 0.02
+    blocksize = 4800
+
+    instrument.from_environ()
+    path = str(sys.argv[1])
+    blocks = wav_blocks(path, fs, blocksize) if path.endswith('.wav') else raw_blocks(path, blocksize)
+
+    # Collect the bytes of every channel and print the messages as their
+    # transmissions end
+    receiver = MultiChannelReceiver(fs, Tb)
+    messages = {i: b'' for i in receiver.channel_ids}
+    for block in blocks:
+        for i, data in receiver.process(block).items():
+            messages[i] += data
+            if messages[i] and i not in receiver.active:
+                print(f'Channel {i}: "{messages[i].decode(errors="replace")}"')
+                messages[i] = b''
+    for i, data in messages.items():
+        if data:
+            print(f'Channel {i}: "{data.decode(errors="replace")}"')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Channel plan for the wireless communication system project in Signals and
+Transforms.
+
+The channels and their bands are listed in `wcslib._channels`. A
+`ChannelPlan` derives everything the transmitter and the receiver need from
+the channel id (and the sampling frequency): the carrier at the center of
+the band, the bandpass and lowpass filters of the lowest order that meets
+the ripple and attenuation specifications, and the shortest symbol duration
+whose spectrum fits into the band. Changing the channel or the sampling
+frequency thus changes the filters accordingly.
+
+The guard bands between the channels are narrow (50 Hz), so the bandpass
+filter is steep, and its group delay and the variation of the group delay
+over the band cause intersymbol interference. The filters are elliptic with
+0.1 dB passband ripple by default, which meets the specifications with a 
+lower order (and thus less delay) than a Chebyshev filter, and ripples less
+in the passband. `ChannelPlan.check_symbol_duration()` rejects symbol 
+durations for which the interference of the filters leaves too little 
+margin to decide the symbols of the constellation.
+
+The transmitter only needs the bandpass filter, which `ChannelPlan.transmit()`
+applies by FFT convolution with its impulse response. With precomputed
+filters (see `filtercache.FilterCache`), transmitting thus works with numpy
+alone, without the time it takes to import scipy.signal.
+
+To print the plan of a channel, run:
+$ python3 channels.py 15
+"""
+
+import argparse
+import functools
+import numpy as np
+import wcslib as wcs
+from bandpass import create_bandpass_filter
+from lowpass import create_lowpass_filter, create_decimation_filter
+from filtercache import filters
+
+ISI_MARGIN = 0.5  # Fraction of the decision margin of the constellation that the intersymbol interference of the filters may take (the rest is left for the noise)
+
+
+class ChannelPlan:
+    """
+    Carrier, filters, and symbol-duration limits of one channel of
+    `wcslib._channels`.
+
+    The bandpass filter passes the channel's band `[f_low, f_high]` and
+    attenuates the bands of the neighboring channels, i.e., everything below
+    the upper edge `f_stop_low` of the channel below and above the lower
+    edge `f_stop_high` of the channel above, by at least `R_s` dB. After IQ
+    demodulation at the carrier `fc`, the lowpass filter passes the
+    baseband signal up to half the channel's bandwidth and attenuates the
+    image of the band at twice the carrier by at least `R_s` dB (the
+    neighboring channels are already attenuated by the bandpass filter).
+    Both filters have the lowest order that meets these specifications.
+
+    Parameters
+    ----------
+    channel_id : int
+        The id of the channel (the group number).
+    fs : float, default 48000
+        Sampling frequency in Hz.
+    R_p : float, default 0.1
+        Passband ripple of the filters in dB.
+    R_s : float, default 40
+        Stopband attenuation of the filters in dB.
+    ftype : str, default 'ellip'
+        Filter family, 'ellip' (elliptic, which meets the specifications 
+        with a lower order, at the expense of ripple in the stopband) or
+        'cheby1' (Chebyshev type I).
+    """
+
+    def __init__(self, channel_id: int, fs: float=48000, R_p: float=0.1, R_s: float=40, ftype: str='ellip'):
+        channels = wcs._channels
+        if not (channel_id >= 1 and channel_id < channels.shape[1]-1):
+            raise ValueError(f'channel_id must be between 1 and {channels.shape[1]-2}, but {channel_id} given.')
+
+        self.channel_id = channel_id
+        self.fs = fs
+        self.R_p = R_p
+        self.R_s = R_s
+        self.ftype = ftype
+        self.f_low = float(channels[0, channel_id])
+        self.f_high = float(channels[1, channel_id])
+        self.f_stop_low = float(channels[1, channel_id-1])
+        self.f_stop_high = float(channels[0, channel_id+1])
+        self.P_max = float(channels[2, channel_id])
+        self.fc = (self.f_low + self.f_high) / 2
+        if self.fc + self.f_stop_high >= fs / 2:
+            raise ValueError(f'The sampling frequency {fs} Hz is too low for channel {channel_id}, it must exceed {2*(self.fc + self.f_stop_high)} Hz.')
+
+    def __repr__(self):
+        return f'ChannelPlan({self.channel_id}, fs={self.fs})'
+
+    @property
+    def bandwidth(self):
+        """Width of the channel's band in Hz."""
+        return self.f_high - self.f_low
+
+    @property
+    def f_cutoff(self):
+        """Passband edge of the lowpass filter in Hz (half the bandwidth)."""
+        return self.bandwidth / 2
+
+    @property
+    def f_image(self):
+        """
+        Stopband edge of the lowpass filter in Hz: the lower edge of the
+        image of the bandpass filter's band (up to its stopband edges) at
+        twice the carrier after IQ demodulation.
+        """
+        return self.fc + self.f_stop_low
+
+    @property
+    def bandpass_order(self):
+        """Order of the bandpass filter (of its lowpass prototype)."""
+        return filters.order(self.ftype, self.fs, (self.f_low, self.f_high), (self.f_stop_low, self.f_stop_high), self.R_p, self.R_s)
+
+    @property
+    def lowpass_order(self):
+        """Order of the lowpass filter."""
+        return filters.order(self.ftype, self.fs, self.f_cutoff, self.f_image, self.R_p, self.R_s)
+
+    @property
+    def bandpass(self):
+        """
+        Second-order sections of the bandpass filter (shared, must not be
+        modified).
+        """
+        return create_bandpass_filter(self.fs, self.f_low, self.f_high, self.R_p, self.R_s, self.f_stop_low, self.f_stop_high, self.ftype)
+
+    @property
+    def bandpass_impulse_response(self):
+        """
+        The (truncated) impulse response of the bandpass filter, see
+        `filtercache.FilterCache.impulse_response()`.
+        """
+        return filters.impulse_response('bandpass', self.fs, (self.f_low, self.f_high), self.bandpass_order, self.R_p, self.R_s, self.ftype)
+
+    @property
+    def lowpass_impulse_response(self):
+        """
+        The (truncated) impulse response of the lowpass filter, see
+        `filtercache.FilterCache.impulse_response()`.
+        """
+        return filters.impulse_response('lowpass', self.fs, self.f_cutoff, self.lowpass_order, self.R_p, self.R_s, self.ftype)
+
+    @property
+    def lowpass(self):
+        """
+        Second-order sections of the lowpass filter (shared, must not be
+        modified).
+        """
+        return create_lowpass_filter(self.fs, self.f_cutoff, self.R_p, self.R_s, self.f_image, self.ftype)
+
+    def transmit(self, xm):
+        """
+        Bandpass filters the modulated signal `xm` (along the last axis) by
+        FFT convolution with `bandpass_impulse_response`. The result is the
+        same as `scipy.signal.sosfilt(self.bandpass, xm)` up to relative
+        errors of about 1e-10.
+        """
+
+        h = self.bandpass_impulse_response
+        N = np.shape(xm)[-1]
+        Nfft = 1 << (N + h.shape[0] - 2).bit_length()
+        y = np.fft.irfft(np.fft.rfft(xm, Nfft) * np.fft.rfft(h, Nfft), Nfft)
+        return y[..., :N]
+
+    def decimation_filter(self, decimation: int):
+        """
+        Returns the taps of the linear-phase FIR lowpass filter that replaces
+        the lowpass filter when the baseband signal is decimated by
+        `decimation` (see `lowpass.create_decimation_filter()`). Like the
+        lowpass filter, it only has to attenuate the image, and in addition
+        everything that would alias into the passband.
+        """
+
+        if self.fs / decimation <= 2 * self.f_cutoff:
+            raise ValueError(f'Decimating by {decimation} leaves {self.fs/decimation} Hz, which is too low for the bandwidth of channel {self.channel_id}.')
+        return create_decimation_filter(self.fs, self.f_cutoff, self.R_s, decimation, self.f_image)
+
+    def min_symbol_duration(self, pulse=wcs.RECT):
+        """
+        Returns the shortest symbol duration in seconds for which the
+        spectrum of the transmitted signal fits into the channel: the main
+        lobe (of width 2/Tb) for the rect pulse, and the whole spectrum (of
+        width (1 + rolloff)/Tb) for the RRC pulse. 
+        
+        This is a bound on the bandwidth only, which does not depend on the
+        constellation. Whether the symbols of a constellation can still be
+        decided after the filters is checked by `check_symbol_duration()`.
+        """
+
+        if pulse.rect:
+            return 2 / self.bandwidth
+        return (1 + pulse.rolloff) / self.bandwidth
+
+    def intersymbol_interference(self, Tb: float, pulse=wcs.RECT):
+        """
+        Returns the peak distortion of the symbols with duration `Tb` by the
+        filters: the sum of the magnitudes of the responses to the other 
+        symbols at the symbol instants, relative to the magnitude of the 
+        response to the symbol itself (at its peak).
+
+        The response is that of the baseband equivalent of the whole chain:
+        the pulse, the bandpass filter in the transmitter and in the 
+        receiver, the lowpass filter, and the averaging over a symbol (or the
+        matched filter) of the decoder. The symbols of a constellation are
+        still decided correctly without noise if the peak distortion is less
+        than half the minimum distance between its points, relative to the 
+        largest point.
+        """
+
+        Kb = int(np.floor(Tb*self.fs))
+        h = self.bandpass_impulse_response
+        g = _convolve(h, h)*np.exp(-2j*np.pi*self.fc/self.fs*np.arange(2*h.shape[0]-1))
+        g = _convolve(g, self.lowpass_impulse_response)
+        taps = pulse.taps(Kb)
+        y = np.abs(_convolve(_convolve(g, taps), taps[::-1]))
+        k0 = np.argmax(y)
+        k = np.concatenate((np.arange(k0 % Kb, k0, Kb), np.arange(k0+Kb, y.shape[0], Kb)))
+        return np.sum(y[k]) / y[k0]
+
+    def check_symbol_duration(self, Tb: float, pulse=wcs.RECT, constellation=wcs.BPSK):
+        """
+        Raises a ValueError if the symbol duration `Tb` is shorter than
+        `min_symbol_duration(pulse)`, or if the intersymbol interference of
+        the filters (see `intersymbol_interference()`) exceeds `ISI_MARGIN`
+        of the decision margin of the constellation.
+        """
+
+        Tb_min = self.min_symbol_duration(pulse)
+        if Tb < Tb_min:
+            raise ValueError(f'The symbol duration {Tb} s is too short for channel {self.channel_id} ({self.bandwidth:g} Hz wide), it must be at least {Tb_min:g} s with the {pulse.name} pulse.')
+        isi = self.intersymbol_interference(Tb, pulse)
+        margin = _decision_margin(constellation)
+        if isi > ISI_MARGIN*margin:
+            raise ValueError(f'The symbol duration {Tb} s is too short for {constellation.name} with the {pulse.name} pulse on channel {self.channel_id}: the filters distort the symbols by {isi:.3f}, more than {ISI_MARGIN:g} of the decision margin {margin:.3f}.')
+
+
+def _convolve(a, b):
+    """
+    The full convolution of `a` and `b` (real or complex), by FFT.
+    """
+
+    N = a.shape[0] + b.shape[0] - 1
+    Nfft = 1 << (N - 1).bit_length()
+    y = np.fft.ifft(np.fft.fft(a, Nfft) * np.fft.fft(b, Nfft))
+    return y[:N]
+
+
+def _decision_margin(constellation):
+    """
+    Half the minimum distance between the points of the constellation, 
+    relative to the magnitude of its largest point: the largest distortion
+    of a symbol that still leaves it closest to its own point.
+    """
+
+    p = constellation.points
+    d = np.abs(p[:, np.newaxis] - p[np.newaxis, :])
+    return np.min(d[d > 0]) / 2 / np.max(np.abs(p))
+
+
+@functools.lru_cache(maxsize=32)
+def channel_plan(channel_id: int, fs: float=48000, R_p: float=0.1, R_s: float=40, ftype: str='ellip'):
+    """
+    Returns the (cached) `ChannelPlan` of the channel `channel_id`.
+    """
+    return ChannelPlan(channel_id, fs, R_p, R_s, ftype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the carrier, filters, and symbol-duration limits of the channels.')
+    parser.add_argument('channel', type=int, nargs='*', help='channel ids (default: all)')
+    parser.add_argument('--fs', type=float, default=48000, help='sampling frequency in Hz (default: 48000)')
+    parser.add_argument('--rp', type=float, default=0.1, help='passband ripple in dB (default: 0.1)')
+    parser.add_argument('--rs', type=float, default=40, help='stopband attenuation in dB (default: 40)')
+    parser.add_argument('--ftype', choices=('ellip', 'cheby1'), default='ellip', help='filter family (default: ellip)')
+    args = parser.parse_args()
+
+    channel_ids = args.channel or range(1, wcs._channels.shape[1]-1)
+    print('channel  band [Hz]      fc [Hz]  bandpass  lowpass  Tb min rect/rrc [ms]')
+    for i in channel_ids:
+        plan = channel_plan(i, args.fs, args.rp, args.rs, args.ftype)
+        print(f'{i:7d}  {plan.f_low:4.0f}-{plan.f_high:4.0f}  {plan.fc:9.1f}  {plan.bandpass_order:8d}  {plan.lowpass_order:7d}  '
+              f'{1e3*plan.min_symbol_duration(wcs.RECT):6.2f}/{1e3*plan.min_symbol_duration(wcs.RRC):.2f}')
+
+
+if __name__ == "__main__":
+    main()
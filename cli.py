@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point of the wireless communication system project in
+Signals and Transforms.
+
+The subcommands run the scripts of the project, with the same arguments:
+$ python3 cli.py tx [-o path] "Hello World!"   (transmitter.py)
+$ python3 cli.py rx [capture.wav | -r path]    (reciever.py)
+$ python3 cli.py simulate "Hello World!"       (simulation.py)
+$ python3 cli.py bench startup                 (benchmark.py)
+
+Only the modules of the subcommand are imported, and only once it is known.
+The filters are loaded from the file filters.npz next to this script (or the
+file given by --filters or the environment variable WCS_FILTERS), and the
+filters designed by a run are added to it (see `filtercache.FilterCache`).
+Transmitting then only needs numpy, without the time it takes to import
+scipy.signal and design the filters, which dominates short transmissions.
+To measure the startup time of the subcommands, run:
+$ python3 cli.py bench startup
+"""
+
+import argparse
+import importlib
+import os
+
+# Module of each subcommand, and its description
+_COMMANDS = {
+    'tx': ('transmitter', 'Transmit a message (see transmitter.py)'),
+    'rx': ('reciever', 'Receive messages (see reciever.py)'),
+    'simulate': ('simulation', 'Simulate a transmission (see simulation.py)'),
+    'bench': ('benchmark', 'Run a benchmark (see benchmark.py)'),
+}
+
+# File of the precomputed filters, if not given by --filters or WCS_FILTERS
+DEFAULT_FILTERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filters.npz')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Wireless communication system.',
+        epilog='\n'.join(f'{name:9s} {help}' for name, (_, help) in _COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--filters', help=f'File of the precomputed filters (default: WCS_FILTERS or {DEFAULT_FILTERS})')
+    parser.add_argument('command', choices=_COMMANDS, help='Subcommand')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the subcommand')
+    args = parser.parse_args(argv)
+
+    # The shared filter cache reads the file from the environment when it is
+    # imported (with the subcommand's module)
+    if args.filters is not None:
+        os.environ['WCS_FILTERS'] = args.filters
+    else:
+        os.environ.setdefault('WCS_FILTERS', DEFAULT_FILTERS)
+
+    module = importlib.import_module(_COMMANDS[args.command][0])
+    module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Real-time full-duplex engine for the wireless communication system project
+in Signals and Transforms.
+
+One sound card stream both plays and records. Its callback only copies
+samples between the sound card and two ring buffers, everything else runs
+elsewhere:
+
+* `DuplexEngine.send()` encodes a message as packets (see packet.py) and
+  modulates and filters it on a worker thread of the event loop's executor,
+  and then queues the samples for playback as room becomes available in the
+  transmit ring buffer (backpressure: it waits instead of growing the
+  buffer).
+* A receive thread takes the recorded samples from the receive ring buffer
+  block by block, decodes them (see `stream.StreamingReceiver`), and hands
+  the completed packets to the event loop, where they are available by
+  iterating over the engine.
+
+The latency of a packet is thus bounded by the block size of the receive
+thread plus the packet's duration. Samples that the callback cannot store
+because the receive thread falls behind, and the overflows and underflows
+reported by the sound card, are counted (see `DuplexEngine.stats`).
+
+To send every line typed and print every packet received, run:
+$ python3 duplex.py
+"""
+
+import asyncio
+import sys
+import threading
+import numpy as np
+from scipy.signal import sosfilt
+import wcslib as wcs
+from channels import channel_plan
+from filtercache import local_oscillator
+from stream import DecimatingFrontEnd, StreamingReceiver
+import packet
+
+
+class RingBuffer:
+    """
+    Fixed-capacity FIFO of samples, shared by one writing and one reading
+    thread (e.g., the audio callback and a worker thread).
+
+    Parameters
+    ----------
+    capacity : int
+        Number of samples that can be stored.
+    dtype : numpy.dtype, default 'float32'
+        Sample format.
+    """
+
+    def __init__(self, capacity: int, dtype='float32'):
+        self._buf = np.zeros((capacity,), dtype=dtype)
+        self._lock = threading.Lock()
+        self._start = 0
+        self._size = 0
+
+    @property
+    def capacity(self):
+        """Number of samples that can be stored."""
+        return self._buf.shape[0]
+
+    def __len__(self):
+        return self._size
+
+    def write(self, x):
+        """
+        Appends as many samples of `x` as fit and returns their number.
+        """
+
+        with self._lock:
+            C = self.capacity
+            N = min(np.shape(x)[0], C - self._size)
+            k = (self._start + self._size) % C
+            n = min(N, C - k)
+            self._buf[k:k+n] = x[:n]
+            self._buf[:N-n] = x[n:N]
+            self._size += N
+        return N
+
+    def read(self, out):
+        """
+        Moves up to `len(out)` samples into `out` and returns their number.
+        """
+
+        with self._lock:
+            C = self.capacity
+            N = min(np.shape(out)[0], self._size)
+            k = self._start
+            n = min(N, C - k)
+            out[:n] = self._buf[k:k+n]
+            out[n:N] = self._buf[:N-n]
+            self._start = (k + N) % C
+            self._size -= N
+        return N
+
+    def clear(self):
+        """Discards all samples."""
+        with self._lock:
+            self._start = 0
+            self._size = 0
+
+
+class DuplexEngine:
+    """
+    Transmits and receives packets at the same time over the sound card,
+    see the module documentation.
+
+    Use as an asynchronous context manager:
+
+        async with DuplexEngine() as engine:
+            await engine.send(b'Hello World!')
+            async for payload, ok in engine:
+                ...
+
+    Parameters
+    ----------
+    fs : int, default 48000
+        Sampling frequency in Hz.
+    channel_id : int, default 15
+        The channel, which determines the carrier and the filters (see
+        `channels.ChannelPlan`).
+    Tb : float, default 0.02
+        Symbol duration in seconds.
+    blocksize : int, default 4800
+        Number of samples decoded at a time by the receive thread.
+    buffer : float, default 2.0
+        Capacity of the ring buffers in seconds.
+    guard : float, default 0.1
+        Silence after every message in seconds, so that the receiver
+        detects the end of its transmission before the next one starts.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        Modulation.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        Pulse shape.
+    track : bool, default True
+        Track the symbol timing and the carrier phase of the received 
+        packets (see `wcslib.BasebandDecoder`).
+    device : int or str, optional
+        The sound card (see sounddevice); the default device if not given.
+    max_frames : int, default 256
+        Number of received packets that are kept until they are read; older
+        ones are dropped (and counted) once it is exceeded.
+    """
+
+    def __init__(self, fs: int=48000, channel_id: int=15, Tb: float=0.02, blocksize: int=4800, buffer: float=2.0, guard: float=0.1, constellation=wcs.BPSK, pulse=wcs.RECT, track: bool=True, device=None, max_frames: int=256):
+        self.fs = fs
+        self.Tb = Tb
+        self.blocksize = blocksize
+        self.guard = guard
+        self.constellation = constellation
+        self.pulse = pulse
+        self.device = device
+        self.max_frames = max_frames
+
+        # Transmitter: bandpass filter and carrier
+        plan = channel_plan(channel_id, fs)
+        plan.check_symbol_duration(Tb, pulse, constellation)
+        self._sos = plan.bandpass
+        self._lo = local_oscillator(fs, plan.fc)
+
+        # Receiver (see reciever.py)
+        decimation = 16
+        h_low = plan.decimation_filter(decimation)
+        frontend = DecimatingFrontEnd(fs, plan.fc, self._sos, h_low, decimation, 'float32')
+        self.receiver = StreamingReceiver(frontend, Tb, constellation=constellation, pulse=pulse, track=track)
+        self._packets = packet.PacketDecoder()
+
+        # Ring buffers between the audio callback and the rest
+        self._tx = RingBuffer(int(buffer*fs))
+        self._rx = RingBuffer(int(buffer*fs))
+        self._rx_ready = threading.Event()
+        self._stop = threading.Event()
+        self._send_lock = None
+        self._frames = None
+        self._loop = None
+        self._thread = None
+        self._stream = None
+
+        # Counters
+        self.input_overflows = 0
+        self.output_underflows = 0
+        self.rx_dropped = 0
+        self.frames_dropped = 0
+
+    @property
+    def stats(self):
+        """
+        The counters: overflows and underflows reported by the sound card,
+        recorded samples dropped because the receive thread fell behind, and
+        received packets dropped because they were not read in time.
+        """
+        return {
+            'input_overflows': self.input_overflows,
+            'output_underflows': self.output_underflows,
+            'rx_dropped': self.rx_dropped,
+            'frames_dropped': self.frames_dropped,
+        }
+
+    async def start(self):
+        """
+        Starts the receive thread and the sound card stream.
+        """
+
+        # Only needed when running, the DSP works without a sound card
+        import sounddevice as sd
+
+        self._loop = asyncio.get_running_loop()
+        self._send_lock = asyncio.Lock()
+        self._frames = asyncio.Queue()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._receive, name='duplex-rx', daemon=True)
+        self._thread.start()
+
+        self._stream = sd.Stream(samplerate=self.fs, channels=1, dtype='float32', device=self.device, callback=self._callback)
+        self._stream.start()
+
+    async def close(self):
+        """
+        Stops the sound card stream and the receive thread.
+        """
+
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        self._stop.set()
+        self._rx_ready.set()
+        if self._thread is not None:
+            await self._loop.run_in_executor(None, self._thread.join)
+            self._thread = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def send(self, data):
+        """
+        Transmits the bytes `data`. Returns once all of its samples are
+        queued for playback, waiting for room in the transmit buffer if
+        needed; messages sent concurrently are transmitted one after the
+        other. Raises a RuntimeError if the engine is not started.
+        """
+
+        self._check_started()
+        x = await self._loop.run_in_executor(None, self._modulate, bytes(data))
+        poll = self.blocksize/self.fs/4
+        async with self._send_lock:
+            k = 0
+            while True:
+                k += self._tx.write(x[k:])
+                if k == x.shape[0]:
+                    break
+                await asyncio.sleep(poll)
+
+    async def drain(self):
+        """
+        Waits until all queued samples have been played.
+        """
+        while len(self._tx):
+            await asyncio.sleep(self.blocksize/self.fs/4)
+
+    async def receive(self):
+        """
+        Waits for the next received packet and returns it as a tuple
+        (payload, ok), see `packet.PacketDecoder.push()`. Raises a 
+        RuntimeError if the engine is not started.
+        """
+        self._check_started()
+        return await self._frames.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.receive()
+
+    def _check_started(self):
+        if self._loop is None:
+            raise RuntimeError('The engine is not started, call start() first (or use it as an asynchronous context manager).')
+
+    def _modulate(self, data):
+        """
+        The transmitted signal of the message `data`, followed by the guard
+        interval (runs on a worker thread).
+        """
+
+        bits = packet.encode_packets(data)
+        xb = wcs.encode_baseband_signal(bits, self.Tb, self.fs, constellation=self.constellation, pulse=self.pulse)
+        x = sosfilt(self._sos, self._lo.modulate(xb))
+        return np.concatenate((x, np.zeros(int(self.guard*self.fs)))).astype(np.float32)
+
+    def _callback(self, indata, outdata, frames, time, status):
+        """
+        Sound card callback: only moves samples between the sound card and
+        the ring buffers.
+        """
+
+        if status.input_overflow:
+            self.input_overflows += 1
+        if status.output_underflow:
+            self.output_underflows += 1
+
+        self.rx_dropped += frames - self._rx.write(indata[:, 0])
+        self._rx_ready.set()
+
+        n = self._tx.read(outdata[:, 0])
+        outdata[n:] = 0
+
+    def _receive(self):
+        """
+        Receive thread: decodes the recorded samples block by block and
+        passes the completed packets to the event loop.
+        """
+
+        x = np.zeros((self.blocksize,), dtype=np.float32)
+        while not self._stop.is_set():
+            self._rx_ready.clear()
+            if len(self._rx) < self.blocksize:
+                self._rx_ready.wait(self.blocksize/self.fs)
+                continue
+
+            self._rx.read(x)
+            for frame in self._packets.push(self.receiver.process(x)):
+                self._loop.call_soon_threadsafe(self._deliver, frame)
+
+    def _deliver(self, frame):
+        """
+        Queues a received packet (on the event loop), dropping the oldest if
+        `max_frames` are waiting.
+        """
+
+        if self._frames.qsize() >= self.max_frames:
+            self._frames.get_nowait()
+            self.frames_dropped += 1
+        self._frames.put_nowait(frame)
+
+
+async def chat(engine):
+    """
+    Sends every line read from the standard input and prints every packet
+    received (including the own ones, if the microphone picks them up).
+    """
+
+    async def show():
+        async for payload, ok in engine:
+            text = payload.decode(errors='replace') if ok else '[corrupt frame]'
+            print(f'Received: "{text}"', flush=True)
+
+    receiving = asyncio.create_task(show())
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            await engine.send(line.rstrip('\n').encode())
+        await engine.drain()
+        await asyncio.sleep(engine.guard + 2*engine.blocksize/engine.fs)
+    finally:
+        receiving.cancel()
+    print(engine.stats, file=sys.stderr)
+
+
+async def main():
+    device = sys.argv[1] if len(sys.argv) == 2 else None
+    if device is not None and device.isdigit():
+        device = int(device)
+    async with DuplexEngine(device=device) as engine:
+        print('Type messages to send (Ctrl+D to stop)', file=sys.stderr)
+        await chat(engine)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caches for the filters and carriers of the wireless communication system
+project in Signals and Transforms.
+
+* `FilterCache` memoizes designed filters (second-order sections), their
+  minimum orders, and their impulse responses, so that sweeps and
+  long-running receivers design each filter only once. The cache is bounded
+  (least recently used filters are evicted first) and can be persisted to
+  disk. The shared cache `filters` is persisted to the file given by the
+  environment variable WCS_FILTERS, if set; once the filters are in the
+  file, they are loaded with numpy alone, without importing scipy.signal.
+* `minimum_order()` finds the lowest filter order that meets a passband and
+  stopband specification.
+* `LocalOscillator` holds one period of the carrier at the sampling
+  frequency, which is tiled or indexed instead of evaluating sin/cos for
+  every sample.
+"""
+
+import collections
+import fractions
+import functools
+import os
+import numpy as np
+
+
+class FilterCache:
+    """
+    Bounded, optionally persistent cache of Chebyshev type I and elliptic
+    filters, keyed by (btype, fs, band, order, R_p, R_s, ftype), of their
+    minimum orders, and of their impulse responses.
+
+    Parameters
+    ----------
+    maxsize : int, default 32
+        Maximum number of filters (and orders and impulse responses) kept in
+        memory.
+    path : str, optional
+        Path to an .npz file to persist the filters to. Filters found in the
+        file are loaded on creation, and the file is rewritten whenever a new
+        filter is designed.
+    """
+
+    def __init__(self, maxsize: int=32, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self._filters = collections.OrderedDict()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._filters)
+
+    def get(self, btype: str, fs: float, band, order: int, R_p: float, R_s: float=None, ftype: str='cheby1'):
+        """
+        Returns the second-order sections of a Chebyshev type I or elliptic
+        filter, designing it if it is not cached.
+
+        Parameters
+        ----------
+        btype : str
+            Filter type, 'lowpass', 'highpass', 'bandpass', or 'bandstop'.
+        fs : float
+            Sampling frequency in Hz.
+        band : float or tuple of float
+            Cutoff frequency, or lower and upper passband frequencies in Hz.
+        order : int
+            Filter order.
+        R_p : float
+            Passband ripple in dB.
+        R_s : float, optional
+            Stopband attenuation in dB, required for elliptic filters (a
+            Chebyshev type I filter's attenuation follows from its order).
+        ftype : str, default 'cheby1'
+            Filter family, 'cheby1' or 'ellip'.
+
+        Returns
+        -------
+        sos : numpy.array
+            Second-order sections of the filter. The array is shared between
+            all callers and must not be modified (it is not flagged read-only
+            since scipy.signal.sosfilt() does not accept read-only arrays).
+        """
+
+        key = _filter_key(btype, fs, band, order, R_p, R_s, ftype)
+        sos = self._lookup(key)
+        if sos is not None:
+            return sos
+
+        # Normalize frequencies by Nyquist frequency and design the filter
+        from scipy.signal import cheby1, ellip
+        nyquist = fs / 2
+        W_p = [f / nyquist for f in key[2]]
+        W_p = W_p if len(W_p) > 1 else W_p[0]
+        if ftype == 'ellip':
+            sos = ellip(N=order, rp=R_p, rs=R_s, Wn=W_p, btype=btype, output='sos')
+        else:
+            sos = cheby1(N=order, rp=R_p, Wn=W_p, btype=btype, output='sos')
+        self._store(key, sos)
+
+        return sos
+
+    def order(self, ftype: str, fs: float, passband, stopband, R_p: float, R_s: float):
+        """
+        Returns the lowest order of a filter that meets the specifications,
+        finding it if it is not cached; see `minimum_order()` for the
+        parameters.
+        """
+
+        key = ('order', ftype, float(fs), _floats(passband), _floats(stopband), float(R_p), float(R_s))
+        order = self._lookup(key)
+        if order is None:
+            order = np.array(minimum_order(ftype, fs, passband, stopband, R_p, R_s))
+            self._store(key, order)
+        return int(order)
+
+    def impulse_response(self, btype: str, fs: float, band, order: int, R_p: float, R_s: float=None, ftype: str='cheby1'):
+        """
+        Returns the impulse response of a filter (see `get()` for the
+        parameters), computing it if it is not cached. The response is
+        truncated once the energy of the rest falls below 1e-20 of the
+        total, so that filtering by convolution with it gives the same
+        result as scipy.signal.sosfilt() up to relative errors of about
+        1e-10. The array is shared between all callers and read-only.
+        """
+
+        key = ('impulse',) + _filter_key(btype, fs, band, order, R_p, R_s, ftype)
+        h = self._lookup(key)
+        if h is not None:
+            return h
+
+        # Filter an impulse, doubling the length until the response has
+        # decayed
+        from scipy.signal import sosfilt
+        sos = self.get(btype, fs, band, order, R_p, R_s, ftype)
+        N = int(fs)
+        while True:
+            x = np.zeros(N)
+            x[0] = 1
+            h = sosfilt(sos, x)
+            tail = np.cumsum(h[::-1]**2)[::-1]
+            if tail[-N//4] < _IMPULSE_TOLERANCE*tail[0]:
+                break
+            N *= 2
+        h = h[:np.argmax(tail < _IMPULSE_TOLERANCE*tail[0])]
+        h.flags.writeable = False
+        self._store(key, h)
+
+        return h
+
+    def clear(self):
+        """Removes all filters from the cache (not from the file)."""
+        self._filters.clear()
+
+    def save(self, path):
+        """
+        Saves the cached filters to the .npz file `path`. The file is
+        replaced at once, so that processes loading it concurrently never
+        see a partially written file.
+        """
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **{_encode_key(key): sos for key, sos in self._filters.items()})
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """
+        Loads the filters saved in the .npz file `path` into the cache.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            for name in data.files:
+                key = _decode_key(name)
+                value = data[name]
+                if key[0] == 'impulse':
+                    value.flags.writeable = False
+                self._insert(key, value)
+
+    def _lookup(self, key):
+        value = self._filters.get(key)
+        if value is not None:
+            self._filters.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        self._insert(key, value)
+        if self.path is not None:
+            self.save(self.path)
+
+    def _insert(self, key, sos):
+        self._filters[key] = sos
+        self._filters.move_to_end(key)
+        while len(self._filters) > self.maxsize:
+            self._filters.popitem(last=False)
+
+
+# Relative energy of the truncated tail of the impulse responses (see
+# `FilterCache.impulse_response()`)
+_IMPULSE_TOLERANCE = 1e-20
+
+
+def _floats(band):
+    return tuple(float(f) for f in np.atleast_1d(band))
+
+
+def _filter_key(btype, fs, band, order, R_p, R_s, ftype):
+    if ftype not in ('cheby1', 'ellip'):
+        raise ValueError(f'Unknown filter type {ftype!r}.')
+    if ftype == 'ellip' and R_s is None:
+        raise ValueError('The stopband attenuation R_s is required for elliptic filters.')
+    R_s = None if ftype == 'cheby1' else float(R_s)
+    return (btype, float(fs), _floats(band), int(order), float(R_p), R_s, ftype)
+
+
+def _encode_key(key):
+    if key[0] == 'order':
+        ftype, fs, passband, stopband, R_p, R_s = key[1:]
+        return '|'.join(('order', ftype, repr(fs), ','.join(map(repr, passband)), ','.join(map(repr, stopband)), repr(R_p), repr(R_s)))
+    if key[0] == 'impulse':
+        return 'impulse|' + _encode_key(key[1:])
+    btype, fs, band, order, R_p, R_s, ftype = key
+    return '|'.join((btype, repr(fs), ','.join(map(repr, band)), str(order), repr(R_p), '' if R_s is None else repr(R_s), ftype))
+
+
+def _decode_key(name):
+    if name.startswith('order|'):
+        _, ftype, fs, passband, stopband, R_p, R_s = name.split('|')
+        return ('order', ftype, float(fs), tuple(float(f) for f in passband.split(',')), tuple(float(f) for f in stopband.split(',')), float(R_p), float(R_s))
+    if name.startswith('impulse|'):
+        return ('impulse',) + _decode_key(name[len('impulse|'):])
+
+    # Files written before elliptic filters were supported only hold
+    # Chebyshev type I filters, without R_s and ftype
+    fields = name.split('|')
+    if len(fields) == 5:
+        fields += ['', 'cheby1']
+    btype, fs, band, order, R_p, R_s, ftype = fields
+    return (btype, float(fs), tuple(float(f) for f in band.split(',')), int(order), float(R_p), float(R_s) if R_s else None, ftype)
+
+
+# Cache shared by create_bandpass_filter() and create_lowpass_filter()
+filters = FilterCache(path=os.environ.get('WCS_FILTERS'))
+
+
+@functools.lru_cache(maxsize=128)
+def minimum_order(ftype: str, fs: float, passband, stopband, R_p: float, R_s: float):
+    """
+    Returns the lowest order of a Chebyshev type I or elliptic filter with at
+    most `R_p` dB ripple in the passband and at least `R_s` dB attenuation in
+    the stopband (see scipy.signal.cheb1ord() and ellipord()).
+
+    Parameters
+    ----------
+    ftype : str
+        Filter family, 'cheby1' or 'ellip'.
+    fs : float
+        Sampling frequency in Hz.
+    passband : float or tuple of float
+        Passband edge, or lower and upper passband edges in Hz.
+    stopband : float or tuple of float
+        Stopband edge, or lower and upper stopband edges in Hz.
+    R_p : float
+        Passband ripple in dB.
+    R_s : float
+        Stopband attenuation in dB.
+
+    Returns
+    -------
+    order : int
+        The filter order (of the lowpass prototype, i.e., a bandpass filter
+        has twice as many poles).
+    """
+
+    from scipy.signal import cheb1ord, ellipord
+    design = {'cheby1': cheb1ord, 'ellip': ellipord}.get(ftype)
+    if design is None:
+        raise ValueError(f'Unknown filter type {ftype!r}.')
+    order, _ = design(passband, stopband, R_p, R_s, fs=fs)
+    return int(order)
+
+
+class LocalOscillator:
+    """
+    One period of a carrier of frequency `fc` sampled at `fs`.
+
+    The period is the smallest number of samples `P` such that `fc*P/fs` is
+    an integer (e.g., 120 samples for 4400 Hz at 48 kHz). The carrier at
+    samples n0, n0+1, ..., n0+N-1 is then obtained by tiling the table.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    fc : float
+        Carrier frequency in Hz; `fc/fs` must be a ratio of integers with a
+        denominator of at most `fs`.
+    """
+
+    def __init__(self, fs: float, fc: float):
+        ratio = fractions.Fraction(fc/fs).limit_denominator(int(fs))
+        if abs(float(ratio) - fc/fs) > 1e-12:
+            raise ValueError(f'The carrier {fc} Hz is not periodic at {fs} Hz with a period of at most {int(fs)} samples.')
+        self.fs = fs
+        self.fc = fc
+        self.period = ratio.denominator
+
+        k = np.arange(self.period)
+        self._cos = np.cos(2 * np.pi * fc * k / fs)
+        self._sin = np.sin(2 * np.pi * fc * k / fs)
+        self._cos.flags.writeable = False
+        self._sin.flags.writeable = False
+
+    def cos(self, N: int, n0: int=0):
+        """
+        Returns cos(2*pi*fc*k/fs) for k = n0, ..., n0+N-1.
+        """
+        return _tile(self._cos, N, n0 % self.period)
+
+    def sin(self, N: int, n0: int=0):
+        """
+        Returns sin(2*pi*fc*k/fs) for k = n0, ..., n0+N-1.
+        """
+        return _tile(self._sin, N, n0 % self.period)
+
+    def modulate(self, xb, n0: int=0):
+        """
+        Modulates the baseband signal `xb` (starting at sample n0) onto the
+        carrier: `xb*sin(wc*k)` for a real signal (BPSK), and
+        `xb.real*sin(wc*k) + xb.imag*cos(wc*k)` for a complex one, see
+        `wcslib.encode_baseband_signal()`.
+        """
+
+        N = np.shape(xb)[-1]
+        if not np.iscomplexobj(xb):
+            return xb * self.sin(N, n0)
+        return xb.real * self.sin(N, n0) + xb.imag * self.cos(N, n0)
+
+    def table(self, N: int, dtype=float):
+        """
+        Returns the cosine and sine at k = 0, ..., N+period-2 as arrays of
+        `dtype`, so that the carrier at samples n0, ..., n0+N-1 (for any n0)
+        is the slice `[n0 % period:n0 % period + N]` of the arrays, without
+        copying.
+        """
+
+        Nt = N + self.period - 1
+        return _tile(self._cos, Nt, 0).astype(dtype), _tile(self._sin, Nt, 0).astype(dtype)
+
+
+def _tile(table, N, offset):
+    return np.resize(np.concatenate((table[offset:], table[:offset])), N)
+
+
+@functools.lru_cache(maxsize=32)
+def local_oscillator(fs: float, fc: float):
+    """
+    Returns the (cached) `LocalOscillator` for the carrier `fc` at `fs`.
+    """
+    return LocalOscillator(fs, fc)
@@ -1,44 +1,44 @@
 import numpy as np
 from scipy.signal import sosfreqz
 import matplotlib.pyplot as plt
-from bandpass import create_bandpass_filter
-from lowpass import create_lowpass_filter
+from channels import channel_plan
 
 # Properties
+channel_id = 15  # Group number
 fs = 48000  # Sampling frequency
-f_low, f_high = 4300, 4500  # Passband frequencies
-f_stop_low, f_stop_high = 4250, 4550  # Stopband frequencies
-R_p = 1     # Passband ripple
+R_p = 0.1   # Passband ripple
 R_s = 40    # Stopband attenuation
 
-# Create the bandpass filter
-sos = create_bandpass_filter(fs, f_low, f_high, R_p, R_s)
+# Passband and stopband frequencies of the channel (see channels.py)
+plan = channel_plan(channel_id, fs, R_p, R_s)
+f_low, f_high = plan.f_low, plan.f_high  # Passband frequencies
+f_stop_low, f_stop_high = plan.f_stop_low, plan.f_stop_high  # Stopband frequencies
+
+# Create the bandpass filter (of the lowest order that meets the specifications)
+sos = plan.bandpass
+family = {'ellip': 'Elliptic', 'cheby1': 'Chebyshev Type I'}[plan.ftype]
 
 # Compute the frequency response of the bandpass filter
 worN = 10000 # Increases the graphical resolution
 frequencies, h = sosfreqz(sos, worN=worN, fs=fs)
 
 # Plot range for bandpass
-freq_range_mask_bp = (frequencies >= 4100) & (frequencies <= 4700)
-
-# Lowpass filter specifications
-fl_cutoff = 250  # Cutoff frequency
-fls = 48000  # Sampling frequency
-lR_p = 1  # Passband ripple
-lR_s = 40  # Stopband attenuation
+freq_range_mask_bp = (frequencies >= f_stop_low - 150) & (frequencies <= f_stop_high + 150)
 
-# Normalize frequency
-nyquist = fs / 2
-Wn = fl_cutoff / nyquist
+# Lowpass filter specifications (passing the baseband signal, and stopping
+# the image at twice the carrier)
+fl_cutoff = plan.f_cutoff  # Cutoff frequency
+fl_stop = plan.f_image  # Stopband edge
+fls = fs  # Sampling frequency
 
 # Create the lowpass filter
-sos_lowpass = create_lowpass_filter(fls, fl_cutoff, lR_p, lR_s)
+sos_lowpass = plan.lowpass
 
 # Compute the frequency response of the lowpass filter
 frequencies_lowpass, h_lowpass = sosfreqz(sos_lowpass, worN=worN, fs=fls)
 
 # Plot range for lowpass
-freq_range_mask_lp = (frequencies_lowpass >= 0) & (frequencies_lowpass <= 400)
+freq_range_mask_lp = (frequencies_lowpass >= 0) & (frequencies_lowpass <= fl_stop + 1000)
 
 # Create the merged plot
 plt.figure(figsize=(12, 6))
@@ -53,7 +53,7 @@ plt.axvline(f_stop_low, color='red', linestyle='--',
             label="Stopband Lower Edge")
 plt.axvline(f_stop_high, color='red', linestyle='--',
             label="Stopband Upper Edge")
-plt.title('Chebyshev Type I Bandpass Filter Frequency Response (4000–4800 Hz)')
+plt.title(f'{family} Bandpass Filter Frequency Response (order {plan.bandpass_order})')
 plt.xlabel('Frequency [Hz]')
 plt.ylabel('Magnitude [dB]')
 plt.legend()
@@ -63,8 +63,8 @@ plt.subplot(1, 2, 2)
 plt.plot(frequencies_lowpass[freq_range_mask_lp], 20 * np.log10(np.abs(
     h_lowpass[freq_range_mask_lp])), label='Lowpass Filter Frequency Response')
 plt.axvline(fl_cutoff, color='green', linestyle='--', label="Cutoff Frequency")
-plt.axvline(fl_cutoff+50, color='red', linestyle='--', label="Stopband Edge")
-plt.title('Chebyshev Type I Lowpass Filter Frequency Response')
+plt.axvline(fl_stop, color='red', linestyle='--', label="Stopband Edge")
+plt.title(f'{family} Lowpass Filter Frequency Response (order {plan.lowpass_order})')
 plt.xlabel('Frequency [Hz]')
 plt.ylabel('Magnitude [dB]')
 plt.legend()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the wireless communication system project in
+Signals and Transforms.
+
+The stages of the transmitter and receiver chain (in wcslib, stream,
+batchsim, simulation.py, and reciever.py) are wrapped in `stage()` blocks
+or decorated with `traced()`. While no hook is registered, these do nothing
+but check an empty list. Once a hook is registered, every stage calls it
+with a record (a dict) holding
+
+* 'stage': the name of the stage,
+* 'depth': the nesting depth (0 for the outermost stage),
+* 't': the wall time in seconds,
+* 'samples': the number of input samples (along the last axis),
+* 'out_shape' and 'out_bytes': the shape and size of the output array,
+* 'alloc_bytes' and 'peak_bytes': the memory retained after and allocated
+  at most during the stage, if allocation tracking is enabled (None
+  otherwise).
+
+For example, to collect the records of a simulation:
+
+    with instrument.recording(instrument.Recorder()) as recorder:
+        b_hat, valid = batchsim.simulate_batch(...)
+    print(instrument.format_summary(recorder.summary()))
+
+The scripts enable a JSON lines log on stderr (or to the file given as the
+value) when the environment variable WCS_INSTRUMENT is set, see
+`from_environ()`. Note that hooks are per process: `batchsim.ber_sweep()`
+only reports its stages when run with `workers=1`.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# Registered hooks, and whether allocations are tracked
+_hooks = []
+_allocations = False
+
+# Stack of the active stages
+_active = []
+
+
+class _Stage:
+    """
+    An active stage, see `stage()`.
+    """
+
+    __slots__ = ('name', 'samples', 'out_shape', 'out_bytes', '_t0', '_mem0', '_peak')
+
+    def __init__(self, name, x):
+        self.name = name
+        self.samples = np.shape(x)[-1] if np.ndim(x) > 0 else None
+        self.out_shape = None
+        self.out_bytes = None
+
+    def output(self, y):
+        """
+        Records the output array `y` of the stage, and returns it.
+        """
+
+        self.out_shape = np.shape(y)
+        self.out_bytes = getattr(y, 'nbytes', None)
+        return y
+
+    def __enter__(self):
+        if _allocations and tracemalloc.is_tracing():
+            # The peak of the enclosing stage so far is kept before the peak
+            # is reset for this stage
+            mem, peak = tracemalloc.get_traced_memory()
+            if _active:
+                _active[-1]._peak = max(_active[-1]._peak, peak)
+            tracemalloc.reset_peak()
+            self._mem0, self._peak = mem, mem
+        else:
+            self._mem0 = None
+        _active.append(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t = time.perf_counter() - self._t0
+        _active.pop()
+        alloc = peak = None
+        if self._mem0 is not None and tracemalloc.is_tracing():
+            mem, peak = tracemalloc.get_traced_memory()
+            alloc = mem - self._mem0
+            peak = max(self._peak, peak) - self._mem0
+
+        record = {
+            'stage': self.name, 'depth': len(_active), 't': t,
+            'samples': self.samples,
+            'out_shape': list(self.out_shape) if self.out_shape is not None else None,
+            'out_bytes': self.out_bytes,
+            'alloc_bytes': alloc, 'peak_bytes': peak,
+        }
+        for hook in list(_hooks):
+            hook(record)
+
+        return False
+
+
+class _NullStage:
+    """
+    The stage used while instrumentation is disabled.
+    """
+
+    __slots__ = ()
+
+    def output(self, y):
+        return y
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+def stage(name: str, x=None):
+    """
+    Returns a context manager instrumenting the stage `name`, processing the
+    input array `x`. The output of the stage can be recorded by passing it
+    to the `output()` method of the context manager:
+
+        with instrument.stage('lowpass', iq) as st:
+            iq = st.output(sosfilt(sos, iq, axis=-1))
+    """
+
+    if not _hooks:
+        return _null_stage
+    return _Stage(name, x)
+
+
+def traced(name: str):
+    """
+    Decorator instrumenting a function as the stage `name`. The first array
+    argument (after `self` for methods) is taken as the input, the return
+    value (or its first element, for tuples) as the output.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return fn(*args, **kwargs)
+            x = next((a for a in args if isinstance(a, np.ndarray)), None)
+            with _Stage(name, x) as st:
+                y = fn(*args, **kwargs)
+                st.output(y[0] if isinstance(y, tuple) else y)
+            return y
+        return wrapper
+    return decorator
+
+
+def enabled():
+    """True if any hook is registered."""
+    return bool(_hooks)
+
+
+def add_hook(hook, allocations: bool=False):
+    """
+    Registers the callable `hook`, which is called with the record of every
+    completed stage. If `allocations` is True, memory allocations are traced
+    with tracemalloc (which slows numpy down noticeably) until all hooks are
+    removed.
+    """
+
+    global _allocations
+    _hooks.append(hook)
+    if allocations:
+        _allocations = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def remove_hook(hook):
+    """
+    Unregisters `hook`. Tracing of allocations stops with the last hook.
+    """
+
+    global _allocations
+    _hooks.remove(hook)
+    if not _hooks and _allocations:
+        _allocations = False
+        tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def recording(hook, allocations: bool=False):
+    """
+    Context manager registering `hook` (see `add_hook()`) for the duration
+    of the block, and yielding it.
+    """
+
+    add_hook(hook, allocations)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+class Recorder:
+    """
+    Hook collecting the records in the list `records`.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def summary(self):
+        """
+        Returns the totals per stage, in the order the stages first
+        completed.
+
+        Returns
+        -------
+        rows : list of dict
+            One row per stage with the keys 'stage', 'calls', 't' (total
+            wall time), 'samples' (total input samples), 'samples_per_s', and
+            'peak_bytes' (largest peak, None if not tracked).
+        """
+
+        totals = {}
+        for r in self.records:
+            s = totals.setdefault(r['stage'], {'stage': r['stage'], 'calls': 0, 't': 0.0, 'samples': 0, 'peak_bytes': None})
+            s['calls'] += 1
+            s['t'] += r['t']
+            s['samples'] += r['samples'] or 0
+            if r['peak_bytes'] is not None:
+                s['peak_bytes'] = max(s['peak_bytes'] or 0, r['peak_bytes'])
+
+        rows = list(totals.values())
+        for s in rows:
+            s['samples_per_s'] = s['samples']/s['t'] if s['t'] > 0 else None
+        return rows
+
+
+def format_summary(rows):
+    """
+    Formats the rows returned by `Recorder.summary()` as a plain text table.
+    """
+
+    lines = [f'{"stage":>22} {"calls":>6} {"time [s]":>9} {"samples":>10} {"samples/s":>9} {"peak [MiB]":>10}']
+    for r in rows:
+        rate = f'{r["samples_per_s"]:9.2e}' if r['samples_per_s'] else f'{"-":>9}'
+        peak = f'{r["peak_bytes"]/2**20:10.2f}' if r['peak_bytes'] is not None else f'{"-":>10}'
+        lines.append(f'{r["stage"]:>22} {r["calls"]:6d} {r["t"]:9.5f} {r["samples"]:10d} {rate} {peak}')
+    return '\n'.join(lines)
+
+
+def log_hook(logger=None, level: int=logging.INFO):
+    """
+    Returns a hook logging every record as a JSON object to `logger` (the
+    'wcs.instrument' logger if not given).
+    """
+
+    logger = logger or logging.getLogger('wcs.instrument')
+
+    def hook(record):
+        logger.log(level, json.dumps(record))
+    return hook
+
+
+def json_lines_hook(f):
+    """
+    Returns a hook writing every record as one line of JSON to the text
+    file `f`.
+    """
+
+    def hook(record):
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+    return hook
+
+
+def from_environ():
+    """
+    Registers a JSON lines hook if the environment variable WCS_INSTRUMENT is
+    set: on stderr if its value is 1, otherwise to the file it names.
+    Allocations are tracked if WCS_INSTRUMENT_ALLOCATIONS is set to 1.
+
+    Returns
+    -------
+    enabled : bool
+        True if instrumentation was enabled.
+    """
+
+    target = os.environ.get('WCS_INSTRUMENT')
+    if not target:
+        return False
+
+    f = sys.stderr if target == '1' else open(target, 'a')
+    add_hook(json_lines_hook(f), os.environ.get('WCS_INSTRUMENT_ALLOCATIONS') == '1')
+    return True
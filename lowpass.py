@@ -1,15 +1,39 @@
-from scipy.signal import cheby1
+import functools
+from filtercache import filters
 
-# Function to create a Chebyshev Type I lowpass filter of order 6.
+# Function to create a Chebyshev Type I (or elliptic) lowpass filter.
 # Great roll-off and infinite attenuation helps to not disturb other channels.
+# If the stopband edge is given, the filter has the lowest order that keeps
+# the ripple in the passband below R_p and attenuates the stopband by at least
+# R_s (see `channels.ChannelPlan`); otherwise it has order 6.
+# The designed filters are cached, so repeated calls with the same
+# specifications are cheap (and return the same array, which must not be modified).
 
-def create_lowpass_filter(fs, f_cutoff, R_p, R_s):
+def create_lowpass_filter(fs, f_cutoff, R_p, R_s, f_stop=None, ftype='cheby1'):
 
-    # Normalize frequency by Nyquist frequency
-    nyquist = fs / 2
-    Wn = f_cutoff / nyquist
+    # Find the minimum order that meets the specifications
+    order = 6
+    if f_stop is not None:
+        order = filters.order(ftype, fs, f_cutoff, f_stop, R_p, R_s)
 
     # Design the filter using second-order sections for performance and stability improvements
-    sos = cheby1(N=6, rp=R_p, Wn=Wn, btype='lowpass', output='sos')
+    # (frequency is normalized by the Nyquist frequency in the cache)
+    sos = filters.get('lowpass', fs, f_cutoff, order, R_p, R_s, ftype)
     return sos
 
+
+# Function to create a linear-phase FIR lowpass filter (Kaiser window) for
+# decimating the IQ-demodulated baseband signal by `decimation`. The passband
+# ends at f_cutoff, and the stopband (attenuated by R_s) starts at f_stop
+# (twice f_cutoff if not given), or earlier if needed so that nothing aliases
+# into the passband.
+# The designed filters are cached as well.
+
+@functools.lru_cache(maxsize=32)
+def create_decimation_filter(fs, f_cutoff, R_s, decimation, f_stop=None):
+    from scipy.signal import firwin, kaiserord
+
+    f_stop = min(2 * f_cutoff if f_stop is None else f_stop, fs / decimation - f_cutoff)
+    numtaps, beta = kaiserord(R_s, (f_stop - f_cutoff) / (fs / 2))
+    h = firwin(numtaps, (f_cutoff + f_stop) / 2, window=('kaiser', beta), fs=fs)
+    return h
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packet framing for the wireless communication system project in Signals and
+Transforms.
+
+Messages are sent as packets on top of the bits of
+`wcslib.encode_baseband_signal()`:
+
+    preamble (32 bits) | length (16 bits) | header CRC (16 bits) |
+    payload (length bytes) | payload CRC (16 bits)
+
+The preamble is the attached sync marker 0x1ACFFC1D, whose autocorrelation
+sidelobes are low, so that it is unlikely to be found at a shifted position.
+The CRCs are CRC-16 (CCITT), see `fec.crc16()`.
+
+The receiver (`PacketDecoder`) hunts for the preamble in the stream of
+decoded bits at every bit position (allowing a few bit errors), so packets
+need not be byte-aligned: if the baseband decoder loses or inserts a bit, or
+loses the transmission and resynchronizes, only the packet in which that
+happens is lost. A packet is accepted once its header CRC matches, and
+delivered as soon as its last bit has been received (flagged if its payload
+CRC does not match), after which the hunt continues. A preamble whose header
+CRC does not match is reported as a corrupt packet with an empty payload. Hence, a receiver that
+runs indefinitely receives any number of back-to-back messages, each with a
+latency of one packet.
+
+To transmit a message:
+
+    bits = packet.encode_packets('Hello World!'.encode())
+    xb = wcs.encode_baseband_signal(bits, Tb, fs)
+
+and to receive the packets in a stream of bytes (e.g., from
+`stream.StreamingReceiver`):
+
+    decoder = packet.PacketDecoder()
+    for payload, ok in decoder.push(data):
+        ...
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from fec import crc16
+
+# Attached sync marker
+PREAMBLE = np.unpackbits(np.frombuffer(bytes.fromhex('1ACFFC1D'), dtype=np.uint8))
+
+# Header after the preamble (length and its CRC), and payload CRC, in bits
+_HEADER = 32
+_TRAILER = 16
+
+
+def _to_bits(data):
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+
+def encode_packet(data):
+    """
+    Frames the bytes `data` as one packet.
+
+    Parameters
+    ----------
+    data : bytes
+        The payload, at most 65535 bytes.
+
+    Returns
+    -------
+    b : numpy.array
+        A binary array of 1s and 0s encoding the packet.
+    """
+
+    data = bytes(data)
+    if len(data) > 0xFFFF:
+        raise ValueError(f'The payload must be at most 65535 bytes, but {len(data)} given.')
+
+    length = len(data).to_bytes(2, 'big')
+    header = length + crc16(length).to_bytes(2, 'big')
+    return np.concatenate((PREAMBLE, _to_bits(header + data + crc16(data).to_bytes(2, 'big'))))
+
+
+def encode_packets(data, size: int=64):
+    """
+    Splits the bytes `data` into packets of (at most) `size` bytes of
+    payload, sent back to back. A zero byte is appended after the last
+    packet, so that its last bits are not lost if the receiver drops the
+    incomplete byte at the end of a transmission.
+
+    Returns
+    -------
+    b : numpy.array
+        A binary array of 1s and 0s encoding the packets.
+    """
+
+    data = bytes(data)
+    packets = [encode_packet(data[k:k+size]) for k in range(0, max(len(data), 1), size)]
+    return np.concatenate(packets + [np.zeros(8, dtype=np.uint8)])
+
+
+class PacketDecoder:
+    """
+    Receives the packets in a stream of decoded bits or bytes, see the module
+    documentation.
+
+    Parameters
+    ----------
+    max_payload : int, default 4096
+        Largest payload in bytes that is accepted; longer headers are taken
+        to be false detections of the preamble.
+    max_errors : int, default 2
+        Number of bit errors that are tolerated in the preamble.
+    """
+
+    def __init__(self, max_payload: int=4096, max_errors: int=2):
+        self.max_payload = max_payload
+        self.max_errors = max_errors
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the bits received so far.
+        """
+        self._bits = np.zeros((0,), dtype=np.uint8)
+
+    def push(self, data=b'', bits=None):
+        """
+        Receives the next bytes `data` (or the next `bits`, as a binary
+        array) and returns the packets completed by them.
+
+        Returns
+        -------
+        packets : list of tuple
+            One tuple (payload, ok) per completed packet, where `ok` is False
+            if the payload CRC does not match. A preamble followed by a
+            corrupt header gives (b'', False).
+        """
+
+        new = _to_bits(data) if bits is None else np.asarray(bits, dtype=np.uint8)
+        b = np.concatenate((self._bits, new))
+        Np = PREAMBLE.shape[0]
+
+        packets = []
+        k = 0
+        while True:
+            # Hunt for the next preamble (with at most max_errors bit errors)
+            if b.shape[0] - k < Np:
+                break
+            errors = np.count_nonzero(sliding_window_view(b[k:], Np) != PREAMBLE, axis=-1)
+            hits = np.flatnonzero(errors <= self.max_errors)
+            if hits.size == 0:
+                k = b.shape[0] - Np + 1
+                break
+            k += int(hits[0])
+
+            # Check the header, waiting for it if it is incomplete
+            if b.shape[0] - k < Np + _HEADER:
+                break
+            header = np.packbits(b[k+Np:k+Np+_HEADER]).tobytes()
+            length = int.from_bytes(header[:2], 'big')
+            if crc16(header[:2]) != int.from_bytes(header[2:], 'big'):
+                packets.append((b'', False))
+                k += Np
+                continue
+            if length > self.max_payload:
+                k += 1
+                continue
+
+            # Wait for the payload and its CRC
+            end = k + Np + _HEADER + 8*length + _TRAILER
+            if b.shape[0] < end:
+                break
+            body = np.packbits(b[k+Np+_HEADER:end]).tobytes()
+            payload = body[:length]
+            ok = crc16(payload) == int.from_bytes(body[length:], 'big')
+            packets.append((payload, ok))
+
+            # Resynchronize after a valid packet, and right after the
+            # preamble of a corrupt one (whose length may be off by a bit)
+            k = end if ok else k + Np
+
+        self._bits = b[k:]
+        return packets
@@ -1,51 +1,131 @@
-import numpy as np
-import sounddevice as sd
-from scipy.signal import sosfilt
-from lowpass import create_lowpass_filter
-from bandpass import create_bandpass_filter
+import sys
+import codecs
 import wcslib as wcs
+from channels import channel_plan
+from stream import DecimatingFrontEnd, StreamingReceiver, microphone_blocks, wav_blocks, raw_blocks
+from audiofile import open_writer
+import instrument
+import fec
+import packet
 
 # Parameters
+channel_id = 15  # Group number, as used by the transmitter
 Tb = 0.02   # Symbol duration
 fs = 48000 # Sampling frequency
-duration = 80 # Recording duration
-f_low = 4300  # Lower passband frequency
-f_high = 4500  # Upper passband frequency
-R_p = 1  # Passband ripple
+blocksize = 4800 # Block size in samples (0.1 s)
+R_p = 0.1  # Passband ripple
 R_s = 40  # Stopband attenuation
-fc = 4400  # Carrier frequency
+constellation = wcs.BPSK  # Modulation, as used by the transmitter
+pulse = wcs.RECT  # Pulse shape, as used by the transmitter
+track = False  # Track the symbol timing and carrier phase (for long transmissions)
+framing = None  # None, 'fec', or 'packet', as used by the transmitter
 
-# Step 1: Record the signal
-print("Recording...")
-recorded_signal = sd.rec(int(duration * fs), samplerate=fs, channels=1, dtype='float64')
-sd.wait()
-print("Recording completed.")
 
-# Step 2: Bandpass filtering
-sos = create_bandpass_filter(fs, f_low, f_high, R_p, R_s)
-filtered_signal = sosfilt(sos, recorded_signal.flatten())
+def main(argv=None):
 
-# Step 3: IQ Demodulation
-I = filtered_signal * np.cos(2 * np.pi * fc * np.arange(len(filtered_signal)) / fs)
-Q = -1 * filtered_signal * np.sin(2 * np.pi * fc * np.arange(len(filtered_signal)) / fs)
+    # Log the time spent in every stage of every block (as JSON lines on
+    # stderr, or to a file) if requested by WCS_INSTRUMENT
+    instrument.from_environ()
+    args = sys.argv[1:] if argv is None else list(argv)
 
-# Create the lowpass filter
-fl_high = 250  # Cutoff frequency
-Rl_p = 1  # Passband ripple
-Rl_s = 40  # Stopband attenuation 
-sos_low = create_lowpass_filter(fs, fl_high, Rl_p, Rl_s)
+    # Step 1: Get the carrier and create the bandpass filter of the channel (of
+    # the lowest order that meets the specifications, see channels.py)
+    plan = channel_plan(channel_id, fs, R_p, R_s)
+    plan.check_symbol_duration(Tb, pulse, constellation)
+    fc = plan.fc
+    sos = plan.bandpass
 
-# Apply the lowpass filter to I and Q separately
-I_filtered = sosfilt(sos_low, I)
-Q_filtered = sosfilt(sos_low, Q)
+    # Step 2: Create the lowpass filter (applied after IQ demodulation, combined
+    # with decimation of the baseband signal to fs/decimation = 3 kHz)
+    decimation = 16  # Downsampling factor
+    h_low = plan.decimation_filter(decimation)
 
-# Combine I_filtered and Q_filtered back to get the filtered baseband signal
-yb_filtered = I_filtered + 1j * Q_filtered
+    # Step 3: Set up the streaming receiver (bandpass filtering, IQ demodulation,
+    # lowpass filtering and decimation, and decoding, block by block). The front
+    # end runs in single precision with reused work buffers, which is accurate
+    # enough for decoding (see `benchmark.py precision`).
+    dtype = 'float32'
+    frontend = DecimatingFrontEnd(fs, fc, sos, h_low, decimation, dtype)
+    receiver = StreamingReceiver(frontend, Tb, constellation=constellation, pulse=pulse, track=track)
+    frames = fec.FrameDecoder() if framing == 'fec' else packet.PacketDecoder()
 
-# Step 6: Decode the baseband signal
-bit_sequence = wcs.decode_baseband_signal(np.abs(yb_filtered), np.angle(yb_filtered), Tb, fs)
+    # Step 4: Select the audio source, a recording (WAV or raw float64) given on
+    # the command line or the sound card. With -r path, the audio from the sound
+    # card is also recorded to the file (WAV or raw float64).
+    recording = None
+    if len(args) == 1:
+        path = str(args[0])
+        if path.endswith('.wav'):
+            blocks = wav_blocks(path, fs, blocksize)
+        else:
+            blocks = raw_blocks(path, blocksize)
+    else:
+        if len(args) == 2 and str(args[0]) == '-r':
+            recording = open_writer(str(args[1]), fs)
+        blocks = microphone_blocks(fs, blocksize)
+        print("Listening... (Ctrl+C to stop)")
 
-# Step 7: Decode the bit sequence into a bytes
-data_rx = wcs.decode_string(bit_sequence)
+    # Step 5: Decode the blocks as they arrive and print the bytes as soon as they
+    # are complete. The last byte of each message is held back, since the
+    # transmitter appends a trailing "a" that is stripped here. With FEC frames or
+    # packets, these are printed as soon as they are complete instead, and those
+    # that fail the CRC are flagged. The packet decoder keeps hunting for packets
+    # across transmissions, so that it resynchronizes after every packet. A
+    # transmission in which no frame or packet is found at all is flagged too. The
+    # bytes are decoded as UTF-8 incrementally, so that characters split across
+    # blocks are printed once complete.
+    held = b''
+    started = False
+    received = 0
+    text = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        for block in blocks:
+            if recording is not None:
+                recording.write(block)
+            if framing is not None:
+                data = receiver.process(block)
+                received += len(data)
+                for payload, ok in frames.push(data):
+                    if not started:
+                        print('Received: "', end='')
+                        started = True
+                    if ok:
+                        print(text.decode(payload), end='', flush=True)
+                    else:
+                        print(text.decode(b'', final=True) + '[corrupt frame]', end='', flush=True)
+                        text.reset()
+                if not receiver.active:
+                    if framing == 'fec':
+                        frames.reset()
+                    if received and not started:
+                        # Not a single frame (or preamble) was found
+                        print('Received: "[corrupt frame]', end='')
+                        started = True
+                    if started:
+                        print(text.decode(b'', final=True) + '"')
+                        text.reset()
+                        started = False
+                    received = 0
+                continue
 
-print('Received: \"' + data_rx[:-1] + "\"")
+            data = held + receiver.process(block)
+            if data and not held:
+                print('Received: "', end='')
+            held = data[-1:]
+            print(text.decode(data[:-1]), end='', flush=True)
+            if held and not receiver.active:
+                print(text.decode(b'', final=True) + '"')
+                text.reset()
+                held = b''
+    except KeyboardInterrupt:
+        pass
+
+    if held or started:
+        print(text.decode(b'', final=True) + '"')
+
+    if recording is not None:
+        recording.close()
+
+
+if __name__ == "__main__":
+    main()
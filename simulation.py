@@ -10,6 +10,13 @@ $ python3 simulation.py "Hello World!"
 For binary inputs, run:
 $ python3 simulation.py -b 010010000110100100100001
 
+To also write the simulated received signal to a file (WAV or raw float64,
+e.g., as a regression fixture), run:
+$ python3 simulation.py -o received.wav "Hello World!"
+
+To log the time spent in every stage (as JSON lines on stderr), run:
+$ WCS_INSTRUMENT=1 python3 simulation.py "Hello World!"
+
 2020-present -- Roland Hostettler <roland.hostettler@angstrom.uu.se>
 """
 
@@ -19,86 +26,121 @@ import numpy as np
 #import matplotlib.pyplot as plt
 import wcslib as wcs
 from scipy.signal import sosfilt
-from lowpass import create_lowpass_filter
-from bandpass import create_bandpass_filter
+from channels import channel_plan
+from filtercache import local_oscillator
+from audiofile import write_signal
+import instrument
+import fec
+import packet
 
-def main():
+def main(argv=None):
+
+    # Log the stages if requested by WCS_INSTRUMENT
+    instrument.from_environ()
 
     # Parameters
     channel_id = 15 # Group number
-    fc = 4400  # Carrier frequency
     Tb = 0.04  # Symbol duration
     fs = 48000  # Sampling frequency
+    constellation = wcs.BPSK  # Modulation (wcs.BPSK, QPSK, PSK8, or QAM16)
+    pulse = wcs.RECT  # Pulse shape (wcs.RECT, or wcs.RRC for shorter Tb)
+    track = False  # Track the symbol timing and carrier phase in the receiver
+    noise_floor = False  # Detect the message relative to the noise floor (instead of the signal's variance)
+    framing = None  # None, 'fec' (Hamming-coded frames, see fec.py), or 'packet' (see packet.py)
+    R_p = 0.1  # Passband ripple of the filters
+    R_s = 40  # Stopband attenuation of the filters
+
+    # Carrier and filters of the channel (of the lowest order that meets the
+    # specifications, see channels.py)
+    plan = channel_plan(channel_id, fs, R_p, R_s)
+    plan.check_symbol_duration(Tb, pulse, constellation)
+    fc = plan.fc
+
+    # Write the received signal to a file if given as -o path
+    args = sys.argv[1:] if argv is None else list(argv)
+    output = None
+    if len(args) >= 2 and args[0] == '-o':
+        output = args[1]
+        args = args[2:]
 
     # Detect input or set defaults
     string_data = True
-    if len(sys.argv) == 2:
-        data = str(sys.argv[1])
+    if len(args) == 1:
+        data = str(args[0])
 
-    elif len(sys.argv) == 3 and str(sys.argv[1]) == '-b':
+    elif len(args) == 2 and str(args[0]) == '-b':
         string_data = False
-        data = str(sys.argv[2])
+        data = str(args[1])
 
     else:
         print('Transmitting "Hello World!"', file=sys.stderr)
         data = "Hello World!"
 
     # Convert string to bit sequence or string bit sequence to numeric bit sequence
-    if string_data:
+    if string_data and framing == 'fec':
+        bs = fec.encode_frames(data.encode())
+    elif string_data and framing == 'packet':
+        bs = packet.encode_packets(data.encode())
+    elif string_data:
         bs = wcs.encode_string(data)
     else:
-        bs = np.array([bit for bit in map(int, data)])
+        bs = wcs.parse_bits(data)
 
     # Encode baseband signal
-    xb = wcs.encode_baseband_signal(bs, Tb, fs)
-
-    # Carrier signal
-    xc = np.sin(2 * np.pi * fc * np.arange(len(xb)) / fs)
+    xb = wcs.encode_baseband_signal(bs, Tb, fs, constellation=constellation, pulse=pulse)
 
-    # Modulated signal
-    xm = xb * xc  
-
-    # Filter specifications
-    f_low = 4300  # Lower passband frequency
-    f_high = 4500  # Upper passband frequency
-    R_p = 1  # Passband ripple
-    R_s = 40  # Stopband attenuation
+    # Modulated signal (carrier tiled from one period)
+    lo = local_oscillator(fs, fc)
+    with instrument.stage('modulate', xb) as st:
+        xm = st.output(lo.modulate(xb))
 
     # Create the bandpass filter
-    sos = create_bandpass_filter(fs, f_low, f_high, R_p, R_s)
+    sos = plan.bandpass
 
     # Bandpass filter the modulated signal
-    filtered_signal = sosfilt(sos, xm)
+    with instrument.stage('bandpass_tx', xm) as st:
+        filtered_signal = st.output(sosfilt(sos, xm))
 
     # Channel simulation
     yr = wcs.simulate_channel(filtered_signal, fs, channel_id)
+    if output is not None:
+        write_signal(output, yr, fs)
 
-    # Bandpass filter the recieved signal
-    sos = create_bandpass_filter(fs, f_low, f_high, R_p, R_s)
-    filtered_signal = sosfilt(sos, yr.flatten())
+    # Bandpass filter the recieved signal (with the same filter)
+    with instrument.stage('bandpass_rx', yr) as st:
+        filtered_signal = st.output(sosfilt(sos, yr.flatten()))
 
     # IQ Demodulation
-    I = filtered_signal * np.cos(2 * np.pi * fc * np.arange(len(filtered_signal)) / fs)
-    Q = -1 * filtered_signal * np.sin(2 * np.pi * fc * np.arange(len(filtered_signal)) / fs)
+    with instrument.stage('iq_mix', filtered_signal) as st:
+        I = filtered_signal * lo.cos(len(filtered_signal))
+        Q = st.output(-1 * filtered_signal * lo.sin(len(filtered_signal)))
 
     # Create the lowpass filter
-    fl_high = 250  # Cutoff frequency
-    Rl_p = 1  # Passband ripple
-    Rl_s = 40  # Stopband attenuation
-    sos_low = create_lowpass_filter(fs, fl_high, Rl_p, Rl_s)
+    sos_low = plan.lowpass
 
     # Apply the lowpass filter to I and Q separately
-    I_filtered = sosfilt(sos_low, I)
-    Q_filtered = sosfilt(sos_low, Q)
+    with instrument.stage('lowpass', I) as st:
+        I_filtered = sosfilt(sos_low, I)
+        Q_filtered = st.output(sosfilt(sos_low, Q))
 
     # Combine I_filtered and Q_filtered back to get the filtered baseband signal
     yb_filtered = I_filtered + 1j * Q_filtered
 
     # Step 6: Decode the baseband signal
-    bit_sequence = wcs.decode_baseband_signal(np.abs(yb_filtered), np.angle(yb_filtered), Tb, fs)
-
-    # Step 7: Decode the bit sequence into a string
-    data_rx = wcs.decode_string(bit_sequence)
+    bit_sequence = wcs.decode_baseband_iq(yb_filtered, Tb, fs, constellation=constellation, pulse=pulse, track=track, noise_floor=noise_floor)
+
+    # Step 7: Decode the bit sequence into a string (flagging frames and
+    # packets that fail the CRC, and bits in which no packet was found)
+    if string_data and framing is not None:
+        if framing == 'fec':
+            frames = fec.decode_frames(bit_sequence)
+        else:
+            frames = packet.PacketDecoder().push(bits=bit_sequence)
+            if not frames and bit_sequence.size:
+                frames = [(b'', False)]
+        data_rx = ''.join(p.decode(errors='replace') if ok else '[corrupt frame]' for p, ok in frames)
+    else:
+        data_rx = wcs.decode_string(bit_sequence)
     print('Received: ' + data_rx)
 
 
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming (block-based) receiver for the wireless communication system
+project in Signals and Transforms.
+
+Instead of recording the whole transmission and decoding it afterwards, the
+received audio is processed in fixed-size blocks. The bandpass filter, the IQ
+demodulation, the lowpass filter, and the decoder all carry their state from
+one block to the next, so that bytes are available as soon as their symbols
+have been received and the memory use does not grow with the session length.
+"""
+
+import numpy as np
+from scipy.signal import sosfilt, group_delay
+import wcslib as wcs
+from filtercache import local_oscillator
+import instrument
+import audiofile
+
+
+class ReceiverFrontEnd:
+    """
+    Bandpass filtering, IQ demodulation, and lowpass filtering of the received
+    signal, block by block.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    fc : float
+        Carrier frequency in Hz.
+    sos_bp : numpy.array
+        Second-order sections of the bandpass filter.
+    sos_lp : numpy.array
+        Second-order sections of the lowpass filter.
+    dtype : numpy.dtype, default 'float64'
+        Precision of the processing, 'float64' or 'float32' (the baseband 
+        signal is then complex64, which halves the memory traffic).
+    """
+
+    def __init__(self, fs: float, fc: float, sos_bp, sos_lp, dtype='float64'):
+        self.fs = fs
+        self.fs_out = fs
+        self.fc = fc
+        self.delay = _group_delay(sos_bp, fc, fs) + _group_delay(sos_lp, 0.0, fs)  # At the carrier, in samples
+        self.dtype = np.dtype(dtype)
+        self.sos_bp = np.asarray(sos_bp, dtype=self.dtype)
+        self.sos_lp = np.asarray(sos_lp, dtype=self.dtype)
+
+        # Filter states (the lowpass filter runs on I and Q at once), and the
+        # carrier with the sample index at the start of the next block
+        self._zi_bp = np.zeros((sos_bp.shape[0], 2), dtype=self.dtype)
+        self._zi_lp = np.zeros((sos_lp.shape[0], 2, 2), dtype=self.dtype)
+        self._lo = local_oscillator(fs, fc)
+        self._n = 0
+
+        # Work buffers, grown to the largest block size
+        self._x = np.zeros((0,), dtype=self.dtype)
+        self._iq = np.zeros((2, 0), dtype=self.dtype)
+        self._cos, self._sin = self._lo.table(0, self.dtype)
+
+    def max_output(self, N: int):
+        """
+        Returns the (maximum) number of output samples for a block of `N` 
+        samples.
+        """
+        return N
+
+    def process(self, x, out=None):
+        """
+        Demodulates the next block of the received signal.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the received signal.
+        out : numpy.array, optional
+            Complex array of at least `max_output(len(x))` samples to write 
+            the baseband signal to; a new array is returned if not given.
+
+        Returns
+        -------
+        yb : numpy.array
+            The corresponding block of the complex baseband signal (a view of
+            `out` if given).
+        """
+
+        x = np.asarray(x).ravel()
+        N = x.shape[0]
+        if self._x.shape[0] < N:
+            self._x = np.empty((N,), dtype=self.dtype)
+            self._iq = np.empty((2, N), dtype=self.dtype)
+            self._cos, self._sin = self._lo.table(N, self.dtype)
+        xn = self._x[:N]
+        np.copyto(xn, x, casting='same_kind')
+
+        # Bandpass filtering
+        with instrument.stage('bandpass_rx', xn) as st:
+            filtered_signal, self._zi_bp = sosfilt(self.sos_bp, xn, zi=self._zi_bp)
+            st.output(filtered_signal)
+
+        # IQ demodulation, continuing the carrier from the previous block
+        with instrument.stage('iq_mix', filtered_signal) as st:
+            k = self._n % self._lo.period
+            iq = self._iq[:, :N]
+            np.multiply(filtered_signal, self._cos[k:k+N], out=iq[0])
+            np.multiply(filtered_signal, self._sin[k:k+N], out=iq[1])
+            np.negative(iq[1], out=iq[1])
+            st.output(iq)
+        self._n = (self._n + N) % self._lo.period
+
+        # Lowpass filtering of I and Q
+        with instrument.stage('lowpass', iq) as st:
+            iq, self._zi_lp = sosfilt(self.sos_lp, iq, axis=-1, zi=self._zi_lp)
+            st.output(iq)
+
+        if out is None:
+            out = np.empty((N,), dtype=np.result_type(self.dtype, np.complex64))
+        yb = out[:N]
+        yb.real = iq[0]
+        yb.imag = iq[1]
+        return yb
+
+
+class PolyphaseDecimator:
+    """
+    FIR filtering followed by downsampling by `decimation`, block by block.
+
+    Only the output samples that are kept are computed (one inner product 
+    with the impulse response per output sample), so the cost per input 
+    sample is `len(h)/decimation` multiply-adds, as for a polyphase 
+    implementation. The output is the same as that of 
+    `scipy.signal.upfirdn(h, x, down=decimation)` for the concatenated 
+    blocks.
+
+    Parameters
+    ----------
+    h : numpy.array
+        Impulse response of the FIR filter.
+    decimation : int
+        Downsampling factor.
+    dtype : numpy.dtype, default 'float64'
+        Precision of the impulse response and the input history; the input
+        is complex if the impulse response or the input is.
+    """
+
+    def __init__(self, h, decimation: int, dtype='float64'):
+        self.h = np.asarray(h)
+        self.decimation = decimation
+        self.dtype = np.dtype(dtype)
+        self._hr = self.h[::-1].astype(self.dtype)
+
+        # The last len(h)-1 input samples followed by the current block (the
+        # buffer is grown to the largest block size), and the number of 
+        # input samples processed so far (modulo the decimation)
+        self._buf = np.zeros((self.h.shape[0]-1,), dtype=np.result_type(self.dtype, np.complex64))
+        self._n = 0
+
+    def max_output(self, N: int):
+        """
+        Returns the maximum number of output samples for a block of `N` 
+        samples.
+        """
+        return -(-N//self.decimation)
+
+    def process(self, x, out=None):
+        """
+        Filters and downsamples the next block of the input signal.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the (real or complex) input signal.
+        out : numpy.array, optional
+            Complex array of at least `max_output(len(x))` samples to write 
+            the output to; a new array is returned if not given.
+
+        Returns
+        -------
+        y : numpy.array
+            The corresponding block of the output signal (a view of `out` if
+            given).
+        """
+
+        L = self.h.shape[0]
+        N = x.shape[0]
+        if self._buf.shape[0] < L-1+N:
+            self._buf = np.concatenate((self._buf[:L-1], np.empty((N,), dtype=self._buf.dtype)))
+        xh = self._buf[:L-1+N]
+        xh[L-1:] = x
+
+        # Row i of the windows ends at input sample i, of which every 
+        # decimation-th (counting from the first input sample) is kept
+        windows = np.lib.stride_tricks.sliding_window_view(xh, L)
+        k0 = (-self._n) % self.decimation
+        windows = windows[k0::self.decimation]
+        if out is None:
+            y = windows @ self._hr
+        else:
+            y = np.matmul(windows, self._hr, out=out[:windows.shape[0]])
+
+        # Keep the last L-1 samples at the start of the buffer
+        xh[:L-1] = xh[N:]
+        self._n = (self._n + N) % self.decimation
+
+        return y
+
+
+class DecimatingFrontEnd:
+    """
+    Bandpass filtering, IQ demodulation, and combined lowpass filtering and
+    decimation of the received signal, block by block.
+
+    Compared to `ReceiverFrontEnd`, the complex baseband signal is output at
+    the sampling frequency `fs/decimation` (e.g., 3 kHz instead of 48 kHz),
+    which is plenty for the bandwidth of the baseband signal and reduces the
+    cost of all the following processing (in particular, the decoder's 
+    filters of length `Kb`) accordingly.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    fc : float
+        Carrier frequency in Hz.
+    sos_bp : numpy.array
+        Second-order sections of the bandpass filter.
+    h : numpy.array
+        Impulse response of the FIR lowpass filter, see 
+        `lowpass.create_decimation_filter()`.
+    decimation : int
+        Downsampling factor.
+    dtype : numpy.dtype, default 'float64'
+        Precision of the processing, 'float64' or 'float32' (the baseband 
+        signal is then complex64, which halves the memory traffic).
+    """
+
+    def __init__(self, fs: float, fc: float, sos_bp, h, decimation: int, dtype='float64'):
+        self.fs = fs
+        self.fs_out = fs/decimation
+        self.fc = fc
+        self.dtype = np.dtype(dtype)
+        self.sos_bp = np.asarray(sos_bp, dtype=self.dtype)
+
+        self._zi_bp = np.zeros((sos_bp.shape[0], 2), dtype=self.dtype)
+        self._lo = local_oscillator(fs, fc)
+        self._n = 0
+        self._decimator = PolyphaseDecimator(h, decimation, self.dtype)
+        self.delay = (_group_delay(sos_bp, fc, fs) + (len(h) - 1)//2)//decimation  # At the carrier, in output samples
+
+        # Work buffers, grown to the largest block size: the input, the 
+        # carrier exp(-j*wc*k) (indexed by the sample index modulo its 
+        # period), and the IQ-demodulated signal
+        ctype = np.result_type(self.dtype, np.complex64)
+        self._x = np.zeros((0,), dtype=self.dtype)
+        self._yb = np.zeros((0,), dtype=ctype)
+        self._carrier = np.zeros((0,), dtype=ctype)
+
+    def max_output(self, N: int):
+        """
+        Returns the maximum number of output samples for a block of `N` 
+        samples.
+        """
+        return self._decimator.max_output(N)
+
+    def process(self, x, out=None):
+        """
+        Demodulates the next block of the received signal.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the received signal.
+        out : numpy.array, optional
+            Complex array of at least `max_output(len(x))` samples to write 
+            the baseband signal to; a new array is returned if not given.
+
+        Returns
+        -------
+        yb : numpy.array
+            The corresponding block of the complex baseband signal, at the 
+            sampling frequency `fs_out` (a view of `out` if given).
+        """
+
+        x = np.asarray(x).ravel()
+        N = x.shape[0]
+        if self._x.shape[0] < N:
+            self._x = np.empty((N,), dtype=self.dtype)
+            self._yb = np.empty((N,), dtype=self._yb.dtype)
+            cos, sin = self._lo.table(N, self.dtype)
+            self._carrier = np.empty(cos.shape, dtype=self._yb.dtype)
+            self._carrier.real = cos
+            self._carrier.imag = sin
+            np.negative(self._carrier.imag, out=self._carrier.imag)
+        xn = self._x[:N]
+        np.copyto(xn, x, casting='same_kind')
+
+        # Bandpass filtering
+        with instrument.stage('bandpass_rx', xn) as st:
+            filtered_signal, self._zi_bp = sosfilt(self.sos_bp, xn, zi=self._zi_bp)
+            st.output(filtered_signal)
+
+        # IQ demodulation (I + jQ), continuing the carrier from the previous
+        # block
+        with instrument.stage('iq_mix', filtered_signal) as st:
+            k = self._n % self._lo.period
+            yb = st.output(np.multiply(filtered_signal, self._carrier[k:k+N], out=self._yb[:N]))
+        self._n = (self._n + N) % self._lo.period
+
+        # Lowpass filtering and decimation
+        with instrument.stage('decimate', yb) as st:
+            return st.output(self._decimator.process(yb, out))
+
+
+def _group_delay(sos, f: float, fs: float):
+    """
+    Group delay in samples (rounded up) of the filter with second-order
+    sections `sos` at the frequency `f`.
+    """
+    gd = sum(group_delay((s[:3], s[3:]), w=[f], fs=fs)[1][0] for s in np.asarray(sos))
+    return int(np.ceil(gd))
+
+
+class StreamingReceiver:
+    """
+    Block-based receiver, turning blocks of received audio into bytes.
+
+    The baseband signal is written to a work buffer that is reused from
+    block to block, in the precision of the front end, and decoded in the
+    complex domain in the same precision (see 
+    `wcslib.BasebandDecoder.push_iq()`).
+
+    Parameters
+    ----------
+    frontend : ReceiverFrontEnd or DecimatingFrontEnd
+        The front end turning the received signal into the complex baseband
+        signal (its `delay`, the group delay of its filters in output 
+        samples, is passed on to the decoder).
+    Tb : float
+        Symbol duration in seconds.
+    threshold : float, default 4.0
+        Detection threshold of the decoder (see `wcslib.BasebandDecoder`).
+    sync : sequence of int, default (1, 0)
+        Synchronization bits used by the transmitter.
+    constellation : wcslib.Constellation, default wcslib.BPSK
+        Modulation used by the transmitter.
+    pulse : wcslib.PulseShape, default wcslib.RECT
+        Pulse shape used by the transmitter.
+    track : bool, default False
+        Track the symbol timing and the carrier phase (see 
+        `wcslib.BasebandDecoder`).
+    """
+
+    def __init__(self, frontend, Tb: float, threshold: float=4.0, sync=(1, 0), constellation=wcs.BPSK, pulse=wcs.RECT, track: bool=False):
+        self.frontend = frontend
+        dtype = np.dtype(getattr(frontend, 'dtype', 'float64'))
+        self.decoder = wcs.BasebandDecoder(Tb, frontend.fs_out, threshold, sync=sync, constellation=constellation, pulse=pulse, track=track, delay=getattr(frontend, 'delay', 0), dtype=dtype)
+        self._bits = np.zeros((0,), dtype=bool)
+        self._yb = np.zeros((0,), dtype=np.result_type(dtype, np.complex64))
+
+    @property
+    def active(self):
+        """True while a transmission is being received."""
+        return self.decoder.active
+
+    def process(self, x):
+        """
+        Processes the next block of received audio.
+
+        Parameters
+        ----------
+        x : numpy.array
+            The next block of the received signal.
+
+        Returns
+        -------
+        data : bytes
+            The bytes completed within the block (possibly none). Bits of an
+            incomplete byte at the end of a transmission are dropped.
+        """
+
+        with instrument.stage('receive', x):
+            N = self.frontend.max_output(np.size(x))
+            if self._yb.shape[0] < N:
+                self._yb = np.empty((N,), dtype=self._yb.dtype)
+            return self.push_baseband(self.frontend.process(x, self._yb))
+
+    def push_baseband(self, yb):
+        """
+        Decodes the next block of the complex baseband signal (at the 
+        sampling frequency `frontend.fs_out`), for when the front end is run
+        separately (e.g., by a channelizer).
+
+        Parameters
+        ----------
+        yb : numpy.array
+            The next block of the complex baseband signal.
+
+        Returns
+        -------
+        data : bytes
+            The bytes completed within the block (possibly none).
+        """
+
+        b = self.decoder.push_iq(yb)
+
+        # Only pack whole bytes, keep the remaining bits for the next block
+        bits = np.concatenate((self._bits, b))
+        Nbytes = bits.shape[0]//8
+        self._bits = bits[8*Nbytes:] if self.active else bits[:0]
+
+        return wcs.decode_bytes(bits[:8*Nbytes])
+
+
+def microphone_blocks(fs: float, blocksize: int, device=None):
+    """
+    Yields blocks recorded from the sound card, indefinitely.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    blocksize : int
+        Number of samples per block.
+    device : int or str, optional
+        The input device (see sounddevice); the default device if not given.
+
+    Yields
+    ------
+    x : numpy.array
+        The next block of recorded audio.
+    """
+
+    # Only needed when recording, decoding files works without a sound card
+    import sounddevice as sd
+
+    with sd.InputStream(samplerate=fs, blocksize=blocksize, device=device, channels=1, dtype='float64') as stream:
+        while True:
+            x, _ = stream.read(blocksize)
+            yield x[:, 0]
+
+
+def wav_blocks(path, fs: float, blocksize: int):
+    """
+    Yields blocks of a WAV file (first channel only), scaled to [-1, 1). The
+    file is memory-mapped (see `audiofile.open_wav()`), so it may be longer
+    than fits into memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the WAV file.
+    fs : float
+        Expected sampling frequency in Hz.
+    blocksize : int
+        Number of samples per block.
+
+    Yields
+    ------
+    x : numpy.array
+        The next block of audio (a read-only view of the file for 
+        floating-point files).
+    """
+
+    x, fs_file = audiofile.open_wav(path)
+    if fs_file != fs:
+        raise ValueError(f'Expected a sampling frequency of {fs} Hz, but {path} uses {fs_file} Hz.')
+
+    for k in range(0, x.shape[0], blocksize):
+        yield audiofile.to_float(x[k:k+blocksize, 0])
+
+
+def raw_blocks(path, blocksize: int, dtype='float64'):
+    """
+    Yields blocks of a headerless (raw) single-channel recording. The file 
+    is memory-mapped (see `audiofile.open_raw()`), so it may be longer than
+    fits into memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw file.
+    blocksize : int
+        Number of samples per block.
+    dtype : numpy.dtype, default 'float64'
+        Sample format of the file.
+
+    Yields
+    ------
+    x : numpy.array
+        The next block of audio (a read-only view of the file for 
+        floating-point files, converted to float otherwise).
+    """
+
+    x = audiofile.open_raw(path, dtype)
+    for k in range(0, x.shape[0], blocksize):
+        yield x[k:k+blocksize] if x.dtype.kind == 'f' else x[k:k+blocksize].astype(float)
@@ -0,0 +1,132 @@
+import struct
+import numpy as np
+import pytest
+from scipy.io import wavfile
+import audiofile
+from audiofile import open_raw, open_wav, to_float, write_raw, write_signal, write_wav
+
+fs = 48000
+DTYPES = list(audiofile._WAV_DTYPES.values())
+
+
+def signal(N=1000, channels=None):
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, N if channels is None else (N, channels))
+
+
+@pytest.mark.parametrize('channels', [None, 2])
+@pytest.mark.parametrize('dtype', DTYPES, ids=[str(d) for d in DTYPES])
+def test_wav_round_trip(tmp_path, dtype, channels):
+    path = str(tmp_path / 'x.wav')
+    x = signal(channels=channels)
+    write_wav(path, x, fs, dtype)
+
+    y, fs_y = open_wav(path)
+    assert fs_y == fs
+    assert y.dtype == dtype
+    assert y.shape == (x.shape[0], 1 if channels is None else channels)
+    y = to_float(y).reshape(x.shape)
+    if dtype.kind == 'f':
+        np.testing.assert_array_equal(y, x.astype(dtype))
+    else:
+        # Clipped to [-1, 1) and quantized (rounded)
+        scale = 2**(8*dtype.itemsize-1)
+        np.testing.assert_allclose(y, np.clip(x, -1, 1 - 1/scale), rtol=0, atol=0.5/scale + 1e-12)
+
+    # The same samples as read by scipy
+    fs_s, s = wavfile.read(path)
+    assert fs_s == fs
+    np.testing.assert_array_equal(open_wav(path)[0].reshape(s.shape), s)
+
+
+def test_wav_integers_are_clipped(tmp_path):
+    path = str(tmp_path / 'x.wav')
+    write_wav(path, np.array([-2.0, -1.0, 0.0, 0.5, 1.0, 2.0]), fs, 'int16')
+    np.testing.assert_array_equal(open_wav(path)[0][:, 0], [-32768, -32768, 0, 16384, 32767, 32767])
+
+
+@pytest.mark.parametrize('length', [0, 0xFFFFFFFF, 10**6])
+def test_wav_unset_data_length(tmp_path, length):
+    # Recorders that were interrupted may leave the length of the data unset
+    # (or larger than the file): all samples in the file are read
+    path = str(tmp_path / 'x.wav')
+    x = signal().astype(np.float32)
+    write_wav(path, x, fs)
+    with open(path, 'r+b') as f:
+        f.seek(40)
+        f.write(struct.pack('<I', length))
+    np.testing.assert_array_equal(open_wav(path)[0][:, 0], x)
+
+
+def test_wav_truncated_data(tmp_path):
+    # The file ends in the middle of a frame: the complete frames are read
+    path = str(tmp_path / 'x.wav')
+    write_wav(path, signal(channels=2), fs, 'int16')
+    x = np.array(open_wav(path)[0])
+    with open(path, 'r+b') as f:
+        f.truncate(44 + 4*700 + 3)
+    y, _ = open_wav(path)
+    assert y.shape == (700, 2)
+    np.testing.assert_array_equal(y, x[:700])
+
+
+def test_wav_chunks_before_data(tmp_path):
+    # Other chunks (of odd length, padded) between the format and the data
+    path = str(tmp_path / 'x.wav')
+    x = signal().astype(np.float32)
+    write_wav(path, x, fs)
+    with open(path, 'rb') as f:
+        header, data = f.read(36), f.read()
+    with open(path, 'wb') as f:
+        f.write(header + struct.pack('<4sI', b'LIST', 5) + b'abcde\0' + data)
+    np.testing.assert_array_equal(open_wav(path)[0][:, 0], x)
+
+
+def test_wav_errors(tmp_path):
+    path = str(tmp_path / 'x.wav')
+    with open(path, 'wb') as f:
+        f.write(b'RIFX' + bytes(40))
+    with pytest.raises(ValueError):
+        open_wav(path)
+
+    # No data chunk
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4sI4s', b'RIFF', 4, b'WAVE'))
+    with pytest.raises(ValueError):
+        open_wav(path)
+
+    # Unsupported format (24-bit integers)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4sI4s', b'RIFF', 36, b'WAVE'))
+        f.write(struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, 1, fs, 3*fs, 3, 24))
+        f.write(struct.pack('<4sI', b'data', 6) + bytes(6))
+    with pytest.raises(ValueError):
+        open_wav(path)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32', 'int16', 'complex64'])
+def test_raw_round_trip(tmp_path, dtype):
+    path = str(tmp_path / 'x.raw')
+    x = (1000*signal()).astype(dtype)
+    write_raw(path, x, dtype)
+    y = open_raw(path, dtype)
+    assert y.dtype == dtype
+    np.testing.assert_array_equal(y, x)
+
+
+def test_raw_empty(tmp_path):
+    path = str(tmp_path / 'x.raw')
+    write_raw(path, np.zeros(0))
+    assert open_raw(path).shape == (0,)
+
+
+def test_write_signal(tmp_path):
+    # float32 WAV files and raw float64 files, as read by reciever.py
+    x = signal()
+    write_signal(str(tmp_path / 'x.wav'), x, fs)
+    y, fs_y = open_wav(str(tmp_path / 'x.wav'))
+    assert fs_y == fs
+    np.testing.assert_array_equal(y[:, 0], x.astype(np.float32))
+
+    write_signal(str(tmp_path / 'x.raw'), x, fs)
+    np.testing.assert_array_equal(open_raw(str(tmp_path / 'x.raw')), x)
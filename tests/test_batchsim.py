@@ -0,0 +1,18 @@
+import batchsim
+
+
+def sweep(workers, seed=3):
+    # Low SNRs, so that there are errors to count, and a batch size that
+    # does not divide the number of trials
+    return batchsim.ber_sweep([-10.0, 0.0], [5.0], [0.02], Ntrials=12, Nbits=32, batch=5, seed=seed, workers=workers)
+
+
+def test_results_do_not_depend_on_workers():
+    rows = sweep(1)
+    assert any(r['bit_errors'] > 0 for r in rows)
+    assert sweep(2) == rows
+    assert sweep(3) == rows
+
+
+def test_results_depend_on_seed():
+    assert sweep(1, seed=4) != sweep(1)
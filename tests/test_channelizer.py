@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy.signal import upfirdn
+import wcslib as wcs
+from channels import channel_plan
+from channelizer import FFTChannelizer, MultiChannelReceiver, channel_bands
+from filtercache import local_oscillator
+
+fs = 48000
+Tb = 0.02
+CHANNELS = [11, 14, 15, 20]
+
+
+def capture(constellation=wcs.BPSK, pulse=wcs.RECT, noise=1e-3):
+    """
+    Simultaneous (overlapping) transmissions on all of CHANNELS, with one
+    second of noise before and after them.
+    """
+    x = []
+    for i in CHANNELS:
+        plan = channel_plan(i, fs)
+        bs = wcs.encode_bytes(f'chan {i} says hi'.encode())
+        xb = wcs.encode_baseband_signal(bs, Tb, fs, constellation=constellation, pulse=pulse)
+        x.append(plan.transmit(local_oscillator(fs, plan.fc).modulate(xb)))
+
+    y = np.zeros(max(xi.shape[0] for xi in x) + 2*fs + 1000*len(x))
+    for k, xi in enumerate(x):
+        y[fs+1000*k:fs+1000*k+xi.shape[0]] += 0.3*xi
+    return y + noise*np.random.default_rng(0).standard_normal(y.shape[0])
+
+
+def test_channelizer_matches_upfirdn():
+    x = np.random.default_rng(1).standard_normal(fs//2)
+    channelizer = FFTChannelizer(fs, channel_bands(CHANNELS))
+    y = np.concatenate([channelizer.process(x[k:k+1234]) for k in range(0, x.shape[0], 1234)], axis=-1)
+    for h, yi, lo in zip(channelizer.h, y, channelizer._lo):
+        n = np.arange(x.shape[0])
+        expected = upfirdn(h, x*np.exp(-2j*np.pi*lo.fc/fs*n), down=channelizer.decimation)
+        np.testing.assert_allclose(yi, expected[:yi.shape[0]], rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('blocksize', [300, 4800])
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', [wcs.BPSK, wcs.QPSK], ids=['bpsk', 'qpsk'])
+def test_simultaneous_channels(constellation, pulse, blocksize):
+    y = capture(constellation, pulse)
+    receiver = MultiChannelReceiver(fs, Tb, CHANNELS, constellation=constellation, pulse=pulse)
+    messages = {i: b'' for i in CHANNELS}
+    for k in range(0, y.shape[0], blocksize):
+        for i, data in receiver.process(y[k:k+blocksize]).items():
+            messages[i] += data
+    assert messages == {i: f'chan {i} says hi'.encode() for i in CHANNELS}
+    assert receiver.active == []
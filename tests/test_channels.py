@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy.signal import sosfilt
+import wcslib as wcs
+from channels import ChannelPlan, channel_plan
+from filtercache import local_oscillator
+from stream import DecimatingFrontEnd, StreamingReceiver
+
+MESSAGE = b'Hello constellation!a'
+Tb = 0.02  # Default symbol duration of transmitter.py and reciever.py
+fs = 48000
+
+
+def received_signal(plan, constellation, pulse, noise=1e-3):
+    """
+    The message as received over the plan's bandpass filter, with one
+    second of (noisy) silence before and after it.
+    """
+    bs = wcs.encode_bytes(MESSAGE)
+    xb = wcs.encode_baseband_signal(bs, Tb, fs, constellation=constellation, pulse=pulse)
+    x = plan.transmit(local_oscillator(fs, plan.fc).modulate(xb))
+    y = np.concatenate((np.zeros(fs), 0.3*x, np.zeros(fs)))
+    return y + noise*np.random.default_rng(0).standard_normal(y.shape[0])
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_every_constellation_through_plan_filters(constellation, pulse):
+    plan = channel_plan(15, fs)
+    plan.check_symbol_duration(Tb, pulse, constellation)
+    y = received_signal(plan, constellation, pulse)
+
+    # One-shot: bandpass, IQ demodulation, and lowpass filter of the plan
+    lo = local_oscillator(fs, plan.fc)
+    yf = sosfilt(plan.bandpass, y)
+    yb = sosfilt(plan.lowpass, yf*lo.cos(y.shape[0])) - 1j*sosfilt(plan.lowpass, yf*lo.sin(y.shape[0]))
+    b = wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse)
+    assert wcs.decode_bytes(b) == MESSAGE
+
+    # Streaming, with the decimation filter of the plan (as in reciever.py)
+    frontend = DecimatingFrontEnd(fs, plan.fc, plan.bandpass, plan.decimation_filter(16), 16)
+    receiver = StreamingReceiver(frontend, Tb, constellation=constellation, pulse=pulse)
+    data = b''.join(receiver.process(y[k:k+4800]) for k in range(0, y.shape[0], 4800))
+    assert data == MESSAGE
+
+
+def test_transmit_matches_sosfilt():
+    plan = channel_plan(15, fs)
+    x = np.random.default_rng(1).standard_normal(fs)
+    y = sosfilt(plan.bandpass, x)
+    np.testing.assert_allclose(plan.transmit(x), y, rtol=0, atol=1e-9*np.max(np.abs(y)))
+
+
+def test_check_symbol_duration():
+    plan = channel_plan(15, fs)
+    for constellation in wcs.CONSTELLATIONS.values():
+        plan.check_symbol_duration(Tb, wcs.RECT, constellation)
+
+    # Narrower than the band
+    with pytest.raises(ValueError):
+        plan.check_symbol_duration(plan.min_symbol_duration(wcs.RECT)/2)
+
+    # The intersymbol interference of an order-7 Chebyshev bandpass filter
+    # leaves too little margin for 16QAM at the default symbol duration
+    cheby = ChannelPlan(15, fs, R_p=1, ftype='cheby1')
+    cheby.check_symbol_duration(Tb, wcs.RECT, wcs.QPSK)
+    with pytest.raises(ValueError):
+        cheby.check_symbol_duration(Tb, wcs.RECT, wcs.QAM16)
@@ -0,0 +1,67 @@
+import asyncio
+import collections
+import numpy as np
+import pytest
+from duplex import DuplexEngine, RingBuffer
+
+
+def test_ring_buffer_partial_write_when_full():
+    buf = RingBuffer(10)
+    assert buf.capacity == 10
+    assert buf.write(np.arange(7)) == 7
+    assert buf.write(np.arange(7, 14)) == 3
+    assert len(buf) == 10
+    assert buf.write(np.arange(5)) == 0
+
+    out = np.zeros(12, dtype=np.float32)
+    assert buf.read(out) == 10
+    np.testing.assert_array_equal(out[:10], np.arange(10))
+    assert len(buf) == 0
+    assert buf.read(out) == 0
+
+
+def test_ring_buffer_straddles_the_end():
+    buf = RingBuffer(10)
+    out = np.zeros(10, dtype=np.float32)
+    buf.write(np.arange(8))
+    assert buf.read(out[:6]) == 6
+
+    # Written over the end (2 samples) and the start (5 samples) ...
+    assert buf.write(np.arange(8, 15)) == 7
+    assert len(buf) == 9
+
+    # ... and read back across it
+    assert buf.read(out[:5]) == 5
+    np.testing.assert_array_equal(out[:5], np.arange(6, 11))
+    assert buf.read(out) == 4
+    np.testing.assert_array_equal(out[:4], np.arange(11, 15))
+
+
+def test_ring_buffer_matches_deque():
+    rng = np.random.default_rng(0)
+    buf = RingBuffer(37)
+    fifo = collections.deque()
+    n = 0
+    for _ in range(500):
+        x = np.arange(n, n + rng.integers(0, 50), dtype=np.float32)
+        N = buf.write(x)
+        assert N == min(x.shape[0], 37 - len(fifo))
+        fifo.extend(x[:N])
+        n += N
+
+        out = np.zeros(rng.integers(0, 50), dtype=np.float32)
+        N = buf.read(out)
+        assert N == min(out.shape[0], len(fifo))
+        np.testing.assert_array_equal(out[:N], [fifo.popleft() for _ in range(N)])
+        assert len(buf) == len(fifo)
+
+    buf.clear()
+    assert len(buf) == 0
+
+
+def test_send_before_start():
+    engine = DuplexEngine()
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.send(b'Hello'))
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.receive())
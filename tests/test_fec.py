@@ -0,0 +1,74 @@
+import numpy as np
+import fec
+
+MESSAGE = b'Hello World! ' * 7
+
+
+def test_crc16_check_value():
+    # CRC-16/CCITT-FALSE
+    assert fec.crc16(b'123456789') == 0x29B1
+
+
+def test_hamming_round_trip():
+    b = np.random.default_rng(0).integers(0, 2, 4*64, dtype=np.uint8)
+    c = fec.hamming_encode(b)
+    assert c.shape[0] == 7*64
+    d, corrected = fec.hamming_decode(c)
+    np.testing.assert_array_equal(d, b)
+    assert corrected == 0
+
+
+def test_hamming_corrects_single_bit_errors():
+    b = np.random.default_rng(1).integers(0, 2, 4*16, dtype=np.uint8)
+    c = fec.hamming_encode(b)
+
+    # One error in every codeword, at every position in turn
+    errors = np.zeros((16, 7), dtype=np.uint8)
+    errors[np.arange(16), np.arange(16) % 7] = 1
+    d, corrected = fec.hamming_decode(c ^ errors.ravel())
+    np.testing.assert_array_equal(d, b)
+    assert corrected == 16
+
+
+def test_frames_round_trip():
+    b = fec.encode_frames(MESSAGE)
+    assert b.shape[0] % fec.frame_bits() == 0
+    frames = fec.decode_frames(b)
+    assert all(ok for _, ok in frames)
+    assert b''.join(payload for payload, _ in frames) == MESSAGE
+
+
+def test_frames_correct_single_bit_errors():
+    b = fec.encode_frames(MESSAGE)
+    for k in range(0, b.shape[0], 37):
+        e = b.copy()
+        e[k] ^= 1
+        assert fec.decode_frames(e) == fec.decode_frames(b)
+
+    # The interleaving spreads a burst of 7 errors over 7 codewords
+    e = b.copy()
+    e[100:107] ^= 1
+    assert fec.decode_frames(e) == fec.decode_frames(b)
+
+
+def test_crc_flags_uncorrectable_frames():
+    b = fec.encode_frames(MESSAGE)
+    Nb = fec.frame_bits()
+
+    # Two errors in the first codeword of the second frame (as the Nc
+    # codewords of a frame are interleaved, its bits are Nc bits apart)
+    e = b.copy()
+    Nc = 2*(1 + 32 + 2)
+    e[Nb] ^= 1
+    e[Nb + Nc] ^= 1
+    frames = fec.decode_frames(e)
+    assert [ok for _, ok in frames] == [True, False, True]
+
+
+def test_frame_decoder_matches_decode_frames():
+    data = np.packbits(fec.encode_frames(MESSAGE)).tobytes()
+    decoder = fec.FrameDecoder()
+    frames = []
+    for k in range(0, len(data), 5):
+        frames += decoder.push(data[k:k+5])
+    assert frames == fec.decode_frames(fec.encode_frames(MESSAGE))
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import filtercache
+from filtercache import FilterCache, LocalOscillator
+
+fs = 48000
+
+
+def lowpass(cache, fc):
+    return cache.get('lowpass', fs, fc, 6, 0.5)
+
+
+def test_least_recently_used_filters_are_evicted():
+    cache = FilterCache(maxsize=2)
+    a = lowpass(cache, 1000)
+    b = lowpass(cache, 2000)
+    assert lowpass(cache, 1000) is a
+
+    # b is the least recently used, and evicted by c
+    c = lowpass(cache, 3000)
+    assert len(cache) == 2
+    assert lowpass(cache, 1000) is a
+    assert lowpass(cache, 3000) is c
+    b2 = lowpass(cache, 2000)
+    assert b2 is not b
+    np.testing.assert_array_equal(b2, b)
+
+    # ... and then a (c was used after it)
+    assert lowpass(cache, 3000) is c
+    assert lowpass(cache, 1000) is not a
+
+
+def test_save_and_load(tmp_path, monkeypatch):
+    path = str(tmp_path / 'filters.npz')
+    replaced = []
+    replace = os.replace
+    monkeypatch.setattr(filtercache.os, 'replace', lambda src, dst: replaced.append((src, dst)) or replace(src, dst))
+
+    # Every new filter (or order, or impulse response) is saved to the file,
+    # which is written aside and then replaced at once
+    cache = FilterCache(path=path)
+    sos = cache.get('bandpass', fs, (4000, 5000), 4, 0.5)
+    ellip = cache.get('lowpass', fs, 1500, 5, 0.1, 60, 'ellip')
+    order = cache.order('cheby1', fs, 1000, 1500, 1, 40)
+    h = cache.impulse_response('bandpass', fs, (4000, 5000), 4, 0.5)
+    assert len(replaced) == 4
+    assert all(src != dst and dst == path for src, dst in replaced)
+    assert os.listdir(tmp_path) == ['filters.npz']
+
+    loaded = FilterCache(path=path)
+    assert len(loaded) == len(cache)
+    for key, value in cache._filters.items():
+        np.testing.assert_array_equal(loaded._filters[key], value)
+    np.testing.assert_array_equal(loaded.get('bandpass', fs, (4000, 5000), 4, 0.5), sos)
+    np.testing.assert_array_equal(loaded.get('lowpass', fs, 1500, 5, 0.1, 60, 'ellip'), ellip)
+    assert loaded.order('cheby1', fs, 1000, 1500, 1, 40) == order
+    h2 = loaded.impulse_response('bandpass', fs, (4000, 5000), 4, 0.5)
+    np.testing.assert_array_equal(h2, h)
+    assert not h2.flags.writeable
+
+
+def test_saved_filters_load_without_scipy(tmp_path):
+    path = str(tmp_path / 'filters.npz')
+    cache = FilterCache(path=path)
+    sos = cache.get('bandpass', fs, (4000, 5000), 4, 0.5)
+    h = cache.impulse_response('bandpass', fs, (4000, 5000), 4, 0.5)
+
+    # (importing scipy fails in the child process)
+    out = str(tmp_path / 'out.npz')
+    script = (
+        "import sys; sys.modules['scipy'] = None\n"
+        "import numpy as np\n"
+        "from filtercache import FilterCache\n"
+        f"cache = FilterCache(path={path!r})\n"
+        f"np.savez({out!r}, sos=cache.get('bandpass', {fs}, (4000, 5000), 4, 0.5), "
+        f"h=cache.impulse_response('bandpass', {fs}, (4000, 5000), 4, 0.5))\n"
+    )
+    root = os.path.dirname(os.path.abspath(filtercache.__file__))
+    subprocess.run([sys.executable, '-c', script], cwd=root, check=True)
+    with np.load(out) as data:
+        np.testing.assert_array_equal(data['sos'], sos)
+        np.testing.assert_array_equal(data['h'], h)
+
+
+@pytest.mark.parametrize('n0', [0, 7, 120, 1000, 123457])
+@pytest.mark.parametrize('fc', [4400, 1000, 11025])
+def test_local_oscillator_matches_sin(fc, n0):
+    lo = LocalOscillator(fs, fc)
+    assert (fc*lo.period) % fs == 0
+    N = 3*lo.period + 11
+    k = n0 + np.arange(N)
+    sin = np.sin(2*np.pi*fc*k/fs)
+    cos = np.cos(2*np.pi*fc*k/fs)
+    np.testing.assert_allclose(lo.sin(N, n0), sin, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(lo.cos(N, n0), cos, rtol=0, atol=1e-9)
+
+    rng = np.random.default_rng(n0)
+    xb = rng.standard_normal(N)
+    np.testing.assert_allclose(lo.modulate(xb, n0), xb*sin, rtol=0, atol=1e-9)
+    xb = xb + 1j*rng.standard_normal(N)
+    np.testing.assert_allclose(lo.modulate(xb, n0), xb.real*sin + xb.imag*cos, rtol=0, atol=1e-9)
+
+    # The table holds the carrier from any sample on
+    c, s = lo.table(N)
+    np.testing.assert_allclose(s[n0 % lo.period:n0 % lo.period + N], sin, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(c[n0 % lo.period:n0 % lo.period + N], cos, rtol=0, atol=1e-9)
+
+
+def test_aperiodic_carrier_is_rejected():
+    with pytest.raises(ValueError):
+        LocalOscillator(fs, 1000*np.pi)
@@ -0,0 +1,75 @@
+import numpy as np
+import packet
+
+MESSAGE = b'Hello constellation! ' * 6
+SIZE = 32
+PACKETS = [MESSAGE[k:k+SIZE] for k in range(0, len(MESSAGE), SIZE)]
+
+
+def received(bits):
+    return packet.PacketDecoder().push(bits=bits)
+
+
+def test_round_trip():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    assert received(bits) == [(p, True) for p in PACKETS]
+
+    # Bytes, pushed a few at a time
+    data = np.packbits(bits).tobytes()
+    decoder = packet.PacketDecoder()
+    packets = []
+    for k in range(0, len(data), 3):
+        packets += decoder.push(data[k:k+3])
+    assert packets == [(p, True) for p in PACKETS]
+
+
+def test_unaligned_packets_after_noise():
+    noise = np.random.default_rng(0).integers(0, 2, 1001, dtype=np.uint8)
+    bits = np.concatenate((noise, packet.encode_packets(MESSAGE, size=SIZE)))
+    assert received(bits) == [(p, True) for p in PACKETS]
+
+
+def test_preamble_bit_errors_are_tolerated():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    bits[[3, 17]] ^= 1
+    assert received(bits) == [(p, True) for p in PACKETS]
+
+
+def test_resync_after_corrupted_preamble():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    Nb = packet.encode_packet(PACKETS[0]).shape[0]
+
+    # Only the packet whose preamble is lost is lost
+    bits[Nb:Nb+8] ^= 1
+    assert received(bits) == [(p, True) for k, p in enumerate(PACKETS) if k != 1]
+
+
+def test_resync_after_bit_slip():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    Nb = packet.encode_packet(PACKETS[0]).shape[0]
+
+    # A bit lost in the payload of the first packet
+    bits = np.delete(bits, Nb//2)
+    packets = received(bits)
+    assert packets[0][1] is False
+    assert packets[1:] == [(p, True) for p in PACKETS[1:]]
+
+
+def test_corrupt_header_is_reported():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    Np = packet.PREAMBLE.shape[0]
+    bits[Np + 5] ^= 1
+    assert received(bits) == [(b'', False)] + [(p, True) for p in PACKETS[1:]]
+
+
+def test_corrupt_payload_is_reported():
+    bits = packet.encode_packets(MESSAGE, size=SIZE)
+    bits[100] ^= 1
+    packets = received(bits)
+    assert packets[0][1] is False
+    assert packets[1:] == [(p, True) for p in PACKETS[1:]]
+
+
+def test_no_false_packets_in_noise():
+    bits = np.random.default_rng(1).integers(0, 2, 200000, dtype=np.uint8)
+    assert received(bits) == []
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from scipy.signal import sosfilt, upfirdn
+import wcslib as wcs
+from channels import channel_plan
+from filtercache import local_oscillator
+from stream import ReceiverFrontEnd, DecimatingFrontEnd, PolyphaseDecimator
+
+MESSAGE = b'Hello constellation!a'
+fs = 48000
+plan = channel_plan(15, fs)
+frontend = ReceiverFrontEnd(fs, plan.fc, plan.bandpass, plan.lowpass)
+
+
+def received(Tb, constellation, pulse, noise, sync=(1, 0)):
+    """
+    The message as received over the channel, with one second of (noisy) 
+    silence before and after it.
+    """
+    bs = wcs.encode_bytes(MESSAGE)
+    xb = wcs.encode_baseband_signal(bs, Tb, fs, sync=sync, constellation=constellation, pulse=pulse)
+    x = sosfilt(plan.bandpass, local_oscillator(fs, plan.fc).modulate(xb))
+    y = np.concatenate((np.zeros(fs), 0.3*x, np.zeros(fs)))
+    return y + noise*np.random.default_rng(0).standard_normal(y.shape[0])
+
+
+def baseband(Tb, constellation, pulse, noise, sync=(1, 0)):
+    """
+    The complex baseband signal of the message as received over the channel.
+    """
+    y = received(Tb, constellation, pulse, noise, sync)
+    return ReceiverFrontEnd(fs, plan.fc, plan.bandpass, plan.lowpass).process(y)
+
+
+def decoder(Tb, constellation, pulse, sync=(1, 0)):
+    """
+    The streaming decoder for the output of the front end.
+    """
+    return wcs.BasebandDecoder(Tb, fs, sync=sync, constellation=constellation, pulse=pulse, delay=frontend.delay)
+
+
+def check_streaming_matches_one_shot(Tb, constellation, pulse, noise):
+    yb = baseband(Tb, constellation, pulse, noise)
+    b = wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse)
+    assert wcs.decode_bytes(b) == MESSAGE
+
+    for blocksize in (4800, 1000, 777):
+        dec = decoder(Tb, constellation, pulse)
+        bits = np.concatenate([dec.push_iq(yb[k:k+blocksize]) for k in range(0, yb.shape[0], blocksize)])
+        np.testing.assert_array_equal(bits, b)
+        assert not dec.active
+
+
+@pytest.mark.parametrize('noise', [1e-3, 1e-2])
+@pytest.mark.parametrize('Tb', [0.02, 0.04])
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_streaming_matches_one_shot(constellation, Tb, noise):
+    check_streaming_matches_one_shot(Tb, constellation, wcs.RECT, noise)
+
+
+@pytest.mark.parametrize('noise', [1e-3, 1e-2])
+@pytest.mark.parametrize('Tb', [0.02, 0.04])
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_streaming_matches_one_shot_rrc(constellation, Tb, noise):
+    check_streaming_matches_one_shot(Tb, constellation, wcs.RRC, noise)
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_streaming_ends_every_transmission(constellation, pulse):
+    # Two transmissions in a row: the first must end at its last symbol, so
+    # that its bits are followed by those of the second only
+    Tb = 0.02
+    yb = baseband(Tb, constellation, pulse, 1e-3)
+    b = wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse)
+    yb = np.concatenate((yb, yb))
+    dec = decoder(Tb, constellation, pulse)
+    bits = np.concatenate([dec.push_iq(yb[k:k+4800]) for k in range(0, yb.shape[0], 4800)])
+    np.testing.assert_array_equal(bits, np.concatenate((b, b)))
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_float32_matches_float64(constellation, pulse):
+    # The front end and the decoder in single precision decide the same bits
+    # as in double precision
+    Tb = 0.02
+    y = received(Tb, constellation, pulse, 2e-2)
+    bits = {}
+    for dtype in ('float64', 'float32'):
+        fe = ReceiverFrontEnd(fs, plan.fc, plan.bandpass, plan.lowpass, dtype)
+        dec = wcs.BasebandDecoder(Tb, fs, constellation=constellation, pulse=pulse, delay=fe.delay, dtype=dtype)
+        bits[dtype] = np.concatenate([dec.push_iq(fe.process(y[k:k+1000])) for k in range(0, y.shape[0], 1000)])
+    assert wcs.decode_bytes(bits['float64']) == MESSAGE
+    np.testing.assert_array_equal(bits['float32'], bits['float64'])
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_barker13_round_trip(constellation, pulse):
+    Tb = 0.02
+    yb = baseband(Tb, constellation, pulse, 1e-2, wcs.BARKER13)
+    b = wcs.decode_baseband_iq(yb, Tb, fs, sync=wcs.BARKER13, constellation=constellation, pulse=pulse)
+    assert wcs.decode_bytes(b) == MESSAGE
+
+    for blocksize in (4800, 777):
+        dec = decoder(Tb, constellation, pulse, wcs.BARKER13)
+        bits = np.concatenate([dec.push_iq(yb[k:k+blocksize]) for k in range(0, yb.shape[0], blocksize)])
+        np.testing.assert_array_equal(bits, b)
+        assert not dec.active
+
+
+@pytest.mark.parametrize('out', [False, True], ids=['new', 'out'])
+@pytest.mark.parametrize('blocksize', [1, 7, 16, 333, 1001])
+@pytest.mark.parametrize('decimation', [3, 16])
+def test_polyphase_decimator_matches_upfirdn(decimation, blocksize, out):
+    rng = np.random.default_rng(3)
+    h = rng.standard_normal(61)
+    x = rng.standard_normal(5000) + 1j*rng.standard_normal(5000)
+    decimator = PolyphaseDecimator(h, decimation)
+    y = []
+    for k in range(0, x.shape[0], blocksize):
+        buf = np.empty(decimator.max_output(blocksize), dtype=complex) if out else None
+        y.append(decimator.process(x[k:k+blocksize], buf).copy())
+    y = np.concatenate(y)
+    assert y.shape[0] == -(-x.shape[0]//decimation)
+    np.testing.assert_allclose(y, upfirdn(h, x, down=decimation)[:y.shape[0]], rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('blocksize', [1, 333, 1001, 4801])
+def test_decimating_frontend_matches_upfirdn(blocksize):
+    h = plan.decimation_filter(16)
+    x = np.random.default_rng(4).standard_normal(fs//2)
+    frontend = DecimatingFrontEnd(fs, plan.fc, plan.bandpass, h, 16)
+    y = np.concatenate([frontend.process(x[k:k+blocksize]) for k in range(0, x.shape[0], blocksize)])
+    n = np.arange(x.shape[0])
+    expected = upfirdn(h, sosfilt(plan.bandpass, x)*np.exp(-2j*np.pi*plan.fc/fs*n), down=16)
+    assert y.shape[0] == x.shape[0]//16
+    np.testing.assert_allclose(y, expected[:y.shape[0]], rtol=0, atol=1e-9)
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from scipy.signal import lfilter
+import wcslib as wcs
+
+fs = 48000
+Tb = 0.02
+
+
+@pytest.mark.parametrize('K', [1, 7, 960])
+def test_moving_sum_matches_lfilter(K):
+    x = np.random.default_rng(0).standard_normal((3, 5000))
+    np.testing.assert_allclose(wcs._moving_sum(x, K), lfilter(np.ones(K), 1, x, axis=-1), rtol=0, atol=1e-9)
+
+
+def test_moving_sum_shorter_than_window():
+    x = np.random.default_rng(1).standard_normal(50)
+    np.testing.assert_allclose(wcs._moving_sum(x, 100), np.cumsum(x), rtol=0, atol=1e-12)
+
+
+def test_moving_sum_of_detections():
+    d = np.random.default_rng(2).random(2000) > 0.3
+    np.testing.assert_array_equal(wcs._moving_sum(d, 48), lfilter(np.ones(48), 1, d.astype(float)))
+
+
+TRACKED = b'Hello constellation! Tracking the carrier.'
+
+
+def impaired_burst(constellation, pulse, cfo=0.0, drift=0.0):
+    """
+    A noisy baseband burst of TRACKED, received with a carrier-frequency
+    offset of `cfo` Hz, and with a sampling clock faster by the fraction
+    `drift` than the transmitter's.
+    """
+    bs = wcs.encode_bytes(TRACKED)
+    xb = wcs.encode_baseband_signal(bs, Tb, fs, constellation=constellation, pulse=pulse)
+    xb = np.concatenate((np.zeros(fs//2), xb, np.zeros(fs//2))).astype(complex)
+    n = np.arange(xb.shape[0])
+    t = n*(1 + drift)
+    yb = (np.interp(t, n, xb.real) + 1j*np.interp(t, n, xb.imag))*np.exp(2j*np.pi*cfo/fs*n + 0.3j)
+    rng = np.random.default_rng(3)
+    return yb + 1e-2*(rng.standard_normal(n.shape) + 1j*rng.standard_normal(n.shape))
+
+
+def check_tracking(yb, constellation, pulse):
+    # Decoded with tracking (one-shot and streaming), and not without
+    for track in (False, True):
+        b = wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse, track=track)
+        dec = wcs.BasebandDecoder(Tb, fs, constellation=constellation, pulse=pulse, track=track)
+        bs = np.concatenate([dec.push_iq(yb[k:k+1000]) for k in range(0, yb.shape[0], 1000)])
+        assert (wcs.decode_bytes(b) == TRACKED) == track
+        assert (wcs.decode_bytes(bs) == TRACKED) == track
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_tracking_carrier_frequency_offset(constellation, pulse):
+    check_tracking(impaired_burst(constellation, pulse, cfo=0.5), constellation, pulse)
+
+
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_tracking_clock_drift(constellation):
+    check_tracking(impaired_burst(constellation, wcs.RECT, drift=5e-3), constellation, wcs.RECT)
+
+
+def unwrapped(xp, alpha=np.pi/8):
+    """
+    The phase unwrapped as by the decoder before it worked in the complex
+    domain: phases close below pi are wrapped to -pi, and all are rotated
+    by `alpha`.
+    """
+    close = (np.pi - xp < alpha) & (np.pi - xp > 0)
+    return np.where(close, xp - 2*np.pi, xp) + alpha
+
+
+def phase_components(yb, xm, constellation, pulse=wcs.RECT):
+    """
+    The averaged components from the magnitude and the phase, as by the 
+    decoder before it worked in the complex domain.
+    """
+    xp = np.angle(yb)
+    if constellation.constant_modulus and pulse.rect:
+        return np.stack((np.cos(xp), np.sin(xp)))
+    return np.stack((xm*np.cos(xp), xm*np.sin(xp)))
+
+
+def test_phase_sign_matches_unwrapped_phase():
+    rng = np.random.default_rng(4)
+    yb = rng.standard_normal(10000) + 1j*rng.standard_normal(10000)
+    np.testing.assert_array_equal(wcs._phase_sign(yb), np.sign(unwrapped(np.angle(yb))))
+
+
+@pytest.mark.parametrize('pulse', wcs.PULSES.values(), ids=list(wcs.PULSES))
+@pytest.mark.parametrize('constellation', wcs.CONSTELLATIONS.values(), ids=list(wcs.CONSTELLATIONS))
+def test_iq_decoder_matches_phase_decoder(constellation, pulse, monkeypatch):
+    yb = impaired_burst(constellation, pulse)
+    xm, xp = np.abs(yb), np.angle(yb)
+    b = wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse)
+    assert wcs.decode_bytes(b) == TRACKED
+    np.testing.assert_allclose(wcs._iq_components(yb, xm, constellation, pulse), phase_components(yb, xm, constellation, pulse), rtol=0, atol=1e-12)
+
+    # The magnitude and phase wrapper decodes the same, without modifying
+    # the phase
+    xp0 = xp.copy()
+    np.testing.assert_array_equal(wcs.decode_baseband_signal(xm, xp, Tb, fs, constellation=constellation, pulse=pulse), b)
+    np.testing.assert_array_equal(xp, xp0)
+
+    # And so does the decoder computing (and unwrapping) the phase
+    monkeypatch.setattr(wcs, '_phase_sign', lambda yb, alpha=np.pi/8: np.sign(unwrapped(np.angle(yb), alpha)))
+    monkeypatch.setattr(wcs, '_iq_components', phase_components)
+    np.testing.assert_array_equal(wcs.decode_baseband_iq(yb, Tb, fs, constellation=constellation, pulse=pulse), b)
+
+
+IMPAIRMENTS = {
+    'multipath': {'taps': 3, 'spread': 0.005},
+    'interferers': {'interferers': 3},
+    'noise_color': {'noise_color': 1.0},
+    'cfo': {'cfo': 1.0},
+    'all': {'taps': 3, 'spread': 0.005, 'interferers': 3, 'noise_color': 1.0, 'cfo': 1.0},
+}
+
+
+@pytest.mark.parametrize('impairments', IMPAIRMENTS.values(), ids=list(IMPAIRMENTS))
+def test_channel_batch_is_reproducible(impairments):
+    x = np.random.default_rng(5).standard_normal((4, 3000))
+    y = wcs.simulate_channel_batch(x, fs, 15, rng=np.random.default_rng(6), **impairments)
+
+    # Padded by the delay at dmax, the spread of the echoes, and 0.5 s
+    Ny = 3000 + round(5.0/340*fs) + round(impairments.get('spread', 0.0)*fs) + fs//2
+    assert y.shape == (4, Ny)
+    assert np.all(np.isfinite(y))
+    np.testing.assert_array_equal(wcs.simulate_channel_batch(x, fs, 15, rng=np.random.default_rng(6), **impairments), y)
+    assert not np.array_equal(wcs.simulate_channel_batch(x, fs, 15, rng=np.random.default_rng(7), **impairments), y)
+
+
+def test_channel_batch_reduces_to_simulate_channel():
+    # One trial, a single path, one interferer, no offset, and the signal 
+    # padded as in simulate_channel() (no delay)
+    x = np.random.default_rng(5).standard_normal(3000)
+    y = wcs.simulate_channel_batch(x, fs, 15, dmax=0.0, rng=np.random.default_rng(6), taps=1, interferers=1, cfo=0.0)
+    np.testing.assert_array_equal(y[0], wcs.simulate_channel(x, fs, 15, dmax=0.0, rng=np.random.default_rng(6)))
+
+
+def test_channel_batch_delays_and_attenuates():
+    # Without noise and interferers, every trial is its signal delayed by the
+    # distance and attenuated
+    x = np.random.default_rng(5).standard_normal((8, 3000))
+    y = wcs.simulate_channel_batch(x, fs, 15, SNR=np.inf, rng=np.random.default_rng(6), interferers=0)
+    for xi, yi in zip(x, y):
+        m = np.argmax(yi != 0)
+        A = yi[m]/xi[0]
+        assert 0 <= m <= round(5.0/340*fs)
+        assert np.exp(-0.25*5.0) <= A <= 1
+        np.testing.assert_allclose(yi[m:m+3000], A*xi, rtol=1e-12)
+        assert not np.any(yi[m+3000:])
@@ -1,54 +1,90 @@
 import sys
 import numpy as np
 import wcslib as wcs
-import sounddevice as sd
-from scipy.signal import sosfilt
-from bandpass import create_bandpass_filter
+from channels import channel_plan
+from filtercache import local_oscillator
+from audiofile import write_signal
+import fec
+import packet
 
 # Properties
-fc = 4400  # Carrier frequency
+channel_id = 15  # Group number
 Tb = 0.02  # Symbol duration
 fs = 48000  # Sampling frequency
+constellation = wcs.BPSK  # Modulation (wcs.BPSK, QPSK, PSK8, or QAM16)
+pulse = wcs.RECT  # Pulse shape (wcs.RECT, or wcs.RRC for shorter Tb)
+framing = None  # None, 'fec' (Hamming-coded frames, see fec.py), or 'packet' (see packet.py)
+R_p = 0.1  # Passband ripple of the bandpass filter
+R_s = 40  # Stopband attenuation of the bandpass filter
 
-# Detect input or set defaults
-string_data = True
-if len(sys.argv) == 2:
-    data = str(sys.argv[1])
 
-elif len(sys.argv) == 3 and str(sys.argv[1]) == '-b':
-    string_data = False
-    data = str(sys.argv[2])
+def main(argv=None):
 
-else:
-    data = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deserunt mollit anim id est laborum."
-    print(f'Transmitting "{data}"', file=sys.stderr)
-# Convert string to bit sequence or string bit sequence to numeric bit sequence
-if string_data:
-    bs = wcs.encode_string(data + "a")
-else:
-    bs = np.array([bit for bit in map(int, data)])
+    # Carrier and bandpass filter of the channel (of the lowest order that meets
+    # the specifications, see channels.py)
+    plan = channel_plan(channel_id, fs, R_p, R_s)
+    plan.check_symbol_duration(Tb, pulse, constellation)
+    fc = plan.fc
 
-# Encode baseband signal
-xb = wcs.encode_baseband_signal(bs, Tb, fs)
+    # Write the signal to a file (WAV or raw float64) instead of playing it if
+    # given as -o path
+    args = sys.argv[1:] if argv is None else list(argv)
+    output = None
+    if len(args) >= 2 and args[0] == '-o':
+        output = args[1]
+        args = args[2:]
 
-# Carrier signal
-xc = np.sin(2 * np.pi * fc * np.arange(len(xb)) / fs)  
+    # Detect input or set defaults
+    string_data = True
+    if len(args) == 1:
+        data = str(args[0])
 
-# Modulated signal
-xm = xb * xc
+    elif len(args) == 2 and str(args[0]) == '-b':
+        string_data = False
+        data = str(args[1])
 
-# Filter specifications
-f_low = 4300  # Lower passband frequency
-f_high = 4500  # Upper passband frequency
-R_p = 1  # Passband ripple
-R_s = 40  # Stopband attenuation
+    elif len(args) == 2 and str(args[0]) == '-f':
+        # Contents of a file, or of the standard input if given as -f -
+        string_data = True
+        data = wcs.encode_file(str(args[1]))
 
-# Create the bandpass filter
-sos = create_bandpass_filter(fs, f_low, f_high, R_p, R_s)
+    else:
+        data = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deserunt mollit anim id est laborum."
+        print(f'Transmitting "{data}"', file=sys.stderr)
 
-# Bandpass filter the modulated signal
-filtered_signal = sosfilt(sos, xm)
+    # Convert string (UTF-8) or file contents to bit sequence, or string bit
+    # sequence to numeric bit sequence (frames and packets carry their length, so
+    # no trailing "a" is needed)
+    if string_data:
+        bs = wcs.encode_string(data) if isinstance(data, str) else data
+        if framing == 'fec':
+            bs = fec.encode_frames(wcs.decode_bytes(bs))
+        elif framing == 'packet':
+            bs = packet.encode_packets(wcs.decode_bytes(bs))
+        else:
+            bs = np.concatenate((bs, wcs.encode_string("a")))
+    else:
+        bs = wcs.parse_bits(data)
 
-# Play the filtered signal
-sd.play(filtered_signal, fs)
-sd.wait()
+    # Encode baseband signal
+    xb = wcs.encode_baseband_signal(bs, Tb, fs, constellation=constellation, pulse=pulse)
+
+    # Modulated signal (carrier tiled from one period)
+    xm = local_oscillator(fs, fc).modulate(xb)
+
+    # Bandpass filter the modulated signal (by FFT convolution, see
+    # channels.py)
+    filtered_signal = plan.transmit(xm)
+
+    # Play the filtered signal, or write it to the file
+    if output is not None:
+        write_signal(output, filtered_signal, fs)
+    else:
+        # Only needed when playing, writing files works without a sound card
+        import sounddevice as sd
+        sd.play(filtered_signal, fs)
+        sd.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,15 @@ Library for the wireless communication system project in Signals and Transforms
 2020-present -- Roland Hostettler <roland.hostettler@angstrom.uu.se>
 """
 
+import functools
+import os
+import sys
 import numpy as np
-from scipy import signal
-from scipy.stats import chi2
+from instrument import traced
+
+# N.B: scipy.signal and scipy.stats are imported by the functions that need 
+# them: importing them takes much longer than encoding and modulating a 
+# message, which thus works with numpy alone (see cli.py).
 
 # List of channels and their max average power [fl, fu, Pmax]^T
 _channels = np.array([
@@ -17,6 +23,223 @@ _channels = np.array([
     [np.nan,   30,   33,   27,   33,   33,   33,   30,   27,   30,   33,   33,   27,   33,   30,   30,   33,   27,   33,   30,   27,   30, np.nan]
 ])
 
+# Barker sequence of length 13 (as bits), a synchronization sequence with low
+# autocorrelation sidelobes for use instead of the default [1, 0]
+BARKER13 = (1, 1, 1, 1, 1, 0, 0, 1, 1, 0, 1, 0, 1)
+
+# Number of symbols per block of the symbol-timing and carrier-phase tracking
+# (see decode_baseband_iq())
+_TRACK_BLOCK = 4
+
+# Confidence of the chi-squared detection test (see decode_baseband_iq()). 
+# And for the detection relative to the noise floor, the probabilities that
+# noise is not taken for the start of a transmission, and for its 
+# continuation (lower, so that weak symbols do not end it, see 
+# _detect_noise_floor())
+DETECTION_CONFIDENCE = 0.99
+_START_CONFIDENCE = 1 - 1e-8
+_HOLD_CONFIDENCE = 0.99
+
+class Constellation:
+    """
+    Symbols of a digital modulation and their (Gray-coded) bit labels.
+
+    The symbols are normalized to an average energy of 1, the energy of the
+    synchronization symbols, so that the reference symbol recovered from the
+    synchronization sequence also sets the amplitude scale of the decisions.
+
+    Parameters
+    ----------
+    name : str
+        Name of the modulation.
+    points : numpy.array
+        The complex symbols, where `points[i]` encodes the bits of the
+        integer `i` (most significant bit first).
+    """
+
+    def __init__(self, name: str, points):
+        points = np.asarray(points, dtype=complex)
+        self.name = name
+        self.bits_per_symbol = int(np.log2(points.shape[0]))
+        self.points = points/np.sqrt(np.mean(np.abs(points)**2))
+        self.min_energy = float(np.min(np.abs(self.points)**2))
+        self.constant_modulus = bool(np.allclose(np.abs(self.points), 1))
+        self.real = bool(np.all(self.points.imag == 0))
+        self._weights = 2**np.arange(self.bits_per_symbol-1, -1, -1)
+        self._labels = (np.arange(points.shape[0])[:, np.newaxis] & self._weights) > 0
+
+    def __repr__(self):
+        return f'Constellation({self.name!r})'
+
+    def map(self, b):
+        """
+        Maps the bits `b` to symbols, `bits_per_symbol` bits per symbol along
+        the last axis (padded with zeros to a multiple of `bits_per_symbol`).
+        """
+
+        b = np.asarray(b)
+        pad = -b.shape[-1] % self.bits_per_symbol
+        if pad:
+            b = np.concatenate((b, np.zeros(b.shape[:-1] + (pad,), dtype=b.dtype)), axis=-1)
+        b = b.reshape(b.shape[:-1] + (-1, self.bits_per_symbol))
+        return self.points[b @ self._weights]
+
+    def nearest(self, z):
+        """
+        Indices of the symbols nearest to `z` (already derotated and scaled
+        to the constellation).
+        """
+        return np.argmin(np.abs(z[..., np.newaxis] - self.points)**2, axis=-1)
+
+    def decide(self, z):
+        """
+        Decides the bits of the symbols `z` (already derotated and scaled to 
+        the constellation) by the nearest symbol, for all symbols at once.
+        Returns `bits_per_symbol` bits per symbol along the last axis.
+        """
+        return self._labels[self.nearest(z)].reshape(z.shape[:-1] + (-1,))
+
+def _gray(n: int):
+    """Gray code of the integers 0, ..., n-1."""
+    i = np.arange(n)
+    return i ^ (i >> 1)
+
+def _psk(M: int):
+    """M-PSK symbols in label order (Gray-coded around the circle)."""
+    points = np.empty(M, dtype=complex)
+    points[_gray(M)] = np.exp(2j*np.pi*np.arange(M)/M)
+    return points
+
+def _qam(M: int):
+    """Square M-QAM symbols in label order (Gray-coded per axis)."""
+    L = int(np.sqrt(M))
+    levels = np.empty(L)
+    levels[_gray(L)] = np.arange(-(L-1), L, 2)
+    return (levels[:, np.newaxis] + 1j*levels[np.newaxis, :]).ravel()
+
+# Binary phase-shift keying (the default; 0 -> -1, 1 -> 1), quaternary and 
+# 8-ary phase-shift keying, and 16-ary quadrature amplitude modulation
+BPSK = Constellation('bpsk', [-1, 1])
+QPSK = Constellation('qpsk', _qam(4))
+PSK8 = Constellation('8psk', _psk(8))
+QAM16 = Constellation('16qam', _qam(16))
+CONSTELLATIONS = {c.name: c for c in (BPSK, QPSK, PSK8, QAM16)}
+
+class PulseShape:
+    """
+    Shape of the transmitted pulses and the matching receive filter.
+
+    The rect pulse (of one symbol duration) has a sinc spectrum, whose 
+    sidelobes reach far outside the channel and are cut by the bandpass 
+    filters, which causes intersymbol interference at short symbol 
+    durations. The root-raised-cosine (RRC) pulse is band-limited to 
+    `(1 + rolloff)/(2*Tb)` around the carrier and, filtered with the same 
+    pulse in the receiver, free of intersymbol interference (a raised 
+    cosine), which allows shorter symbol durations in the same channel. It
+    spans `span` symbols (truncated), and thus delays the decisions by 
+    `(span - 1)/2` symbols.
+
+    Parameters
+    ----------
+    name : str
+        'rect' or 'rrc'.
+    rolloff : float, default 0.35
+        Roll-off factor of the RRC pulse, between 0 and 1.
+    span : int, default 8
+        Length of the RRC pulse in symbols (even).
+    """
+
+    def __init__(self, name: str, rolloff: float=0.35, span: int=8):
+        if name not in ('rect', 'rrc'):
+            raise ValueError(f'Unknown pulse shape {name!r}.')
+        self.name = name
+        self.rolloff = rolloff
+        self.span = span
+        self._taps = {}
+
+    def __repr__(self):
+        return f'PulseShape({self.name!r})'
+
+    @property
+    def rect(self):
+        """True for the rect pulse."""
+        return self.name == 'rect'
+
+    def taps(self, Kb: int):
+        """
+        Returns the (cached) pulse for `Kb` samples per symbol, with an 
+        energy of `Kb` (that of the rect pulse of amplitude 1).
+        """
+
+        if Kb not in self._taps:
+            if self.rect:
+                h = np.ones(Kb)
+            else:
+                h = _rrc(Kb, self.rolloff, self.span)
+                h *= np.sqrt(Kb/np.sum(h**2))
+            h.flags.writeable = False
+            self._taps[Kb] = h
+        return self._taps[Kb]
+
+    def delay(self, Kb: int):
+        """
+        The delay of the peak of the receive filter's response to a symbol
+        after the end of the symbol's slot of `Kb` samples, in samples (0 for
+        the rect pulse).
+        """
+        return (self.taps(Kb).shape[0] - Kb)//2
+
+    def expand(self, symbols, Kb: int):
+        """
+        Generates the baseband signal of the `symbols` (along the last axis),
+        one every `Kb` samples. The signal of the RRC pulse is longer by 
+        `span*Kb` samples and starts `delay(Kb)` samples earlier.
+        """
+
+        if self.rect:
+            # Filtering an impulse every Kb samples with a rect of length Kb
+            # is the same as repeating each value Kb times
+            return np.repeat(symbols, Kb, axis=-1)
+        from scipy import signal
+        return signal.upfirdn(self.taps(Kb), symbols, up=Kb, axis=-1)
+
+    def average(self, x, Kb: int):
+        """
+        The receive (matched) filter, normalized such that the output at the
+        end of each symbol's slot (see `delay()`) is the symbol, along the 
+        last axis. For the rect pulse, this is the average over the last 
+        `Kb` samples.
+        """
+
+        if self.rect:
+            return _moving_sum(x, Kb)/Kb
+        from scipy import signal
+        h = self.taps(Kb)/Kb
+        N = x.shape[-1]
+        D = self.delay(Kb)
+        y = signal.fftconvolve(x, h.reshape((1,)*(x.ndim-1) + (-1,)), axes=-1)
+        return y[..., D:D+N]
+
+def _rrc(Kb: int, rolloff: float, span: int):
+    """
+    Root-raised-cosine pulse of `span` symbols with `Kb` samples per symbol
+    (unnormalized, peak in the middle).
+    """
+
+    t = np.arange(-span*Kb//2, span*Kb//2 + 1)/Kb
+    b = rolloff
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = (np.sin(np.pi*t*(1 - b)) + 4*b*t*np.cos(np.pi*t*(1 + b)))/(np.pi*t*(1 - (4*b*t)**2))
+    h[t == 0] = 1 - b + 4*b/np.pi
+    if b > 0:
+        h[np.isclose(np.abs(t), 1/(4*b))] = b/np.sqrt(2)*((1 + 2/np.pi)*np.sin(np.pi/(4*b)) + (1 - 2/np.pi)*np.cos(np.pi/(4*b)))
+    return h
+
+# Rect pulses (the default) and root-raised-cosine pulses (roll-off 0.35)
+RECT = PulseShape('rect')
+RRC = PulseShape('rrc')
+PULSES = {p.name: p for p in (RECT, RRC)}
+
 def encode_string(instr):
     """
     Converts a string to a binary numpy array.
@@ -24,15 +247,80 @@ def encode_string(instr):
     Parameters
     ----------
     instr : str
-        A UTf-8 encoded Python string.
+        A Python string, encoded as UTF-8.
 
     Returns
     -------
     binary : numpy.array
         A binary array encoding the string.
     """
-    tmp = [np.uint8(ord(c)) for c in instr]
-    return np.unpackbits(tmp)
+    return encode_bytes(instr.encode('utf-8'))
+
+
+def encode_bytes(data):
+    """
+    Converts bytes to a binary numpy array. Objects supporting the buffer
+    protocol (e.g., bytes, bytearray, memoryview, or mmap.mmap) are read
+    without copying.
+
+    Parameters
+    ----------
+    data : bytes-like
+        The bytes.
+
+    Returns
+    -------
+    binary : numpy.array
+        A binary array encoding the bytes, most significant bit first.
+    """
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+
+def encode_file(file):
+    """
+    Converts the contents of a file to a binary numpy array. The file is read
+    directly into the array (without decoding or copying it in Python).
+
+    Parameters
+    ----------
+    file : str or file object
+        Path to the file, '-' for the standard input, or a binary file object
+        (e.g., `sys.stdin.buffer`).
+
+    Returns
+    -------
+    binary : numpy.array
+        A binary array encoding the contents of the file.
+    """
+
+    if file == '-':
+        file = sys.stdin.buffer
+    if isinstance(file, (str, os.PathLike)):
+        return np.unpackbits(np.fromfile(file, dtype=np.uint8))
+    return encode_bytes(file.read())
+
+
+def parse_bits(instr):
+    """
+    Converts a string of the characters 0 and 1 (e.g., '0110') to a binary
+    numpy array.
+
+    Parameters
+    ----------
+    instr : str
+        The bits as a string.
+
+    Returns
+    -------
+    binary : numpy.array
+        A binary array of ones and zeros.
+    """
+
+    binary = np.frombuffer(instr.encode('ascii'), dtype=np.uint8) - ord('0')
+    if np.any(binary > 1):
+        raise ValueError(f'The bits must be given as 0s and 1s, but {instr!r} given.')
+    return binary
+
 
 def decode_string(inbin):
     """
@@ -46,11 +334,10 @@ def decode_string(inbin):
     Returns
     -------
     outstr : str
-        A UTF-8 encoded Python string.
+        The string, decoded from UTF-8 (invalid bytes, e.g., due to bit
+        errors, are replaced by U+FFFD).
     """
-    tmp = np.packbits(inbin)
-    outstr = "".join([chr(b) for b in tmp])
-    return outstr
+    return decode_bytes(inbin).decode('utf-8', errors='replace')
 
 
 def decode_bytes(inbin):
@@ -67,12 +354,11 @@ def decode_bytes(inbin):
     outbytes : bytes
         A bytes object.
     """
-    tmp = np.packbits(inbin)
-    outbytes = bytes(tmp)
-    return outbytes
+    return np.packbits(inbin).tobytes()
 
 
-def encode_baseband_signal(b, Tb, fs):
+@traced('encode_baseband')
+def encode_baseband_signal(b, Tb, fs, sync=(1, 0), constellation=BPSK, pulse=RECT):
     """
     Encodes a binary sequence into a baseband signal. In particular, generates 
     a discrete-time signal that encodes the binary signal `b` into pulses of 
@@ -87,121 +373,234 @@ def encode_baseband_signal(b, Tb, fs):
 
     where `Kb` is the pulse width in samples.
 
-    The function also prepends the bits [1, 0] (encoded as [-1, 1]) to the 
-    message. These bits are used as a known sequence of bits and used in the 
-    decoder (on the receiving side) to determine the time delay between the 
-    sender and receiver to synchronize the decoding process with the signal. 
+    The function also prepends the synchronization bits `sync` (by default 
+    [1, 0], encoded as [1, -1]) to the message. These bits are used as a 
+    known sequence of bits and used in the decoder (on the receiving side) to
+    determine the time delay between the sender and receiver to synchronize 
+    the decoding process with the signal. Longer sequences (e.g., 
+    `BARKER13`) give a more reliable synchronization at low SNR; the decoder
+    must be given the same sequence.
+
+    With a `constellation` other than `BPSK`, groups of 
+    `constellation.bits_per_symbol` bits of the message are mapped to one 
+    (complex) symbol each, which multiplies the bit rate at the same 
+    bandwidth; the synchronization bits are still sent as -1 and 1. The 
+    complex baseband signal is transmitted as `xb.real*sin(wc*t) + 
+    xb.imag*cos(wc*t)`, see `filtercache.LocalOscillator.modulate()`.
+
+    With the `RRC` pulse, the symbols are shaped by root-raised-cosine pulses
+    instead of rects, which confines the signal to the channel at shorter 
+    pulse widths (see `PulseShape`); the decoder must be given the same 
+    pulse.
 
     Parameters
     ----------
     b : numpy.array
-        A binary array of 1s and 0s encoding a message.
+        A binary array of 1s and 0s encoding a message. A 2-D array encodes 
+        one message per row (batch of messages of equal length).
     Tb : float
         Pulse width in seconds to encode the bits to.
     fs : float
         Sampling frequency in Hz.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits.
+    constellation : Constellation, default BPSK
+        The modulation of the message bits (see `CONSTELLATIONS`). The 
+        message is padded with zeros to a multiple of the bits per symbol.
+    pulse : PulseShape, default RECT
+        The pulse shape (see `PULSES`).
 
     Returns
     -------
     xb : numpy.array
-        Encoded baseband signal.
+        Encoded baseband signal (one signal per row for a batch), complex 
+        unless the constellation is real.
     """
 
-    # Prepend synchronization sequence and a trailing zero
-    b = np.concatenate(([1, 0], b))
+    if constellation is not BPSK or not pulse.rect:
+        b = np.asarray(b)
+        s = np.broadcast_to(_sync_symbols(sync), b.shape[:-1] + (len(sync),))
+        symbols = np.concatenate((s, constellation.map(b)), axis=-1)
+        if constellation.real:
+            symbols = symbols.real
+        return pulse.expand(symbols, int(np.floor(Tb*fs)))
+
+    # Prepend synchronization sequence
+    b = np.asarray(b)
+    sync = np.asarray(sync)
+    b = np.concatenate((np.broadcast_to(sync, b.shape[:-1] + sync.shape), b), axis=-1)
 
     # Encode bit values
     s = [-1, 1]
     b[b == 0] = s[0]
     b[b == 1] = s[1]
 
-    # Expand
+    # Expand and "lowpass filter": Filtering an impulse every Kb samples with
+    # a rect of length Kb is the same as repeating each value Kb times
     Kb = int(np.floor(Tb*fs))
-    Nx = b.shape[0]
-    xb = np.zeros(Nx*Kb)
-    xb[np.arange(0, Nx*Kb, Kb)] = b
-
-    # "Lowpass filtering"
-    b = np.ones(Kb)
-    xb = signal.lfilter(b, 1, xb)
+    xb = np.repeat(b.astype(float), Kb, axis=-1)
 
     return xb
 
-def decode_baseband_signal(xm, xp, Tb: float, fs: float):
+@traced('decode_baseband')
+def decode_baseband_signal(xm, xp, Tb: float, fs: float, sync=(1, 0), constellation=BPSK, pulse=RECT):
     """
     Decodes an IQ-demodulated baseband signal consisting of a magnitude signal
     `xm` and a phase signal `xp` into a binary bit sequence.
+
+    This is `decode_baseband_iq()` for the complex baseband signal 
+    `xm*exp(1j*xp)`; if the complex signal is available, pass it to 
+    `decode_baseband_iq()` directly. `xm` and `xp` are not modified.
+
+    Parameters
+    ----------
+    xm : numpy.array
+        The magnitude of the IQ-demodulated baseband signal.
+    xp : numpy.array
+        The phase of the IQ-demodulated baseband signal.
+    Tb : float
+        Pulse width in seconds to encode the bits to.
+    fs : float
+        Sampling frequency in Hz.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits, as given to `encode_baseband_signal()`.
+    constellation : Constellation, default BPSK
+        The modulation, as given to `encode_baseband_signal()`.
+    pulse : PulseShape, default RECT
+        The pulse shape, as given to `encode_baseband_signal()`.
+
+    Returns
+    -------
+    b : numpy.array
+        A binary array of 1s and 0s encoding a message (including the zero
+        padding to a multiple of the bits per symbol).
+    """
+    return decode_baseband_iq(xm*np.exp(1j*np.asarray(xp)), Tb, fs, sync, constellation, pulse)
+
+def decode_baseband_iq(yb, Tb: float, fs: float, sync=(1, 0), constellation=BPSK, pulse=RECT, track: bool=False, confidence: float=DETECTION_CONFIDENCE, noise_floor: bool=False):
+    """
+    Decodes an IQ-demodulated (complex) baseband signal `yb = I + jQ` into a 
+    binary bit sequence.
     
     The bit sequence is recovered by first determining the window of the 
-    transmission. This is achieved by averaging the magnitude signal over a 
+    transmission. This is achieved by averaging the power of the signal over a
     sliding window of the length of a symbol (`Tb`) (implemented using a filter
     with a rect of length `Tb` as the impulse response). Then, the average 
     is compared to a threshold, where the threshold is determined using the 
     tail probability of a chi-squared distribution (in essence, the test checks
-    whether there is a signal or only noise with a probability of 99 %).
+    whether there is a signal or only noise with a probability of 
+    `confidence`, 99 % by default). The quantile of the distribution is 
+    computed once per `Kb` and `confidence`, not per sample.
+
+    The test is relative to the variance of the whole signal, which is 
+    dominated by the transmission. It thus detects weak transmissions, but
+    flags noise as signal where there is no transmission. With 
+    `noise_floor`, the test is relative to the noise floor instead, which is
+    estimated from the signal-free symbols (see `_detect_noise_floor()`), 
+    for recordings that may hold no transmission, or one that (nearly) 
+    fills them.
 
-    Then, a filter with impulse response consisting of two pulses corresponding
-    to the mirrored synchronization sequence is used to find the first 
+    Then, a filter with impulse response consisting of pulses corresponding
+    to the mirrored synchronization sequence `sync` is used to find the first 
     occurence of this pulse sequence in the signal. This corresponds to 
-    correlating the signal with the synchronization sequence and is used to 
-    determine the time delay introduced by filters and the transmission itself
-    (i.e., to synchronize the data stream).
+    correlating the signal with the synchronization sequence (computed using
+    FFTs, and only up to the end of the synchronization sequence) and is used
+    to determine the time delay introduced by filters and the transmission 
+    itself (i.e., to synchronize the data stream).
     
-    Next, the (averaged) phases of the first two bits are used to find a 
-    complex representation of the symbols (which will be different from -1 and
-    1 due to the phase shift introduced the transmission and filtering).
+    Next, the averaged synchronization symbols are used to find a complex 
+    representation of the symbols (which will be different from -1 and 1 due
+    to the phase shift introduced the transmission and filtering).
+
+    Finally, the bit values are determined by the inner products of averages 
+    of length `Tb` of the signal's unit phasor `yb/|yb|` with the previously
+    recovered symbols.
+
+    For other constellations than `BPSK`, the averages are divided by the 
+    recovered symbol of the bit `1` (which removes the phase shift and, for
+    constellations that are not of constant modulus, where the magnitude is
+    averaged as well, scales them to the constellation), and the bits of the
+    nearest symbols are decided for all symbols at once.
+
+    For the `RRC` pulse, the averages are replaced by the matched filter of 
+    the pulse, applied to `yb`.
 
-    Finally, the whole phase signal is converted to a complex number with angle
-    corresponding to the phase shift and bit values are determined by comparing
-    averages of length `Tb` to the previously recovered symbols.
+    All of this is done in the complex domain: the phase of the signal is 
+    never computed (nor unwrapped), and there are no trigonometric functions
+    of the samples.
+
+    With `track`, the symbol instants and the recovered symbols are not kept
+    fixed after the synchronization but follow the symbol timing and the 
+    carrier phase (see `_Tracker`), in blocks of `_TRACK_BLOCK` symbols. This
+    keeps the lock over long transmissions despite clock mismatches between
+    the transmitter and the receiver and carrier-frequency offsets.
 
     Parameters
     ----------
-    xm : numpy.array
-        The magnitude of the IQ-demodulated baseband signal.
-    xp : numpy.array
-        The phase of the IQ-demodulated baseband signal.
+    yb : numpy.array
+        The IQ-demodulated baseband signal I + jQ.
     Tb : float
         Pulse width in seconds to encode the bits to.
     fs : float
         Sampling frequency in Hz.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits, as given to `encode_baseband_signal()`.
+    constellation : Constellation, default BPSK
+        The modulation, as given to `encode_baseband_signal()`.
+    pulse : PulseShape, default RECT
+        The pulse shape, as given to `encode_baseband_signal()`.
+    track : bool, default False
+        Track the symbol timing and the carrier phase.
+    confidence : float, default DETECTION_CONFIDENCE
+        Confidence of the detection test.
+    noise_floor : bool, default False
+        Detect the transmission relative to the estimated noise floor.
 
     Returns
     -------
     b : numpy.array
-        A binary array of 1s and 0s encoding a message.
+        A binary array of 1s and 0s encoding a message (including the zero
+        padding to a multiple of the bits per symbol).
     """
 
     # 1. Signal detection
+    # N.B: The rect filters (impulse response np.ones(Kb)) are implemented as
+    # moving sums, see _moving_sum().
+    yb = np.asarray(yb, dtype=complex)
     Kb = int(np.floor(Tb*fs))
-    hd = np.ones((Kb,))
-    xm2 = signal.lfilter(hd, 1, xm**2)
-    xm_var = np.var(xm)
-    xtest = chi2.cdf(xm2/xm_var, 2*Kb)
-    d = xtest > 0.99
-    m = np.argmax(d)
+    xm = np.abs(yb)
+    xm2 = _moving_sum(xm**2, Kb)
+    s = _sync_symbols(sync)
+    Nsync = s.shape[0]
+    if noise_floor:
+        d, m = _detect_noise_floor(xm2, Kb, Nsync, pulse)
+    else:
+        d = xm2/np.var(xm) > _chi2_quantiles(2*Kb, confidence)[-1]
+        m = np.argmax(d)
 
     # 2. Synchronization
-    # Synchronize using a matched filter. N.B: Expects the first to bits to be
-    # [1, 0] as prepended by encode_baseband_signal()
-    # NOTE: Remove unwrapping? by doing this in the complex domain as well.
-    # NOTE: Synchronization sequence is hardcoded here.
-    xpd = _unwrap(xp)
-    hb = 1/(2*Kb)*np.concatenate((-np.ones(Kb), np.ones(Kb)))
-    xd = np.sign(xpd)*d
-    xs = signal.lfilter(hb, 1, xd)
-    
-    # The peak of the synchronization sequence is within m+Nsynch*Kb. Hence, we
+    # Synchronize using a matched filter on the sign of the phase (see 
+    # _phase_sign()). N.B: Expects the first bits to be `sync` as prepended 
+    # by encode_baseband_signal()
+    # The peak of the synchronization sequence is within m+Nsync*Kb. Hence, we
     # can get an exact match within that window to get "perfect" 
-    # synchronization
-    # NOTE: "2" is hardcoded here, assumes two synchronization bits.
-    k0 = np.argmax(abs(xs[:m+2*Kb]))
-    xx = np.vstack((
-        1/Kb*signal.lfilter(hd, 1, np.cos(xp)),
-        1/Kb*signal.lfilter(hd, 1, np.sin(xp))
-    ))
-    b1 = xx[:, k0-Kb]
-    b0 = xx[:, k0]
+    # synchronization (and only need to filter up to there).
+    # Other pulses than rects are synchronized by correlating the output of 
+    # their matched filter with the synchronization symbols instead.
+    xx = pulse.average(_iq_components(yb, xm, constellation, pulse), Kb)
+    if pulse.rect:
+        from scipy import signal
+        xd = _phase_sign(yb[:m+Nsync*Kb])*d[:m+Nsync*Kb]
+        xs = signal.oaconvolve(xd, _sync_response(sync, Kb))[:xd.shape[0]]
+    else:
+        xs = _sync_correlation(xx[:, :m+Nsync*Kb], s, Kb)
+    k0 = np.argmax(abs(xs))
+
+    # The symbol of the bit `1` is the average over the synchronization 
+    # symbols (with the sign of the `0` symbols flipped), the last of which
+    # ends at k0
+    ks = k0 - Kb*np.arange(Nsync-1, -1, -1)
+    b1 = xx[:, ks]@s/Nsync
 
     # 3. Recover the bits
     # Calculate th projection of the complex number onto the symbol of the bit
@@ -210,39 +609,770 @@ def decode_baseband_signal(xm, xp, Tb: float, fs: float):
     # and zeros (the inner product is close to 1 if the bit is close to the 
     # symbol for `1`` or close to -1 if the bit is close to the symbol for 
     # `0`).
-    b = b1@xx[:, k0+Kb::Kb]
-    b = b[d[k0+Kb::Kb]] > 0
+    # The power of the symbols of constellations that are not of constant 
+    # modulus varies, and the weak ones may be missed by the detection: these
+    # are detected by their averages relative to the synchronization symbols
+    # instead. The power of other pulses than rects is spread over their 
+    # span: symbols count as detected if a signal was detected within the 
+    # delay of the pulse.
+    # The filters ringing after the end of the transmission are detected as
+    # well at high SNR (and always relative to the noise floor), and so are
+    # the tails of other pulses than rects: symbols then only count as 
+    # detected if their power is at least a quarter of that of the 
+    # synchronization symbols.
+    if not constellation.constant_modulus:
+        d = _symbols_detected(constellation, b1, xx)
+    else:
+        if not pulse.rect:
+            d = _dilate(d, pulse.delay(Kb))
+        d = d & (xm2 > np.mean(xm2[ks])/4)
+    if track:
+        b = _decode_tracked(xx, d, k0, b1, Kb, constellation)
+    elif constellation is BPSK:
+        b = b1@xx[:, k0+Kb::Kb]
+        b = b[d[k0+Kb::Kb]] > 0
+    else:
+        b = _decide(constellation, b1, xx[:, k0+Kb::Kb][:, d[k0+Kb::Kb]])
 
     return b
 
-def _unwrap(xp, alpha: float=np.pi/8):
+def _decode_tracked(xx, d, k0: int, b1, Kb: int, constellation):
     """
-    Unwraps the phase for binary phase-shift keying modulated signals.
+    Decides the bits of the symbols following the synchronization sequence 
+    (which ends at `k0`) with symbol-timing and carrier-phase tracking, 
+    `_TRACK_BLOCK` symbols at a time (see `decode_baseband_iq()`).
+    """
+
+    z = xx[0] + 1j*xx[1]
+    N = z.shape[-1]
+    tracker = _Tracker(constellation, b1, Kb)
+    b = []
+    k = k0 + Kb
+    while k < N:
+        ks = k + Kb*np.arange(min(_TRACK_BLOCK, (N - 1 - k)//Kb + 1))
+        bk, shift = tracker.step(z[ks], z[ks - Kb//2], z[ks - Kb], d[ks])
+        b.append(bk.reshape(ks.shape[0], -1)[d[ks]].ravel())
+        k = ks[-1] + Kb + int(shift)
+    return np.concatenate(b) if b else np.zeros((0,), dtype=bool)
+
+class BasebandDecoder:
+    """
+    Incremental (streaming) counterpart of `decode_baseband_iq()`.
+
+    The decoder is fed the IQ-demodulated (complex) baseband signal in blocks
+    of arbitrary length through `push_iq()` (or its magnitude and phase 
+    through `push()`), and 
+    returns the bits that were decided within each block. The rect filters, 
+    the synchronization (matched) filter, the noise variance estimate, and the
+    symbol clock carry their state from one block to the next. Hence, each 
+    call only processes the new samples, and the memory used by the decoder 
+    does not depend on how long the signal is.
+
+    Internally, the samples are processed in chunks of (at most) `Kb` samples
+    aligned to multiples of `Kb` since the first sample, so the decoded bits
+    do not depend on how the signal is split into blocks.
+
+    The detection, synchronization, and bit recovery steps are the same as in
+    `decode_baseband_iq()`, with the following differences:
+
+    * Instead of the variance of the whole signal, the detection uses a 
+      running estimate of the noise variance (the average of `abs(yb)**2` over 
+      samples without signal, exponentially forgetting with time constant 
+      `Tn`). Samples within one symbol of a detection are not used for the 
+      estimate, and no signal is detected until four symbols of noise have 
+      been observed (after skipping the first symbol and twice the `delay`
+      of the receiver filters, in which they settle).
+    * The detection relative to the noise picks up the leading tails of the
+      pulses and of the receiver filters (the pre-ringing of linear-phase 
+      ones), up to `pulse.delay(Kb) + delay` samples early. The 
+      synchronization filter is thus searched for its peak within 
+      `Nsync*Kb + pulse.delay(Kb) + delay` samples from the detection, which
+      may take in the first data symbols. Hence, a peak only counts if the
+      symbol before the synchronization sequence is silent, i.e., its power
+      above the noise is less than an eighth of that of the synchronization
+      symbols (less than that of any symbol of the constellations), and a
+      detection without such a peak is dropped.
+    * The decoder goes back to hunting for the next synchronization sequence
+      as soon as no signal is detected at a symbol instant (end of the
+      transmission), or the power over the symbol falls below a quarter of
+      that of the synchronization symbols (the receiver filters ringing
+      after the transmission). For constellations that are not of constant modulus,
+      the symbols are detected relative to the power of the synchronization
+      symbols instead, as in `decode_baseband_iq()`. The next transmission 
+      is only hunted for once no signal has been detected for a whole symbol
+      (after the delay of the matched filter), so that the tails of the
+      pulses and the ringing of the filters are not taken for one.
+    * Other pulses than rects delay the detection and synchronization by 
+      `pulse.delay(Kb)` samples, the delay of their matched filter.
+    * With `track`, the symbol timing and the carrier phase are tracked 
+      symbol by symbol (blocks of one symbol, see `_Tracker`).
 
     Parameters
     ----------
-    xp : numpy.array
-        Phase signal.
-    alpha : float, default: pi/8
-        Closeness threshold.
+    Tb : float
+        Pulse width in seconds to encode the bits to.
+    fs : float
+        Sampling frequency in Hz.
+    threshold : float, default 4.0
+        Detection threshold, the ratio between the average power over one 
+        symbol and the noise variance.
+    Tn : float, default 1.0
+        Time constant in seconds of the noise variance estimate.
+    sync : sequence of int, default (1, 0)
+        Synchronization bits, as given to `encode_baseband_signal()`.
+    constellation : Constellation, default BPSK
+        The modulation, as given to `encode_baseband_signal()`.
+    pulse : PulseShape, default RECT
+        The pulse shape, as given to `encode_baseband_signal()`.
+    track : bool, default False
+        Track the symbol timing and the carrier phase.
+    delay : int, default 0
+        Group delay in samples of the receiver filters (the `delay` of the 
+        front ends in stream.py and channelizer.py).
+    dtype : numpy.dtype, default 'float64'
+        Precision of the filters and of the decoder state; the baseband 
+        signal is converted to the corresponding complex type (complex64 
+        for float32).
+    """
+
+    def __init__(self, Tb: float, fs: float, threshold: float=4.0, Tn: float=1.0, sync=(1, 0), constellation=BPSK, pulse=RECT, track: bool=False, delay: int=0, dtype='float64'):
+        self.Kb = int(np.floor(Tb*fs))
+        self.constellation = constellation
+        self.pulse = pulse
+        self.track = track
+        self.delay = delay
+        self.dtype = np.dtype(dtype)
+        self._ctype = np.result_type(self.dtype, np.complex64)
+        self._h = (pulse.taps(self.Kb)/self.Kb).astype(self.dtype)
+        self.threshold = threshold
+        self.Tn = Tn
+        self._forget = 1 - 1/(Tn*fs)
+        self._s = _sync_symbols(sync).astype(self.dtype)
+        self._hs = _sync_response(sync, self.Kb).astype(self.dtype)
+        self._min_quiet = self.Kb + pulse.delay(self.Kb)
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the decoder to its initial state (as if no samples had been 
+        pushed).
+        """
+
+        Kb = self.Kb
+        Ns = self._hs.shape[0]
+
+        # Filter states: the last Kb inputs of the rect filters and the last 
+        # Nsync*Kb-1 inputs of the synchronization filter. And the history 
+        # of the averaged symbols, the detection signal, the power, and the
+        # power averaged over one symbol (needed to look back over the 
+        # synchronization sequence and the window it is searched in). The
+        # chunks (of at most Kb samples) are appended to them in place
+        self._xi = _History((3 if self.pulse.rect else 1,), Kb, Kb, self.dtype)
+        self._xdi = _History((), Ns-1, Kb, self.dtype)
+        self._hist = _History((5,), Ns + self.pulse.delay(Kb) + self.delay, Kb, self.dtype)
+
+        # For other pulses than rects, the last inputs of the matched filter
+        # and the delayed baseband signal
+        self._ci = _History((2,), self._h.shape[0]-1, Kb, self.dtype)
+        self._xr = _History((), self.pulse.delay(Kb), Kb, self._ctype)
+
+        # Noise variance estimate: weighted sum of the power over samples 
+        # without signal, and the sum of the weights
+        self._noise_sum = 0.0
+        self._noise_weight = 0.0
+
+        # Decoder state and symbol clock (absolute sample index of the next 
+        # symbol instant)
+        self._n = 0
+        self._state = 'idle'
+        self._quiet = self._min_quiet
+        self._window = 0
+        self._peak = 0.0
+        self._next = 0
+        self._b1 = None
+        self._p1 = 0.0
+        self._tracker = None
+
+    @property
+    def active(self):
+        """True while a transmission is being synchronized or decoded."""
+        return self._state != 'idle'
+
+    @property
+    def noise_variance(self):
+        """The current estimate of the noise variance (None until known)."""
+        if self._noise_weight < 4*self.Kb:
+            return None
+        return self._noise_sum/self._noise_weight
+
+    @property
+    def phase(self):
+        """
+        The symbol clock phase: the number of samples until the next symbol 
+        instant (None unless a transmission is being decoded).
+        """
+        if self._state != 'data':
+            return None
+        return self._next - self._n
+
+    def push(self, xm, xp):
+        """
+        Decodes the next block of the baseband signal, given by its magnitude
+        `xm` and phase `xp` (see `push_iq()`).
+        """
+        return self.push_iq(xm*np.exp(1j*np.asarray(xp)))
+
+    @traced('decoder')
+    def push_iq(self, yb):
+        """
+        Decodes the next block of the (complex) baseband signal.
+
+        Parameters
+        ----------
+        yb : numpy.array
+            The next block of the IQ-demodulated baseband signal I + jQ.
+
+        Returns
+        -------
+        b : numpy.array
+            The bits decided within the block (possibly none).
+        """
+
+        yb = np.asarray(yb, dtype=self._ctype)
+
+        # Split the block at multiples of Kb
+        Kb = self.Kb
+        N = yb.shape[0]
+        edges = np.arange(Kb - self._n % Kb, N, Kb)
+        edges = np.concatenate(([0], edges, [N]))
+        b = [
+            self._push_chunk(yb[k:l]) 
+            for k, l in zip(edges[:-1], edges[1:]) if l > k
+        ]
+
+        return np.concatenate(b) if b else np.zeros((0,), dtype=bool)
+
+    def _push_chunk(self, yb):
+        """
+        Decodes a chunk of at most `Kb` samples, see `push_iq()`.
+        """
+
+        from scipy import signal
+        Kb = self.Kb
+        N = yb.shape[0]
+        xm = np.abs(yb)
+
+        # 1. Signal detection
+        # Average the power and the symbols over one symbol and compare the
+        # average power to the noise variance. Other pulses than rects are 
+        # matched filtered by overlap-save, and the signal is delayed by the
+        # delay of the matched filter to stay aligned with it.
+        # The chunk is written into the histories of the filters, after the
+        # samples they keep from the previous chunks (see `_History`)
+        xc = _iq_components(yb, xm, self.constellation, self.pulse)
+        if not self.pulse.rect:
+            ci = self._ci.append(N)
+            ci[:, -N:] = xc
+            xc = signal.fftconvolve(ci, self._h[np.newaxis, :], mode='valid', axes=-1)
+            xr = self._xr.append(N)
+            xr[-N:] = yb
+            yb = xr[:N]
+            xm = np.abs(yb)
+        xi = self._xi.append(N)
+        xm2 = np.square(xm, out=xi[0, -N:])
+        if self.pulse.rect:
+            xi[1:, -N:] = xc
+        xx = _moving_sum(xi, Kb)[:, Kb:]/Kb
+        noise = self.noise_variance
+        if noise is None:
+            d = np.zeros(N, dtype=bool)
+        else:
+            d = xx[0] > self.threshold*noise
+
+        # 2. Synchronization filter (see decode_baseband_iq()), using 
+        # overlap-save: the valid part of the FFT convolution of the previous
+        # inputs and the chunk is kept (for other pulses than rects, the 
+        # correlation of the averaged symbols is computed from the history
+        # below)
+        if self.pulse.rect:
+            xd = self._xdi.append(N)
+            np.multiply(_phase_sign(yb), d, out=xd[-N:])
+            xs = signal.fftconvolve(xd, self._hs, mode='valid')
+
+        # Block index k is found at column k+H of the history, which gives 
+        # access to the symbols, detections, and power up to H samples back
+        # (over the window in which the synchronization filter is searched)
+        H = self._hist.H
+        hist = self._hist.append(N)
+        hist[:2, H:] = xx[1:] if self.pulse.rect else xc
+        hist[2, H:] = d
+        hist[3, H:] = xm2
+        hist[4, H:] = xx[0]
+        if not self.pulse.rect:
+            L = (self._s.shape[0] - 1)*Kb
+            xs = _sync_correlation(hist[:2, H-L:], self._s, Kb)[L:]
+
+        # Update the noise variance estimate with the samples of the previous
+        # chunk, if no signal was detected within one symbol after them (and 
+        # they are not within the first symbol, nor within twice the delay 
+        # of the receiver filters, which start from zeros)
+        nd = np.concatenate(([0], np.cumsum(hist[2])))
+        j = np.arange(N) + H - Kb
+        quiet = (nd[j+Kb+1] == nd[j]) & (self._n + j - H >= Kb + 2*self.delay)
+        Nq = np.count_nonzero(quiet)
+        decay = self._forget**Nq
+        self._noise_sum = decay*self._noise_sum + np.sum(hist[3, j[quiet]], dtype=float)
+        self._noise_weight = decay*self._noise_weight + Nq
+
+        # 3. Step through the states of the decoder
+        b = []
+        i = 0
+        while i < N:
+            if self._state == 'idle' and self._quiet < self._min_quiet:
+                # After a transmission, wait until no signal has been 
+                # detected for a whole symbol (after the delay of the
+                # matched filter): the tails of the pulses and the ringing
+                # of the receiver filters would be taken for the next one
+                last = np.maximum.accumulate(np.where(d[i:], np.arange(N-i), -1))
+                run = np.where(last < 0, self._quiet + np.arange(1, N-i+1), np.arange(N-i) - last)
+                j = np.argmax(run >= self._min_quiet)
+                if run[j] < self._min_quiet:
+                    self._quiet = run[-1]
+                    break
+                self._quiet = self._min_quiet
+                i += j + 1
+
+            elif self._state == 'idle':
+                # Hunt for the start of a transmission
+                m = i + np.argmax(d[i:])
+                if not d[m]:
+                    break
+                self._state = 'sync'
+                # (the leading tails of other pulses than rects and of the
+                # receiver filters may be detected up to their delays 
+                # earlier than the pulse)
+                self._window = self._hs.shape[0] + self.pulse.delay(Kb) + self.delay
+                self._peak = 0.0
+                i = m
+
+            elif self._state == 'sync':
+                # Find the peak of the synchronization filter within Nsync*Kb
+                # samples (plus the delays) from the detection, and the
+                # symbol of the bit `1` at the peak (see decode_baseband_iq()).
+                # Only peaks after a silent symbol count: the data symbols
+                # following the sequence may match it as well
+                end = min(N, i + self._window)
+                kk = np.arange(i, end)
+                ks = kk[:, np.newaxis] + H - Kb*np.arange(self._s.shape[0]-1, -1, -1)
+                p1 = np.mean(hist[4, ks], axis=-1)
+                valid = hist[4, ks[:, 0] - Kb] - noise < (p1 - noise)/8
+                xk = np.where(valid, abs(xs[i:end]), 0.0)
+                k = i + np.argmax(xk)
+                if xk[k-i] > self._peak:
+                    self._peak = xk[k-i]
+                    self._b1 = hist[:2, ks[k-i]]@self._s/self._s.shape[0]
+                    self._p1 = p1[k-i]
+                    self._next = self._n + k + Kb
+                self._window -= end - i
+                if self._window == 0 and self._peak == 0:
+                    # No synchronization sequence (e.g., a burst of noise)
+                    self._state = 'idle'
+                    self._quiet = 0
+                elif self._window == 0:
+                    self._state = 'data'
+                    if self.track:
+                        self._tracker = _Tracker(self.constellation, self._b1, Kb)
+                i = end
+
+            else:
+                # Recover the bits at every symbol instant, until no more
+                # signal is detected. The receiver filters ring after the end
+                # of the transmission, well above the noise at high SNR:
+                # symbols only count as detected if their power is at least
+                # a quarter of that of the synchronization symbols (as in 
+                # `decode_baseband_iq()` relative to the noise floor)
+                k = np.arange(self._next - self._n, N, Kb)
+                if self.constellation.constant_modulus:
+                    detected = (hist[2, k+H] > 0) & (hist[4, k+H] > self._p1/4)
+                else:
+                    detected = _symbols_detected(self.constellation, self._b1, hist[:2, k+H])
+                if np.all(detected):
+                    bk, shift = self._decide(hist, k+H)
+                    b.append(bk)
+                    if k.size > 0:
+                        self._next = self._n + k[-1] + Kb + shift
+                    break
+
+                # End of the transmission
+                j = np.argmin(detected)
+                b.append(self._decide(hist, k[:j]+H)[0])
+                self._state = 'idle'
+                self._quiet = 0
+                i = max(i, k[j] + 1)
+
+        self._n += N
+
+        return np.concatenate(b) if b else np.zeros((0,), dtype=bool)
+
+    def _decide(self, hist, k):
+        """
+        Decides the bits of the averaged symbols at the columns `k` of the 
+        history `hist` (see `_decide()`). Returns the bits and the number of
+        samples by which the next symbol instant is to be moved (by the 
+        tracking, if enabled).
+        """
+
+        xx = hist[:2, k]
+        if self._tracker is not None and k.size > 0:
+            z = hist[0] + 1j*hist[1]
+            Kb = self.Kb
+            b, shift = self._tracker.step(z[k], z[k - Kb//2], z[k - Kb], np.ones(k.shape, dtype=bool))
+            return b.ravel(), int(shift)
+        if self.constellation is BPSK:
+            return self._b1@xx > 0, 0
+        return _decide(self.constellation, self._b1, xx), 0
+
+class _History:
+    """
+    The last `H` samples of a signal (along the last axis), to which chunks
+    of at most `N` samples are appended in place: `append()` returns a view
+    of the last `H` samples followed by room for the chunk, which the caller
+    writes to. The samples are kept in a preallocated buffer of `2*(H+N)`
+    samples, and the last `H` are only moved back to its start once it is 
+    full (so once every `H+N` samples at least).
+    """
+
+    def __init__(self, shape, H: int, N: int, dtype='float64'):
+        self.H = H
+        self._buf = np.zeros(tuple(shape) + (2*(H + N),), dtype=dtype)
+        self._k = 0
+
+    def append(self, N: int):
+        """
+        Returns a view of the last `H` samples followed by the `N` samples of
+        the next chunk (to be written to `[..., H:]`).
+        """
+        H = self.H
+        if self._k + H + N > self._buf.shape[-1]:
+            self._buf[..., :H] = self._buf[..., self._k:self._k+H]
+            self._k = 0
+        x = self._buf[..., self._k:self._k+H+N]
+        self._k += N
+        return x
+
+def _weighted(constellation, pulse):
+    """
+    True if the symbols are averaged over the baseband signal weighted by its
+    magnitude, see `_iq_components()`.
+    """
+    return not (constellation.constant_modulus and pulse.rect)
+
+def _iq_components(yb, xm, constellation, pulse=RECT):
+    """
+    The real and imaginary parts of the baseband signal `yb` (of magnitude
+    `xm`) that are averaged over the symbols: those of the unit phasor 
+    yb/xm for constellations of constant modulus with rect pulses (only the
+    phase carries information), and of yb otherwise.
+    """
+
+    if not _weighted(constellation, pulse):
+        # exp(1j*angle(yb)), which is 1 where yb is 0
+        u = np.divide(yb, xm, out=np.ones(yb.shape, dtype=yb.dtype), where=xm > 0)
+        return np.stack((u.real, u.imag))
+    return np.stack((yb.real, yb.imag))
+
+def _phase_sign(yb, alpha: float=np.pi/8):
+    """
+    The sign of the phase of the baseband signal `yb` rotated by `alpha`,
+    i.e., of its imaginary part after the rotation: 1 for phases in 
+    (-alpha, pi-alpha) and -1 otherwise (which separates the phases of the
+    BPSK symbols around 0 and pi, with the boundaries rotated away from the
+    phases of the symbols). This replaces computing and unwrapping the phase.
+    """
+    # (Python floats, which keep the precision of yb)
+    c, s = float(np.cos(alpha)), float(np.sin(alpha))
+    return np.sign(yb.imag*c + yb.real*s)
+
+def _dilate(d, D: int):
+    """
+    True where `d` is True within `D` samples (along the last axis).
+    """
+    dp = np.concatenate((d, np.zeros(d.shape[:-1] + (D,), dtype=bool)), axis=-1)
+    return _moving_sum(dp.astype(float), 2*D+1)[..., D:] > 0.5
+
+def _symbols_detected(constellation, b1, xx):
+    """
+    Detection of the symbols averaged over the magnitude-weighted baseband
+    signal (see `_weighted()`): True where the power of the averaged symbols
+    `xx` exceeds half the power of the weakest symbol, relative to the 
+    symbol of the bit `1`, `b1`. The noise is mostly averaged out, so that
+    this also detects the end of the transmission.
+    """
+    floor = constellation.min_energy*np.sum(b1**2, axis=0)/2
+    return np.sum(xx**2, axis=0) > np.asarray(floor)[..., np.newaxis]
+
+def _decide(constellation, b1, xx):
+    """
+    Decides the bits of the averaged symbols `xx` (real and imaginary parts
+    in the rows, one message per row of those for a batch) given the symbol
+    of the bit `1`, `b1`, for all symbols at once.
+    """
+
+    z = (xx[0] + 1j*xx[1])/(b1[0] + 1j*b1[1])[..., np.newaxis]
+    return constellation.decide(z)
+
+class _Tracker:
+    """
+    Symbol-timing and carrier-phase tracking during the data symbols, for 
+    one message or a batch of messages (the leading axes of `b1`).
+
+    The symbols are processed in blocks (of any number of symbols, one 
+    message per row), each vectorized, and the loops are updated once per 
+    block:
+
+    * Carrier phase (decision-directed, second order): the averaged symbols 
+      are derotated by the symbol of the bit `1`, `b1`, and the tracked 
+      phase, which advances by the tracked frequency offset `omega` (in rad
+      per symbol) from symbol to symbol within the block. The mean phase 
+      error between the derotated symbols and their decisions corrects the
+      phase and the frequency offset.
+    * Symbol timing (Gardner): the error `Re{(z[k] - z[k-Kb])*conj(z[k-Kb/2])}`
+      (normalized by the power of `b1`) is about `4*tau/Kb` for a symbol 
+      transition sampled `tau` samples late, and zero without a transition,
+      independent of the carrier phase. The timing offset is accumulated 
+      and the following symbol instants are shifted by whole samples.
+
+    Parameters
+    ----------
+    constellation : Constellation
+        The modulation.
+    b1 : numpy.array
+        The symbol of the bit `1` (real and imaginary parts in the first 
+        axis), as recovered from the synchronization sequence.
+    Kb : int
+        Pulse width in samples.
+    timing_gain, phase_gain, frequency_gain : float
+        Loop gains per symbol (the corrections of a block are those of its
+        symbols combined).
+    """
+
+    def __init__(self, constellation, b1, Kb: int, timing_gain: float=0.25, phase_gain: float=0.2, frequency_gain: float=0.05):
+        self.constellation = constellation
+        self.Kb = Kb
+        self.timing_gain = timing_gain
+        self.phase_gain = phase_gain
+        self.frequency_gain = frequency_gain
+        self._b1 = b1[0] + 1j*b1[1]
+        self._power = np.abs(self._b1)**2
+        self.theta = np.zeros(self._b1.shape)
+        self.omega = np.zeros(self._b1.shape)
+        self._tau = np.zeros(self._b1.shape)
+
+    def step(self, z, z_half, z_prev, valid):
+        """
+        Decides a block of symbols and updates the loops.
+
+        Parameters
+        ----------
+        z : numpy.array
+            The averaged symbols at the symbol instants of the block (complex,
+            symbols along the last axis).
+        z_half, z_prev : numpy.array
+            The averaged symbols half a symbol and one symbol earlier.
+        valid : numpy.array
+            False for symbols that are not used to update the loops (e.g., 
+            where no signal was detected).
+
+        Returns
+        -------
+        b : numpy.array
+            The decided bits, `bits_per_symbol` per symbol along the last 
+            axis.
+        shift : numpy.array
+            The number of samples by which the next symbol instant is to be 
+            moved (integers).
+        """
+
+        B = z.shape[-1]
+        n = np.maximum(np.count_nonzero(valid, axis=-1), 1)
+
+        # Derotate (predicting the phase within the block), decide, and 
+        # update the phase and frequency by the mean phase error
+        phi = self.theta[..., np.newaxis] + self.omega[..., np.newaxis]*np.arange(1, B+1)
+        zr = z/(self._b1[..., np.newaxis]*np.exp(1j*phi))
+        i = self.constellation.nearest(zr)
+        e = np.sum(np.angle(zr*np.conj(self.constellation.points[i]))*valid, axis=-1)/n
+        self.theta = np.mod(phi[..., -1] + min(self.phase_gain*B, 1)*e + np.pi, 2*np.pi) - np.pi
+        self.omega = self.omega + self.frequency_gain*B*e
+
+        # Gardner timing error, sampling late if positive
+        et = np.sum(np.real((z - z_prev)*np.conj(z_half))*valid, axis=-1)/(n*self._power)
+        self._tau = self._tau - min(self.timing_gain*B, 1)*self.Kb/4*et
+        shift = np.round(self._tau).astype(int)
+        self._tau = self._tau - shift
+
+        b = self.constellation._labels[i].reshape(z.shape[:-1] + (-1,))
+        return b, shift
+
+def _moving_sum(x, K: int):
+    """
+    Moving sum over the last `K` samples along the last axis of `x` (for 
+    samples before the start, the signal is taken to be zero). 
+
+    This is the same as `signal.lfilter(np.ones(K), 1, x, axis=-1)` (up to 
+    rounding errors), but uses a cumulative sum, which costs O(1) instead of
+    O(K) operations per sample.
+
+    Parameters
+    ----------
+    x : numpy.array
+        Input signal(s).
+    K : int
+        Window length.
 
     Returns
     -------
-    xp : numpy.array
-        Unwrapped signal.
+    y : numpy.array
+        Moving sum.
+    """
+
+    y = np.cumsum(x, axis=-1)
+    y[..., K:] = y[..., K:] - y[..., :-K]
+    return y
+
+@functools.lru_cache(maxsize=None)
+def _chi2_quantiles(dof: int, confidence: float):
+    """
+    The `confidence` quantiles of the chi-squared distributions with 1 to 
+    `dof` degrees of freedom. Computed once per number of degrees of freedom
+    and confidence, instead of evaluating the distribution at every sample.
+    """
+    from scipy.stats import chi2
+    return chi2.ppf(confidence, np.arange(1, dof+1))
+
+def _noise_floor(xm2, Kb: int):
+    """
+    Estimates the noise floor from the power summed over one symbol, `xm2` 
+    (along the last axis, one estimate per signal), by minimum statistics.
+
+    Without signal, `xm2` is the mean noise power times a chi-squared random
+    variable over its degrees of freedom. These are 2 per independent 
+    complex sample, i.e., fewer than `2*Kb` since the receiver filters 
+    correlate the samples. The signal is split into segments of one symbol,
+    and the segments whose average power is at most twice the smallest one 
+    are taken to be signal free (the noise before and after the 
+    transmission). The mean and the degrees of freedom are estimated from 
+    the moments of `xm2` over these. This only needs a few symbols of the 
+    signal to be noise only, and does not depend on how strong the 
+    transmission is (unlike the variance of the whole signal).
+
+    Returns
+    -------
+    power : numpy.array
+        The mean of `xm2` without signal.
+    dof : numpy.array
+        Its degrees of freedom (integers from 1 to `2*Kb`).
     """
 
-    # Wrap +pi to -pi
-    dpi = np.pi-xp
-    iclose = (dpi < alpha) & (dpi > 0)
-    xp[iclose] = xp[iclose]-2*np.pi
+    x = xm2[..., Kb-1:]
+    L = min(Kb, x.shape[-1])
+    x = x[..., :x.shape[-1]//L*L].reshape(x.shape[:-1] + (-1, L))
+    p = np.mean(x, axis=-1)
+    w = (p <= 2*np.min(p, axis=-1, keepdims=True))[..., np.newaxis]
+    n = L*np.count_nonzero(w, axis=(-2, -1))
+    power = np.sum(x*w, axis=(-2, -1))/n
+    var = np.sum((x - power[..., np.newaxis, np.newaxis])**2*w, axis=(-2, -1))/n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dof = np.nan_to_num(np.rint(2*power**2/var), nan=2*Kb, posinf=2*Kb)
+    return power[..., np.newaxis], np.clip(dof, 1, 2*Kb).astype(int)[..., np.newaxis]
 
-    # Rotate by alpha to remove sign switches around 0 (but preserve curve)
-    xp = xp + alpha
+def _detection_threshold(power, dof, Kb: int, confidence: float):
+    """
+    Detection threshold for the power summed over one symbol: the 
+    `confidence` quantile of its distribution without signal, given by the 
+    noise floor `power` and the degrees of freedom `dof` (see 
+    `_noise_floor()`), so that noise exceeds it with probability 
+    `1 - confidence`.
+    """
+    return power*_chi2_quantiles(2*Kb, confidence)[dof-1]/dof
+
+def _detect_noise_floor(xm2, Kb: int, Nsync: int, pulse=RECT):
+    """
+    Signal detection relative to the noise floor (see `_noise_floor()`) on 
+    the power summed over one symbol, `xm2` (along the last axis, one 
+    detection per signal).
+
+    A transmission starts where the power stays above the threshold for a
+    whole symbol (so that a peak of the noise does not start it), and 
+    continues while it is above a lower threshold. Strong signals are thus
+    detected early on the rising edge of the filtered transmission (and of
+    the tails of other pulses than rects): the start is moved to where the 
+    power reaches half of its maximum over the synchronization symbols.
+
+    Returns
+    -------
+    d : numpy.array
+        True where a signal is detected.
+    m : numpy.array
+        The start of the (first) transmission.
+    """
 
-    return xp
+    N = xm2.shape[-1]
+    power, dof = _noise_floor(xm2, Kb)
+    d = xm2 > _detection_threshold(power, dof, Kb, _START_CONFIDENCE)
+    m = np.maximum(np.argmax(_moving_sum(d, Kb) == Kb, axis=-1) - Kb + 1, 0)
+    k = np.minimum(m[..., np.newaxis] + np.arange(Nsync*Kb + 2*pulse.delay(Kb)), N-1)
+    xm2s = np.take_along_axis(xm2, k, axis=-1)
+    m = m + np.argmax(xm2s > np.max(xm2s, axis=-1, keepdims=True)/2, axis=-1)
+    d = xm2 > _detection_threshold(power, dof, Kb, _HOLD_CONFIDENCE)
+    return d, m
 
-def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=0.25, dmax: float=5.0):
+def _sync_symbols(sync):
+    """
+    Symbols (1 for bits that are 1 and -1 for bits that are 0) of the 
+    synchronization sequence `sync`.
+    """
+    return 2*np.asarray(sync, dtype=float) - 1
+
+def _sync_correlation(xx, s, Kb: int):
+    """
+    Correlation of the averaged symbols `xx` (real and imaginary parts in 
+    the rows) with the synchronization symbols `s`, spaced `Kb` samples 
+    apart, along the last axis. The magnitude peaks where the last 
+    synchronization symbol is averaged.
+    """
+
+    z = xx[0] + 1j*xx[1]
+    N = z.shape[-1]
+    Ns = s.shape[0]
+    zp = np.concatenate((np.zeros(z.shape[:-1] + ((Ns-1)*Kb,), dtype=z.dtype), z), axis=-1)
+    return np.abs(sum(s[j]*zp[..., j*Kb:j*Kb+N] for j in range(Ns)))
+
+def _sync_response(sync, Kb: int):
+    """
+    Impulse response of the synchronization (matched) filter for the 
+    synchronization sequence `sync`: the mirrored pulses of the sequence, 
+    normalized to unit gain. For the default sequence [1, 0], this is 
+    `1/(2*Kb)*np.concatenate((-np.ones(Kb), np.ones(Kb)))`.
+
+    Parameters
+    ----------
+    sync : sequence of int
+        Synchronization bits.
+    Kb : int
+        Pulse width in samples.
+
+    Returns
+    -------
+    h : numpy.array
+        Impulse response of length `len(sync)*Kb`.
+    """
+
+    s = _sync_symbols(sync)
+    return np.repeat(s[::-1], Kb)/(s.shape[0]*Kb)
+
+@traced('channel')
+def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=0.25, dmax: float=5.0, rng=None):
     """
     Takes the modulated (discrete-time) signal `x` (generated at sampling 
     frequency `fs`) and simulates a wireless transmission through open space at
@@ -298,21 +1428,30 @@ def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=
     dmax : float, default 5.0
         The maximum transmission distance.
 
+    rng : numpy.random.Generator, optional
+        The random number generator to draw the distance, noise, and 
+        interference from. A new, randomly seeded generator is used if not 
+        given; pass a seeded generator for reproducible results.
+
     Returns
     -------
     y : numpy.array
         The signal received by the receiver.
     """
 
+    from scipy import signal
+
     # Get channel parameters
     if not (channel_id >= 1 and channel_id < _channels.shape[1]-1):
         raise ValueError(f'channel_id must be between 1 and {_channels.shape[1]}, but {channel_id} given.')
     channel = _channels[:, channel_id]
+    if rng is None:
+        rng = np.random.default_rng()
 
     # Create the channel impulse response: A Kronecker delta with amplitude 
     # exp(-eta*d) at sample m
     c = 340
-    d = dmax*np.random.rand(1)
+    d = dmax*rng.random()
     m = int(np.round(d/c*fs))
     h = np.zeros(m+1)
     h[m] = np.exp(-eta*d)
@@ -329,7 +1468,7 @@ def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=
     Pnoise = 10**((channel[2] - SNR)/10)*1e-3   # In-band noise power for given SNR
     sigma2 = Pnoise*fs/(4*fb)                   # White noise power for given SNR
     Nx = x.shape[0]
-    vn = np.sqrt(sigma2)*np.random.randn(Nx)
+    vn = np.sqrt(sigma2)*rng.standard_normal(Nx)
 
     # Add out-of-band interference at a random channel, uniformly distributed
     # outside the channel's frequency band taking aliasing into account (i.e.,
@@ -340,13 +1479,13 @@ def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=
     fcs = (_channels[0, :]+_channels[1, :])/2
     ichannels = (fcs <= 2*fc) & (fcs != fc)
     fcs = fcs[ichannels]
-    ichannel = np.random.randint(0, fcs.shape[0])
+    ichannel = rng.integers(0, fcs.shape[0])
     fi = fcs[ichannel]
 
     # Now, sample the interference amplitude with a mean of 1 (30 dBm) and 
     # a standard deviation of 0.2 (95 % between 0.6 and 1.4). Then add 
     # everything together to generate the interference signal
-    Ai = 1 + 0.2*np.random.rand(1)
+    Ai = 1 + 0.2*rng.random()
     k = np.arange(0, x.shape[0])
     vi = Ai*np.sin(2*np.pi*fi*k/fs)
 
@@ -354,3 +1493,157 @@ def simulate_channel(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=
     y = signal.lfilter(h, 1, x) + vn + vi
 
     return y
+
+@traced('channel_batch')
+def simulate_channel_batch(x, fs: float, channel_id: int, SNR: float=20.0, eta: float=0.25, dmax: float=5.0, rng=None, taps: int=1, spread: float=0.0, interferers: int=1, noise_color: float=0.0, cfo: float=0.0):
+    """
+    Batch version of `simulate_channel()`: Simulates the transmission of each
+    row of `x` (one independent trial per row) through the same channel 
+    model, with a random distance, noise, and out-of-channel interference 
+    drawn independently for every trial.
+
+    Unlike `simulate_channel()`, all received signals have the same length: 
+    the signals are zero-padded by the delay at the maximum distance `dmax` 
+    (rather than the delay of the drawn distance) plus 0.5 s.
+
+    Beyond the model of `simulate_channel()` (which is the default), the 
+    channel can be made harsher:
+
+    * Multipath: `taps-1` echoes follow the direct path, with delays drawn 
+      uniformly within `spread` seconds after it and Gaussian gains whose 
+      standard deviation decays exponentially with the delay (relative to the
+      direct path). The signals are filtered with these impulse responses by
+      FFT convolution.
+    * Several (`interferers`) out-of-channel interferers per trial.
+    * Colored noise with a power spectral density proportional to 
+      1/f^`noise_color` (0 is white, 1 pink, 2 brown noise), scaled to the 
+      same power in the channel as the white noise.
+    * A carrier-frequency offset (e.g., a Doppler shift), drawn uniformly 
+      from [-`cfo`, `cfo`] Hz per trial, applied by shifting the spectrum of
+      the received (analytic) signal.
+
+    All random quantities are drawn in bulk from `rng`, for all trials at 
+    once.
+
+    Parameters
+    ----------
+    x : numpy.array
+        The modulated signals to be transmitted, one per row.
+
+    fs : float
+        Sampling frequency.
+
+    channel_id : int
+        The id of the communication channel.
+
+    SNR : float, default 20.0
+        The signal-to-noise ratio at the transmitter (in dBm).
+
+    eta : float, default 0.25
+        Fading coefficient.
+
+    dmax : float, default 5.0
+        The maximum transmission distance.
+
+    rng : numpy.random.Generator, optional
+        The random number generator to draw from. A new, randomly seeded 
+        generator is used if not given.
+
+    taps : int, default 1
+        Number of propagation paths (1 is the direct path only).
+
+    spread : float, default 0.0
+        Maximum delay of the echoes after the direct path in seconds.
+
+    interferers : int, default 1
+        Number of out-of-channel interferers.
+
+    noise_color : float, default 0.0
+        Exponent of the noise's power spectral density 1/f^`noise_color`.
+
+    cfo : float, default 0.0
+        Maximum carrier-frequency offset in Hz.
+
+    Returns
+    -------
+    y : numpy.array
+        The signals received by the receiver, one per row.
+    """
+
+    from scipy import signal
+
+    # Get channel parameters
+    if not (channel_id >= 1 and channel_id < _channels.shape[1]-1):
+        raise ValueError(f'channel_id must be between 1 and {_channels.shape[1]}, but {channel_id} given.')
+    channel = _channels[:, channel_id]
+    if rng is None:
+        rng = np.random.default_rng()
+
+    x = np.atleast_2d(x)
+    Ntrials, Nx = x.shape
+    rows = np.arange(Ntrials)[:, np.newaxis]
+
+    # Draw the random quantities of all trials at once (distances, noise, 
+    # and interference as for the default model first, so that a single 
+    # trial at dmax=0, with the signal as long as in simulate_channel(), is
+    # reproduced for a given seed)
+    c = 340
+    d = dmax*rng.random(Ntrials)
+    m = np.round(d/c*fs).astype(int)
+    Nbuf = int(np.round(0.5*fs))
+    Ns = int(np.round(spread*fs))
+    Ny = Nx + int(np.round(dmax/c*fs)) + Ns + Nbuf
+    vn = rng.standard_normal((Ntrials, Ny))
+
+    fc = (channel[0]+channel[1])/2
+    fcs = (_channels[0, :]+_channels[1, :])/2
+    ichannels = (fcs <= 2*fc) & (fcs != fc)
+    fcs = fcs[ichannels]
+    fi = fcs[rng.integers(0, fcs.shape[0], (Ntrials, interferers))]
+    Ai = 1 + 0.2*rng.random((Ntrials, interferers))
+
+    me = rng.integers(1, Ns+1, (Ntrials, taps-1)) if Ns > 0 else np.zeros((Ntrials, 0), dtype=int)
+    ge = rng.standard_normal((Ntrials, me.shape[1]))*np.exp(-me/max(Ns, 1))
+    df = cfo*(2*rng.random(Ntrials) - 1)
+
+    # Attenuation, delay, and multipath
+    A = np.exp(-eta*d)
+    y = np.zeros((Ntrials, Ny))
+    if me.shape[1] == 0:
+        # Direct path only: the delayed signals are written into zero-padded
+        # rows, which is the same as filtering with the delta impulse
+        # responses
+        y[rows, m[:, np.newaxis] + np.arange(Nx)] = A[:, np.newaxis]*x
+    else:
+        # Impulse responses of all trials (direct path and echoes), applied
+        # by FFT convolution
+        h = np.zeros((Ntrials, m.max() + Ns + 1))
+        h[np.arange(Ntrials), m] = A
+        np.add.at(h, (rows, m[:, np.newaxis] + me), A[:, np.newaxis]*ge)
+        yh = signal.fftconvolve(x, h, axes=-1)
+        y[:, :yh.shape[1]] = yh
+
+    # Carrier-frequency offset: shift the spectrum of the analytic signal
+    if cfo:
+        k = np.arange(0, Ny)
+        y = np.real(signal.hilbert(y, axis=-1)*np.exp(2j*np.pi*df[:, np.newaxis]*k/fs))
+
+    # Noise (see simulate_channel()), shaped in the frequency domain if 
+    # colored, keeping the noise power density at the carrier
+    fb = (channel[1] - channel[0])/2
+    Pnoise = 10**((channel[2] - SNR)/10)*1e-3
+    sigma2 = Pnoise*fs/(4*fb)
+    if noise_color:
+        f = np.fft.rfftfreq(Ny, 1/fs)
+        shape = np.zeros(f.shape)
+        shape[1:] = (f[1:]/fc)**(-noise_color/2)
+        vn = np.fft.irfft(np.fft.rfft(vn, axis=-1)*shape, Ny, axis=-1)
+    y += np.sqrt(sigma2)*vn
+
+    # Out-of-band interference at random channels per trial (see 
+    # simulate_channel())
+    k = np.arange(0, Ny)
+    for i in range(interferers):
+        y += Ai[:, i, np.newaxis]*np.sin(2*np.pi*fi[:, i, np.newaxis]*k/fs)
+
+    return y